@@ -1,44 +1,291 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, simpledialog
-import sqlite3
-from datetime import datetime, timedelta
-import csv
-import sys
-import os
+from tkinter import ttk, filedialog, messagebox
 from datetime import datetime
+import os
+import argparse
+import sqlite3
+import tempfile
+import time
+
+import inventory_db
+import inventory_diagnostics
+import inventory_export
+import inventory_forecast
+import inventory_import
+import inventory_reports
+import inventory_service
+import inventory_view
+import inventory_worker
+from inventory_worker import JobCancelled
+
+# Characters of report text shown per page in the Reports tab
+REPORT_PAGE_CHARS = 256 * 1024
+# Bulk edits and deletes that can be undone, most recent last
+UNDO_LIMIT = 20
+# Client mode: how often to ask the service whether others changed anything
+CHANGE_POLL_MS = 2000
+
+# Job functions run on the database worker thread with the worker's own
+# connection; they must not touch Tk widgets, only report through the job.
+
+class _ReportSpool:
+    # Report pages written to a spool file. Page offsets go back to the UI as
+    # they are written, with the first page's text so it shows straight away;
+    # other pages are read back from the file when viewed.
+
+    def __init__(self, job, spool):
+        self.job = job
+        self.spool = spool
+        self.offset = 0
+        self.pages = 0
+        self.pending = ""
+
+    def add_page(self, page):
+        self.job.check()
+        data = page.encode('utf-8')
+        self.spool.write(data)
+        self.spool.flush()
+        self.job.report(message=f"Report: {self.pages + 1} pages", data=(self.offset, len(data), page if not self.pages else None))
+        self.offset += len(data)
+        self.pages += 1
+
+    def write(self, text):
+        # Text streamed in pieces of any size, cut into pages on line boundaries
+        self.pending += text
+        while len(self.pending) >= REPORT_PAGE_CHARS:
+            cut = self.pending.rfind("\n", 0, REPORT_PAGE_CHARS) + 1 or REPORT_PAGE_CHARS
+            self.add_page(self.pending[:cut])
+            self.pending = self.pending[cut:]
+        self.job.check()
+
+    def close(self):
+        if self.pending:
+            self.add_page(self.pending)
+            self.pending = ""
+
+
+def spool_report(conn, job, spool_path, report_type, options):
+    # Renders the report page by page into a spool file. Returns the spool
+    # size and the report's chart, if it has one.
+    report = inventory_reports.build_report(conn, report_type, **options)
+    with open(spool_path, 'wb') as file:
+        spool = _ReportSpool(job, file)
+        for page in inventory_reports.render_text(report, REPORT_PAGE_CHARS):
+            spool.add_page(page)
+    return spool.offset, report.chart
+
+
+def save_report(conn, job, file_path, report_type, options):
+    inventory_reports.write_report(conn, file_path, report_type, **options)
+
+
+# Client mode: the same jobs with an inventory_service.InventoryClient for conn
+
+def spool_service_report(client, job, spool_path, report_type, options):
+    # The service renders the text report; it is spooled as it streams in.
+    # The forecast chart is drawn from the service's forecast cube.
+    with open(spool_path, 'wb') as file:
+        spool = _ReportSpool(job, file)
+        client.write_report(spool, report_type, **options)
+        spool.close()
+    chart = None
+    if report_type == "forecast":
+        result = inventory_forecast.forecast(inventory_forecast.frame_from_rows(client.forecast_rows()), options["months"])
+        chart = inventory_reports.forecast_chart(result)
+    return spool.offset, chart
+
+
+def save_service_report(client, job, file_path, report_type, options):
+    fmt = inventory_reports.report_format(file_path)
+    with open(file_path, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as file:
+        client.write_report(file, report_type, fmt, **options)
+
+
+def service_version(client, job):
+    return client.version()
+
+
+def import_file(conn, job, file_path, batch_size):
+    def progress(stats):
+        job.rows = stats.rows_read
+        job.report(stats.fraction_done, f"Importing: {stats.rows_read:,} rows ({stats.rows_per_second:,.0f} rows/s)")
+        # Stops the import after the current batch
+        return not job.cancelled
+
+    return inventory_import.import_csv(conn, file_path, batch_size, progress=progress)
+
+
+def export_file(conn, job, file_path, options):
+    def progress(written, total):
+        # Raising JobCancelled here makes the export remove its partial file
+        job.check()
+        job.rows = written
+        job.report(written / max(total, 1), f"Exporting: {written:,} of {total:,} rows")
+
+    return inventory_export.export(conn, file_path, progress=progress, **options)
+
+
+def _bulk_progress(job, verb):
+    def progress(done, total):
+        # Raising JobCancelled here rolls the whole batch back
+        job.check()
+        job.rows = done
+        job.report(done / max(total, 1), f"{verb}: {done:,} of {total:,} rows")
+    return progress
+
+
+def bulk_edit(conn, job, ids, fields):
+    return inventory_db.bulk_update(conn, ids, fields, _bulk_progress(job, "Updating"))
+
+
+def bulk_delete(conn, job, ids):
+    return inventory_db.bulk_delete(conn, ids, _bulk_progress(job, "Deleting"))
+
+
+def undo_bulk(conn, job, change):
+    return change, inventory_db.undo_bulk_change(conn, change, _bulk_progress(job, "Undoing"))
+
+
+# Client mode: single-row requests to the service. The worker's "connection"
+# is then the InventoryClient.
+
+def service_row(client, job, row_id):
+    try:
+        return client.row(row_id)
+    except KeyError:
+        return None
+
+
+def service_add(client, job, record):
+    return client.add(record)
+
+
+def service_update(client, job, row_id, record):
+    client.update(row_id, record)
+
+
+def service_delete(client, job, row_id):
+    try:
+        client.delete(row_id)
+    except KeyError:
+        # Already deleted from another window
+        pass
 
 class FireExtinguisherApp:
-    def __init__(self, master, initial_csv=None):
+    def __init__(self, master, initial_csv=None, db_path=inventory_db.DEFAULT_DB_PATH, server=None):
         self.master = master
         self.master.title("Fire Extinguisher Inventory")
         self.master.geometry("800x600")
-
-        # Create in-memory database
-        self.conn = sqlite3.connect(':memory:')
-        self.create_table()
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Open (or create) the persistent database; pass inventory_db.MEMORY for a throwaway one.
+        # An in-memory database is opened by name so the worker thread can share it.
+        if db_path == inventory_db.MEMORY:
+            db_path = inventory_db.shared_memory_path()
+        self.db_path = db_path
+        # Every statement on the app's and the worker's connections is timed
+        self.diagnostics = inventory_diagnostics.Diagnostics()
+        # Given a server URL the app runs in client mode: every read and
+        # write goes to an inventory service (inventory_service.py) shared
+        # with other windows, and there is no local database. Imports,
+        # exports and bulk changes need one, so they are not offered.
+        self.client = inventory_service.InventoryClient(server) if server else None
+        if self.client:
+            self.master.title(f"Fire Extinguisher Inventory ({server})")
+            self.conn = None
+            self.lookups = inventory_service.ServiceLookups(self.client)
+            connect = lambda path: self.client
+        else:
+            self.conn = inventory_diagnostics.connect(db_path, self.diagnostics)
+            self.create_table()
+            # Buildings, types, suppliers and weights for the dropdowns
+            self.lookups = inventory_db.LookupCache(self.conn)
+            connect = lambda path: inventory_diagnostics.connect(path, self.diagnostics)
+
+        # Rows per batch in CSV imports; each batch commits on its own unless
+        # the database was empty
+        self.import_batch_size = inventory_import.DEFAULT_BATCH_SIZE
+
+        # Reports, imports and exports run here so the UI never blocks on them
+        self.worker = inventory_worker.DatabaseWorker(self.master, self.db_path, connect=connect)
+        self.worker.on_idle = self.on_worker_idle
 
         self.setup_ui()
 
+        # Client mode: others' changes are picked up by watching the
+        # service's version
+        self.service_version = None
+        self.change_poll_id = self.master.after(CHANGE_POLL_MS, self.check_for_changes) if self.client else None
+
         # Load initial CSV if provided
         if initial_csv:
             self.import_csv(initial_csv)
 
     def create_table(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS extinguishers (
-                id INTEGER PRIMARY KEY,
-                building TEXT,
-                room TEXT,
-                type TEXT,
-                weight REAL,
-                date_refilled TEXT,
-                date_expiration TEXT,
-                supplier TEXT,
-                notes TEXT
-            )
-        ''')
-        self.conn.commit()
+        # Brings older database files up to the current schema; no-op when already current
+        inventory_db.migrate(self.conn)
+
+    def lookup_combobox(self, parent, column, extra=(), **options):
+        # A Combobox offering every known value of column. The list is taken
+        # from the lookup cache again each time it drops down, so values added
+        # since the dialog opened (e.g. by an import) are offered too.
+        widget = ttk.Combobox(parent, values=list(extra) + self.lookups.values(column), **options)
+        widget.configure(postcommand=lambda: widget.configure(values=list(extra) + self.lookups.values(column)))
+        return widget
+
+    def close(self):
+        if self.change_poll_id:
+            self.master.after_cancel(self.change_poll_id)
+        self.worker.stop()
+        self.remove_report_spool()
+        if self.conn:
+            inventory_db.close(self.conn)
+        self.master.destroy()
+
+    def show_busy(self, error, parent=None):
+        # A single-row write timed out waiting for another writer, e.g. an
+        # import into an empty database, which commits only when it finishes.
+        # The write's transaction is still open and would pin an old snapshot.
+        if self.conn.in_transaction:
+            self.conn.rollback()
+        messagebox.showerror("Database Busy", f"The change was not saved ({error}). "
+                             "Try again once the other operation, e.g. an import, has finished.", parent=parent)
+
+    def service_call(self, func, *args, description, on_done, on_error=None):
+        # Client mode: a request runs on the worker, so a slow or unreachable
+        # service never freezes the window. on_error(error) returns True if
+        # it dealt with the error; anything else is shown.
+        def done(result):
+            self.status_var.set(f"{description} done")
+            on_done(result)
+
+        def failed(error):
+            self.status_var.set(f"{description} failed")
+            if not (on_error and on_error(error)):
+                messagebox.showerror(f"{description} Error", f"An error occurred: {error}")
+
+        self.status_var.set(f"{description}...")
+        return self.worker.submit(func, *args, description=description, on_done=done, on_error=failed)
+
+    def local_only(self, what):
+        # True, after saying so, when what needs the local database
+        if self.client:
+            messagebox.showinfo("Not Available", f"{what} works on a local database and is not available in client mode.")
+            return True
+        return False
+
+    def check_for_changes(self):
+        # Skipped while a long job runs rather than queued behind it
+        if not self.worker.busy:
+            self.worker.submit(service_version, description="Check for changes", on_done=self.on_service_version,
+                               on_error=lambda error: self.status_var.set(f"Inventory service unavailable: {error}"))
+        self.change_poll_id = self.master.after(CHANGE_POLL_MS, self.check_for_changes)
+
+    def on_service_version(self, version):
+        if self.service_version is not None and version != self.service_version:
+            # Applied as a diff against the rows on screen
+            self.inventory_view.reload()
+        self.service_version = version
 
     def setup_ui(self):
         self.notebook = ttk.Notebook(self.master)
@@ -48,12 +295,42 @@ class FireExtinguisherApp:
         inventory_frame = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(inventory_frame, text="Inventory")
 
-        # Treeview for inventory
-        self.tree = ttk.Treeview(inventory_frame, columns=("ID", "Building", "Room", "Type", "Weight", "Date Refilled", "Expiration Date", "Supplier", "Notes"), show="headings")
-        for col in self.tree["columns"]:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=100)
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        # Full-text search over building, room, supplier and notes; results
+        # update shortly after typing stops
+        search_frame = ttk.Frame(inventory_frame)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=(5, 2))
+        self.search_var = tk.StringVar()
+        self.search_after_id = None
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=40)
+        search_entry.pack(side=tk.LEFT)
+        search_entry.bind("<KeyRelease>", lambda e: self.schedule_search())
+        search_entry.bind("<Return>", lambda e: self.apply_search())
+        search_entry.bind("<Escape>", lambda e: self.clear_search())
+
+        # Filter bar, applied in SQL by the pager
+        filter_frame = ttk.Frame(inventory_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        self.filter_vars = {}
+        for column, label in (("building", "Building:"), ("type", "Type:"), ("supplier", "Supplier:"),
+                              ("room", "Room starts with:")):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT, padx=(5, 2))
+            var = tk.StringVar()
+            if column not in inventory_db.LOOKUP_TABLES:
+                widget = ttk.Entry(filter_frame, textvariable=var, width=12)
+            else:
+                widget = self.lookup_combobox(filter_frame, column, extra=[""], textvariable=var, width=12)
+                widget.bind("<<ComboboxSelected>>", lambda e: self.apply_filters())
+            widget.bind("<Return>", lambda e: self.apply_filters())
+            widget.pack(side=tk.LEFT)
+            self.filter_vars[column] = var
+        ttk.Button(filter_frame, text="Filter", command=self.apply_filters).pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="Clear", command=self.clear_filters).pack(side=tk.LEFT)
+
+        # Virtualized Treeview for inventory: holds only the rows on screen
+        self.pager = inventory_service.ServicePager(self.client) if self.client else inventory_db.InventoryPager(self.conn)
+        self.inventory_view = inventory_view.VirtualInventoryView(inventory_frame, self.pager, diagnostics=self.diagnostics)
+        self.tree = self.inventory_view.tree
 
         # Buttons for add, edit, delete
         button_frame = ttk.Frame(inventory_frame)
@@ -61,6 +338,17 @@ class FireExtinguisherApp:
         ttk.Button(button_frame, text="Add", command=self.add_extinguisher).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Edit", command=self.edit_extinguisher).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Delete", command=self.delete_extinguisher).pack(side=tk.LEFT, padx=5)
+        # Bulk changes act on the selected rows or on every row the filters and
+        # search show, each as one transaction that can be undone
+        local_state = tk.DISABLED if self.client else tk.NORMAL
+        ttk.Button(button_frame, text="Bulk Edit...", command=self.show_bulk_edit_dialog,
+                   state=local_state).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Bulk Delete...", command=self.show_bulk_delete_dialog,
+                   state=local_state).pack(side=tk.LEFT, padx=5)
+        self.undo_stack = []
+        self.undo_button = ttk.Button(button_frame, text="Undo", command=self.undo_bulk_change, state=tk.DISABLED)
+        self.undo_button.pack(side=tk.LEFT, padx=5)
+        self.tree.bind("<Control-z>", lambda e: self.undo_bulk_change())
 
         # Reports tab
         reports_frame = ttk.Frame(self.notebook, padding="10")
@@ -70,36 +358,171 @@ class FireExtinguisherApp:
         report_buttons_frame.pack(fill=tk.X, pady=10)
 
         ttk.Button(report_buttons_frame, text="Generate Full Report", command=lambda: self.generate_report("full")).pack(side=tk.LEFT, padx=5)
-        ttk.Button(report_buttons_frame, text="Expiring Soon Report", command=lambda: self.generate_report("expiring")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(report_buttons_frame, text="Expiring Soon Report", command=self.show_expiring_dialog).pack(side=tk.LEFT, padx=5)
         ttk.Button(report_buttons_frame, text="Tally Report", command=self.show_tally_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(report_buttons_frame, text="Forecast Report", command=self.show_forecast_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(report_buttons_frame, text="Save Report As...", command=self.save_report).pack(side=tk.LEFT, padx=5)
+
+        # Long reports are shown a page at a time
+        report_nav_frame = ttk.Frame(reports_frame)
+        report_nav_frame.pack(fill=tk.X)
+        ttk.Button(report_nav_frame, text="< Prev", command=lambda: self.show_report_page(self.report_page - 1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(report_nav_frame, text="Next >", command=lambda: self.show_report_page(self.report_page + 1)).pack(side=tk.LEFT, padx=5)
+        self.report_page_var = tk.StringVar()
+        ttk.Label(report_nav_frame, textvariable=self.report_page_var).pack(side=tk.LEFT, padx=5)
+        self.report_pages = []
+        self.report_page = 0
+        self.report_spool = None
+        self.report_job = None
+        self.last_report = None
 
         self.report_text = tk.Text(reports_frame, wrap=tk.WORD, width=80, height=20)
         self.report_text.pack(fill=tk.BOTH, expand=True)
+        # Bar chart above the text for reports that have one; hidden otherwise
+        self.report_chart = tk.Canvas(reports_frame, height=180, background="white", highlightthickness=0)
+        self.report_chart.bind("<Configure>", lambda e: self.draw_report_chart())
+        self.report_chart_data = None
 
         scrollbar = ttk.Scrollbar(reports_frame, orient=tk.VERTICAL, command=self.report_text.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.report_text.configure(yscrollcommand=scrollbar.set)
 
+        self.setup_diagnostics_tab()
+
         # Import/Export buttons
         import_export_frame = ttk.Frame(self.master)
         import_export_frame.pack(fill=tk.X, pady=10)
 
-        ttk.Button(import_export_frame, text="Import CSV", command=self.import_csv).pack(side=tk.LEFT, padx=5)
-        ttk.Button(import_export_frame, text="Export CSV", command=self.export_csv).pack(side=tk.LEFT, padx=5)
+        ttk.Button(import_export_frame, text="Import CSV", command=self.import_csv,
+                   state=local_state).pack(side=tk.LEFT, padx=5)
+        ttk.Button(import_export_frame, text="Export...", command=self.show_export_dialog,
+                   state=local_state).pack(side=tk.LEFT, padx=5)
+
+        # Progress of long-running operations
+        self.progress_var = tk.DoubleVar()
+        self.status_var = tk.StringVar()
+        ttk.Progressbar(import_export_frame, variable=self.progress_var, maximum=1.0, length=150).pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(import_export_frame, text="Cancel", command=self.worker.cancel_all, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        ttk.Label(import_export_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=5)
 
         # Refresh inventory display
         self.refresh_inventory()
 
-    def refresh_inventory(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def setup_diagnostics_tab(self):
+        # Where the time goes: UI operations, SQL statements and slow queries
+        diagnostics_frame = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(diagnostics_frame, text="Diagnostics")
+
+        controls = ttk.Frame(diagnostics_frame)
+        controls.pack(fill=tk.X)
+        ttk.Button(controls, text="Refresh", command=self.refresh_diagnostics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Reset", command=self.reset_diagnostics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Export JSON...", command=self.export_diagnostics).pack(side=tk.LEFT, padx=5)
+        ttk.Label(controls, text="Slow query threshold (ms):").pack(side=tk.LEFT, padx=(15, 2))
+        self.slow_ms_var = tk.StringVar(value=f"{self.diagnostics.slow_ms:g}")
+        slow_entry = ttk.Entry(controls, textvariable=self.slow_ms_var, width=8)
+        slow_entry.pack(side=tk.LEFT)
+        slow_entry.bind("<Return>", lambda e: self.set_slow_threshold())
+        ttk.Button(controls, text="Apply", command=self.set_slow_threshold).pack(side=tk.LEFT, padx=5)
+
+        self.database_var = tk.StringVar()
+        ttk.Label(diagnostics_frame, textvariable=self.database_var).pack(fill=tk.X, pady=5)
+
+        self.diagnostics_trees = {}
+        for key, title, columns in (
+                ("operations", "Operations", ("name", "count", "total_ms", "avg_ms", "max_ms", "last_ms", "rows")),
+                ("statements", "SQL statements (by total time)", ("sql", "count", "total_ms", "avg_ms", "max_ms", "rows")),
+                ("slow_queries", "Slow queries", ("time", "ms", "rows", "thread", "sql"))):
+            ttk.Label(diagnostics_frame, text=title).pack(anchor="w", pady=(5, 0))
+            tree = ttk.Treeview(diagnostics_frame, columns=columns, show="headings", height=6)
+            for column in columns:
+                tree.heading(column, text=column.replace("_", " ").title().replace(" Ms", " (ms)"))
+                tree.column(column, width=400 if column == "sql" else 80, stretch=column in ("sql", "name"))
+            tree.pack(fill=tk.BOTH, expand=True)
+            self.diagnostics_trees[key] = tree
+
+        self.notebook.bind("<<NotebookTabChanged>>", lambda e: self.on_tab_changed(diagnostics_frame))
+
+    def on_tab_changed(self, diagnostics_frame):
+        if self.notebook.select() == str(diagnostics_frame):
+            self.refresh_diagnostics()
+
+    def database_summary(self):
+        # The service's database in client mode
+        if self.client:
+            return self.client.diagnostics()
+        return inventory_diagnostics.database_summary(self.conn, self.db_path)
+
+    def refresh_diagnostics(self):
+        summary = self.database_summary()
+        self.database_var.set(f"{summary['database']}: {summary['rows']:,} rows, {summary['size_bytes'] / 1048576:.1f} MB, "
+                              f"schema v{summary['schema_version']}, SQLite {summary['sqlite_version']}")
+        snapshot = self.diagnostics.snapshot()
+        # Statements and slow queries are capped to what is worth reading here;
+        # the JSON export has everything
+        snapshot["statements"] = snapshot["statements"][:100]
+        snapshot["slow_queries"] = snapshot["slow_queries"][::-1]
+        for key, tree in self.diagnostics_trees.items():
+            tree.delete(*tree.get_children())
+            for entry in snapshot[key]:
+                tree.insert("", tk.END, values=[entry[column] for column in tree["columns"]])
+
+    def reset_diagnostics(self):
+        self.diagnostics.reset()
+        self.refresh_diagnostics()
+
+    def set_slow_threshold(self):
+        try:
+            slow_ms = float(self.slow_ms_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Value", "The threshold must be a number of milliseconds.")
+            return
+        self.diagnostics.slow_ms = slow_ms
+        self.status_var.set(f"Queries slower than {slow_ms:g} ms will be logged")
 
-        # Fetch all items from the database
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM extinguishers")
-        for row in cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+    def export_diagnostics(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        if not file_path:
+            return
+        summary = self.database_summary()
+        self.diagnostics.export_json(file_path, {"database": summary})
+        self.status_var.set(f"Diagnostics saved to {file_path}")
+
+    def refresh_inventory(self):
+        # Re-reads only the visible window of rows
+        with self.diagnostics.operation("Refresh") as op:
+            self.inventory_view.refresh()
+            op["rows"] = self.inventory_view.total
+
+    def apply_filters(self):
+        with self.diagnostics.operation("Filter") as op:
+            self.inventory_view.set_filters(**{column: var.get().strip() for column, var in self.filter_vars.items()})
+            op["rows"] = self.inventory_view.total
+
+    def clear_filters(self):
+        for var in self.filter_vars.values():
+            var.set("")
+        self.apply_filters()
+
+    def schedule_search(self):
+        if self.search_after_id:
+            self.master.after_cancel(self.search_after_id)
+        self.search_after_id = self.master.after(250, self.apply_search)
+
+    def apply_search(self):
+        if self.search_after_id:
+            self.master.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        text = self.search_var.get()
+        if inventory_db.search_expression(text) != self.pager.search:
+            with self.diagnostics.operation("Search") as op:
+                self.inventory_view.search(text)
+                op["rows"] = self.inventory_view.total
+
+    def clear_search(self):
+        self.search_var.set("")
+        self.apply_search()
 
     def add_extinguisher(self):
         # Create a dialog for adding a new extinguisher
@@ -108,9 +531,8 @@ class FireExtinguisherApp:
 
         # Building dropdown
         ttk.Label(dialog, text="Building:").grid(row=0, column=0, padx=5, pady=5)
-        buildings = ["EDS", "BRS", "MB", "SB", "CHTM", "PE", "Legarda", "Campo Libertad", "Others"]
         building_var = tk.StringVar()
-        building_dropdown = ttk.Combobox(dialog, textvariable=building_var, values=buildings)
+        building_dropdown = self.lookup_combobox(dialog, "building", textvariable=building_var)
         building_dropdown.grid(row=0, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Room:").grid(row=1, column=0, padx=5, pady=5)
@@ -119,16 +541,14 @@ class FireExtinguisherApp:
 
         # Type dropdown
         ttk.Label(dialog, text="Type:").grid(row=2, column=0, padx=5, pady=5)
-        types = ["Red", "Green", "Gray"]
         type_var = tk.StringVar()
-        type_dropdown = ttk.Combobox(dialog, textvariable=type_var, values=types)
+        type_dropdown = self.lookup_combobox(dialog, "type", textvariable=type_var)
         type_dropdown.grid(row=2, column=1, padx=5, pady=5)
 
         # Weight dropdown
         ttk.Label(dialog, text="Weight (lbs):").grid(row=3, column=0, padx=5, pady=5)
-        weights = [5, 10, 20, 50, 120, 150, 180]
         weight_var = tk.StringVar()
-        weight_dropdown = ttk.Combobox(dialog, textvariable=weight_var, values=weights)
+        weight_dropdown = self.lookup_combobox(dialog, "weight", textvariable=weight_var)
         weight_dropdown.grid(row=3, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Date Refilled (mm/dd/yyyy):").grid(row=4, column=0, padx=5, pady=5)
@@ -139,8 +559,9 @@ class FireExtinguisherApp:
         date_expiration_entry = ttk.Entry(dialog)
         date_expiration_entry.grid(row=5, column=1, padx=5, pady=5)
 
+        # Supplier dropdown; a new supplier can still be typed in
         ttk.Label(dialog, text="Supplier:").grid(row=6, column=0, padx=5, pady=5)
-        supplier_entry = ttk.Entry(dialog)
+        supplier_entry = self.lookup_combobox(dialog, "supplier")
         supplier_entry.grid(row=6, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Notes:").grid(row=7, column=0, padx=5, pady=5)
@@ -159,38 +580,74 @@ class FireExtinguisherApp:
                 messagebox.showerror("Invalid Date", "Please enter dates in the format mm/dd/yyyy")
                 return
 
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO extinguishers (building, room, type, weight, date_refilled, date_expiration, supplier, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (building_var.get(), room_entry.get(), type_var.get(), weight_var.get(),
-                  date_refilled_entry.get(), date_expiration_entry.get(),
-                  supplier_entry.get(), notes_entry.get()))
-            self.conn.commit()
+            # Dates are stored normalized to yyyy-mm-dd
+            record = (building_var.get(), room_entry.get(), type_var.get(), weight_var.get(),
+                      date_refilled_entry.get(), date_expiration_entry.get(),
+                      supplier_entry.get(), notes_entry.get())
+            if self.client:
+                save_button.state(["disabled"])
+                self.service_call(service_add, record, description="Add", on_done=saved, on_error=save_failed)
+                return
+            try:
+                row_id = inventory_db.insert_extinguisher(self.conn, record)
+            except ValueError as e:
+                messagebox.showerror("Invalid Value", str(e))
+                return
+            except sqlite3.OperationalError as e:
+                self.show_busy(e, dialog)
+                return
+            saved(row_id)
+
+        def saved(row_id):
             dialog.destroy()
-            self.refresh_inventory()
+            self.inventory_view.apply_changes(upserted=[row_id])
+            self.inventory_view.select(row_id)
 
-        ttk.Button(dialog, text="Save", command=save_extinguisher).grid(row=8, column=0, columnspan=2, pady=10)
+        def save_failed(error):
+            save_button.state(["!disabled"])
+            if isinstance(error, ValueError):
+                messagebox.showerror("Invalid Value", str(error), parent=dialog)
+                return True
+            return False
+
+        save_button = ttk.Button(dialog, text="Save", command=save_extinguisher)
+        save_button.grid(row=8, column=0, columnspan=2, pady=10)
 
     def edit_extinguisher(self):
-        selected_item = self.tree.selection()
-        if not selected_item:
+        selected = self.inventory_view.selected_ids()
+        if not selected:
             messagebox.showwarning("No Selection", "Please select an extinguisher to edit.")
             return
+        if len(selected) > 1:
+            self.show_bulk_edit_dialog()
+            return
 
-        item_id = self.tree.item(selected_item)['values'][0]
+        item_id = selected[0]
 
         # Fetch the current values
+        if self.client:
+            self.service_call(service_row, item_id, description="Edit",
+                              on_done=lambda extinguisher: self.show_edit_dialog(item_id, extinguisher))
+            return
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM extinguishers WHERE id = ?", (item_id,))
-        extinguisher = cursor.fetchone()
+        self.show_edit_dialog(item_id, cursor.fetchone())
+
+    def show_edit_dialog(self, item_id, extinguisher):
+        if extinguisher is None:
+            # Deleted from another window since it was shown
+            messagebox.showwarning("Not Found", "This extinguisher has been deleted.")
+            self.inventory_view.apply_changes(deleted=[item_id])
+            return
 
         # Create a dialog for editing
         dialog = tk.Toplevel(self.master)
         dialog.title("Edit Extinguisher")
 
+        # Dropdowns of the known values for building, type, weight and
+        # supplier, so an edit does not start a new group through a typo
         ttk.Label(dialog, text="Building:").grid(row=0, column=0, padx=5, pady=5)
-        building_entry = ttk.Entry(dialog)
+        building_entry = self.lookup_combobox(dialog, "building")
         building_entry.insert(0, extinguisher[1])
         building_entry.grid(row=0, column=1, padx=5, pady=5)
 
@@ -200,12 +657,12 @@ class FireExtinguisherApp:
         room_entry.grid(row=1, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Type:").grid(row=2, column=0, padx=5, pady=5)
-        type_entry = ttk.Entry(dialog)
+        type_entry = self.lookup_combobox(dialog, "type")
         type_entry.insert(0, extinguisher[3])
         type_entry.grid(row=2, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Weight:").grid(row=3, column=0, padx=5, pady=5)
-        weight_entry = ttk.Entry(dialog)
+        weight_entry = self.lookup_combobox(dialog, "weight")
         weight_entry.insert(0, extinguisher[4])
         weight_entry.grid(row=3, column=1, padx=5, pady=5)
 
@@ -220,7 +677,7 @@ class FireExtinguisherApp:
         date_expiration_entry.grid(row=5, column=1, padx=5, pady=5)
 
         ttk.Label(dialog, text="Supplier:").grid(row=6, column=0, padx=5, pady=5)
-        supplier_entry = ttk.Entry(dialog)
+        supplier_entry = self.lookup_combobox(dialog, "supplier")
         supplier_entry.insert(0, extinguisher[7])
         supplier_entry.grid(row=6, column=1, padx=5, pady=5)
 
@@ -230,31 +687,186 @@ class FireExtinguisherApp:
         notes_entry.grid(row=7, column=1, padx=5, pady=5)
 
         def update_extinguisher():
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                UPDATE extinguishers
-                SET building = ?, room = ?, type = ?, weight = ?, date_refilled = ?, date_expiration = ?, supplier = ?, notes = ?
-                WHERE id = ?
-            ''', (building_entry.get(), room_entry.get(), type_entry.get(), weight_entry.get(),
-                  date_refilled_entry.get(), date_expiration_entry.get(), supplier_entry.get(), notes_entry.get(), item_id))
-            self.conn.commit()
+            record = (building_entry.get(), room_entry.get(), type_entry.get(), weight_entry.get(),
+                      date_refilled_entry.get(), date_expiration_entry.get(), supplier_entry.get(), notes_entry.get())
+            if self.client:
+                update_button.state(["disabled"])
+                self.service_call(service_update, item_id, record, description="Update", on_done=updated,
+                                  on_error=update_failed)
+                return
+            try:
+                inventory_db.update_extinguisher(self.conn, item_id, record)
+            except sqlite3.OperationalError as e:
+                self.show_busy(e, dialog)
+                return
+            except ValueError as e:
+                update_failed(e)
+                return
+            updated()
+
+        def updated(result=None):
             dialog.destroy()
-            self.refresh_inventory()
+            self.inventory_view.apply_changes(upserted=[item_id])
 
-        ttk.Button(dialog, text="Update", command=update_extinguisher).grid(row=8, column=0, columnspan=2, pady=10)
+        def update_failed(error):
+            update_button.state(["!disabled"])
+            if isinstance(error, ValueError):
+                messagebox.showerror("Invalid Value", str(error), parent=dialog)
+                return True
+            if isinstance(error, KeyError):
+                messagebox.showwarning("Not Found", "This extinguisher has been deleted.", parent=dialog)
+                dialog.destroy()
+                self.inventory_view.apply_changes(deleted=[item_id])
+                return True
+            return False
+
+        update_button = ttk.Button(dialog, text="Update", command=update_extinguisher)
+        update_button.grid(row=8, column=0, columnspan=2, pady=10)
 
     def delete_extinguisher(self):
-        selected_item = self.tree.selection()
-        if not selected_item:
+        selected = self.inventory_view.selected_ids()
+        if not selected:
             messagebox.showwarning("No Selection", "Please select an extinguisher to delete.")
             return
+        if len(selected) > 1:
+            self.show_bulk_delete_dialog()
+            return
 
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this extinguisher?"):
-            item_id = self.tree.item(selected_item)['values'][0]
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM extinguishers WHERE id = ?", (item_id,))
-            self.conn.commit()
-            self.refresh_inventory()
+            item_id = selected[0]
+            if self.client:
+                self.service_call(service_delete, item_id, description="Delete",
+                                  on_done=lambda result: self.inventory_view.apply_changes(deleted=[item_id]))
+                return
+            try:
+                inventory_db.delete_extinguisher(self.conn, item_id)
+            except sqlite3.OperationalError as e:
+                self.show_busy(e)
+                return
+            self.inventory_view.apply_changes(deleted=[item_id])
+
+    def bulk_scope(self, dialog, row):
+        # "Selected rows" / "all rows shown" choice for the bulk dialogs;
+        # returns a function giving the chosen row ids
+        selected = self.inventory_view.selected_ids()
+        scope_var = tk.StringVar(value="selected" if selected else "shown")
+        ttk.Label(dialog, text="Apply to:").grid(row=row, column=0, padx=5, pady=5, sticky="nw")
+        scope_frame = ttk.Frame(dialog)
+        scope_frame.grid(row=row, column=1, columnspan=2, padx=5, pady=5, sticky="w")
+        tk.Radiobutton(scope_frame, text=f"Selected rows ({len(selected):,})", variable=scope_var, value="selected",
+                       state=tk.NORMAL if selected else tk.DISABLED).pack(anchor="w")
+        tk.Radiobutton(scope_frame, text=f"All rows shown by the filters and search ({self.inventory_view.total:,})",
+                       variable=scope_var, value="shown").pack(anchor="w")
+        return lambda: selected if scope_var.get() == "selected" else self.pager.ids()
+
+    def show_bulk_edit_dialog(self):
+        if self.local_only("Bulk editing"):
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Bulk Edit")
+        ids_for_scope = self.bulk_scope(dialog, 0)
+
+        # Only ticked fields are changed; the rest keep each row's own value
+        ttk.Label(dialog, text="Set these fields:").grid(row=1, column=0, columnspan=3, padx=5, pady=(10, 0), sticky="w")
+        fields = {}
+        for row, (column, label) in enumerate((
+                ("building", "Building"), ("room", "Room"), ("type", "Type"), ("weight", "Weight (lbs)"),
+                ("date_refilled", "Date Refilled (mm/dd/yyyy)"), ("date_expiration", "Expiration Date (mm/dd/yyyy)"),
+                ("supplier", "Supplier"), ("notes", "Notes")), start=2):
+            enabled = tk.BooleanVar(value=False)
+            value = tk.StringVar()
+            tk.Checkbutton(dialog, variable=enabled).grid(row=row, column=0, padx=5, sticky="e")
+            ttk.Label(dialog, text=label + ":").grid(row=row, column=1, padx=5, pady=2, sticky="w")
+            if column in inventory_db.LOOKUP_TABLES or column == "weight":
+                widget = self.lookup_combobox(dialog, column, textvariable=value)
+            else:
+                widget = ttk.Entry(dialog, textvariable=value)
+            widget.grid(row=row, column=2, padx=5, pady=2)
+            # Typing into a field ticks it
+            widget.bind("<KeyRelease>", lambda e, var=enabled: var.set(True))
+            widget.bind("<<ComboboxSelected>>", lambda e, var=enabled: var.set(True))
+            fields[column] = (enabled, value)
+
+        def apply():
+            chosen = {column: value.get() for column, (enabled, value) in fields.items() if enabled.get()}
+            if not chosen:
+                messagebox.showwarning("Nothing to Change", "Tick at least one field to set.", parent=dialog)
+                return
+            try:
+                chosen = inventory_db.normalize_fields(chosen)
+            except ValueError as e:
+                messagebox.showerror("Invalid Value", str(e), parent=dialog)
+                return
+            ids = ids_for_scope()
+            if not ids:
+                messagebox.showwarning("No Rows", "There are no rows to edit.", parent=dialog)
+                return
+            dialog.destroy()
+            self.run_bulk_change(bulk_edit, ids, chosen, description="Bulk edit")
+
+        ttk.Button(dialog, text="Apply", command=apply).grid(row=10, column=0, columnspan=3, pady=10)
+
+    def show_bulk_delete_dialog(self):
+        if self.local_only("Bulk deleting"):
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Bulk Delete")
+        ids_for_scope = self.bulk_scope(dialog, 0)
+
+        def delete():
+            ids = ids_for_scope()
+            if not ids:
+                messagebox.showwarning("No Rows", "There are no rows to delete.", parent=dialog)
+                return
+            if not messagebox.askyesno("Confirm Delete", f"Delete {len(ids):,} extinguishers? This can be undone.",
+                                       parent=dialog):
+                return
+            dialog.destroy()
+            self.run_bulk_change(bulk_delete, ids, description="Bulk delete")
+
+        ttk.Button(dialog, text="Delete", command=delete).grid(row=1, column=0, columnspan=3, pady=10)
+
+    def run_bulk_change(self, func, *args, description):
+        def done(change):
+            self.undo_stack.append(change)
+            del self.undo_stack[:-UNDO_LIMIT]
+            self.show_undo_state()
+            if change.op == "delete":
+                self.inventory_view.selection.difference_update(change.ids)
+            self.status_var.set(f"{change.description} done")
+            # One re-read of the window, however many rows changed
+            self.inventory_view.reload()
+
+        self.run_job(func, *args, description=description, on_done=done)
+
+    def undo_bulk_change(self):
+        if not self.undo_stack:
+            return
+        change = self.undo_stack.pop()
+        self.show_undo_state()
+
+        def done(result):
+            change, undone = result
+            # The change and its undo cancel out, so neither counts as a
+            # later edit when the earlier changes are undone in turn
+            for earlier in self.undo_stack:
+                earlier.undone.extend(undone)
+            self.status_var.set(f"Undid {change.description}")
+            self.inventory_view.reload()
+
+        def failed(error):
+            # Try again later unless rows have changed since, which no retry fixes
+            if not isinstance(error, ValueError):
+                self.undo_stack.append(change)
+            self.show_undo_state()
+
+        self.run_job(undo_bulk, change, description="Undo", on_done=done, on_error=failed)
+
+    def show_undo_state(self):
+        if self.undo_stack:
+            self.undo_button.configure(state=tk.NORMAL, text=f"Undo {self.undo_stack[-1].description}")
+        else:
+            self.undo_button.configure(state=tk.DISABLED, text="Undo")
 
     def show_tally_dialog(self):
         categories = ["Building", "Weight", "Type", "Supplier"]
@@ -278,124 +890,274 @@ class FireExtinguisherApp:
         dialog.destroy()
         self.generate_report("tally", selected_categories)
 
-    def generate_report(self, report_type, categories=None):
+    def show_expiring_dialog(self):
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Expiring Soon Options")
+
+        ttk.Label(dialog, text="Days ahead:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        horizon_var = tk.StringVar(value="30")
+        ttk.Entry(dialog, textvariable=horizon_var, width=8).grid(row=0, column=1, padx=5, pady=5, sticky="w")
+
+        ttk.Label(dialog, text="Building:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        building_var = tk.StringVar(value="All")
+        self.lookup_combobox(dialog, "building", extra=["All"], textvariable=building_var).grid(row=1, column=1, padx=5, pady=5)
+
+        overdue_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(dialog, text="Include already overdue", variable=overdue_var).grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
+        def generate():
+            try:
+                horizon_days = int(horizon_var.get())
+            except ValueError:
+                messagebox.showerror("Invalid Value", "Days ahead must be a whole number.")
+                return
+            building = building_var.get()
+            dialog.destroy()
+            self.generate_report("expiring", horizon_days=horizon_days,
+                                 building=None if building in ("", "All") else building,
+                                 include_overdue=overdue_var.get())
+
+        ttk.Button(dialog, text="Generate", command=generate).grid(row=3, column=0, columnspan=2, pady=10)
+
+    def show_forecast_dialog(self):
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Forecast Options")
+
+        ttk.Label(dialog, text="Months ahead:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        months_var = tk.StringVar(value=str(inventory_forecast.DEFAULT_MONTHS))
+        ttk.Combobox(dialog, textvariable=months_var, values=inventory_forecast.MONTH_CHOICES, state="readonly",
+                     width=6).grid(row=0, column=1, padx=5, pady=5, sticky="w")
+
+        def generate():
+            dialog.destroy()
+            self.generate_report("forecast", months=int(months_var.get()))
+
+        ttk.Button(dialog, text="Generate", command=generate).grid(row=1, column=0, columnspan=2, pady=10)
+
+    def run_job(self, func, *args, description, on_done, on_error=None, on_progress=None):
+        # Submits func to the database worker with the shared progress/cancel UI
+        started = time.perf_counter()
+
+        def done(result):
+            self.progress_var.set(0)
+            self.diagnostics.record_operation(description, time.perf_counter() - started, job.rows)
+            on_done(result)
+
+        def failed(error):
+            self.progress_var.set(0)
+            if isinstance(error, JobCancelled):
+                self.status_var.set(f"{description} cancelled")
+            else:
+                self.status_var.set(f"{description} failed")
+                messagebox.showerror(f"{description} Error", f"An error occurred: {str(error)}")
+            if on_error:
+                on_error(error)
+
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.status_var.set(f"{description}...")
+        job = self.worker.submit(func, *args, description=description, on_done=done, on_error=failed,
+                                 on_progress=on_progress or self.show_progress)
+        return job
+
+    def show_progress(self, job, fraction, message, data):
+        if fraction is not None:
+            self.progress_var.set(fraction)
+        if message:
+            self.status_var.set(message)
+
+    def on_worker_idle(self):
+        self.cancel_button.configure(state=tk.DISABLED)
+
+    def generate_report(self, report_type, categories=None, horizon_days=30, building=None, include_overdue=True,
+                        months=inventory_forecast.DEFAULT_MONTHS):
         self.report_text.delete(1.0, tk.END)
-        cursor = self.conn.cursor()
+        self.show_report_chart(None)
+        if self.report_job:
+            self.report_job.cancel()
+        self.remove_report_spool()
+        fd, self.report_spool = tempfile.mkstemp(prefix="fire-report-", suffix=".txt")
+        os.close(fd)
+        self.report_pages = []
+        self.report_page = 0
+        self.report_page_var.set("")
+
+        options = dict(categories=categories, horizon_days=horizon_days, building=building, include_overdue=include_overdue,
+                       months=months)
+        self.last_report = (report_type, options)
+        started = time.perf_counter()
+
+        def page_written(job, fraction, message, data):
+            if job is not self.report_job:
+                return
+            self.show_progress(job, fraction, message, data)
+            offset, length, text = data
+            self.report_pages.append((offset, length))
+            if text is not None:
+                # What the user waits for before anything shows
+                self.diagnostics.record_operation("Report: first page", time.perf_counter() - started)
+                self.report_text.insert(tk.END, text)
+            self.report_page_var.set(f"Page {self.report_page + 1} of {len(self.report_pages)}")
+
+        def report_done(result):
+            size, chart = result
+            self.show_report_chart(chart)
+            self.status_var.set("Report ready")
+
+        self.report_job = self.run_job(spool_service_report if self.client else spool_report, self.report_spool,
+                                       report_type, options, description="Report",
+                                       on_done=report_done, on_progress=page_written)
+
+    def show_report_chart(self, chart):
+        self.report_chart_data = chart
+        if chart is None:
+            self.report_chart.pack_forget()
+        else:
+            self.report_chart.pack(fill=tk.X, pady=(0, 5), before=self.report_text)
+            self.draw_report_chart()
+
+    def draw_report_chart(self):
+        canvas = self.report_chart
+        canvas.delete("all")
+        if not self.report_chart_data:
+            return
+        title, labels, values = self.report_chart_data
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        top, bottom, left = 34, 30, 10
+        canvas.create_text(left, 4, text=title, anchor="nw", font=("TkDefaultFont", 10, "bold"))
+        if not values:
+            return
+        step = max((width - 2 * left) / len(values), 1)
+        highest = max(max(values), 1)
+        for i, (label, value) in enumerate(zip(labels, values)):
+            x = left + i * step
+            bar = (height - top - bottom) * value / highest
+            canvas.create_rectangle(x + 2, height - bottom - bar, x + step - 2, height - bottom, fill="#c0392b", outline="")
+            canvas.create_text(x + step / 2, height - bottom - bar - 2, text=f"{value:,}", anchor="s", font=("TkDefaultFont", 7))
+            canvas.create_text(x + step / 2, height - bottom + 4, text=label, anchor="n", font=("TkDefaultFont", 7))
+
+    def show_report_page(self, page):
+        if not 0 <= page < len(self.report_pages):
+            return
+        offset, length = self.report_pages[page]
+        with open(self.report_spool, 'rb') as spool:
+            spool.seek(offset)
+            text = spool.read(length).decode('utf-8')
+        self.report_page = page
+        self.report_text.delete(1.0, tk.END)
+        self.report_text.insert(tk.END, text)
+        self.report_page_var.set(f"Page {page + 1} of {len(self.report_pages)}")
+
+    def remove_report_spool(self):
+        if self.report_spool:
+            try:
+                os.remove(self.report_spool)
+            except OSError:
+                pass
+            self.report_spool = None
+
+    def save_report(self):
+        if not self.last_report:
+            messagebox.showwarning("No Report", "Please generate a report first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[
+            ("Text Files", "*.txt"), ("CSV Files", "*.csv"), ("HTML Files", "*.html")])
+        if not file_path:
+            return
 
-        if report_type == "full":
-            cursor.execute("SELECT * FROM extinguishers ORDER BY building, room")
-            rows = cursor.fetchall()
-
-            self.report_text.insert(tk.END, "Full Inventory Report\n")
-            self.report_text.insert(tk.END, "======================\n\n")
-
-            for row in rows:
-                self.report_text.insert(tk.END, f"Building: {row[1]}\n")
-                self.report_text.insert(tk.END, f"Room: {row[2]}\n")
-                self.report_text.insert(tk.END, f"Type: {row[3]}\n")
-                self.report_text.insert(tk.END, f"Weight: {row[4]} lbs\n")
-                self.report_text.insert(tk.END, f"Date Refilled: {row[5]}\n")
-                self.report_text.insert(tk.END, f"Expiration Date: {row[6]}\n")
-                self.report_text.insert(tk.END, f"Supplier: {row[7]}\n")
-                self.report_text.insert(tk.END, f"Notes: {row[8]}\n")
-                self.report_text.insert(tk.END, "--------------------\n")
-
-        elif report_type == "expiring":
-            today = datetime.now().date()
-            one_month_later = today + timedelta(days=30)
-            
-            cursor.execute("SELECT * FROM extinguishers WHERE date_expiration BETWEEN ? AND ? ORDER BY date_expiration", (today.isoformat(), one_month_later.isoformat()))
-            rows = cursor.fetchall()
-
-            self.report_text.insert(tk.END, "Extinguishers Expiring Soon Report\n")
-            self.report_text.insert(tk.END, "====================================\n\n")
-
-            for row in rows:
-                self.report_text.insert(tk.END, f"Building: {row[1]}\n")
-                self.report_text.insert(tk.END, f"Room: {row[2]}\n")
-                self.report_text.insert(tk.END, f"Type: {row[3]}\n")
-                self.report_text.insert(tk.END, f"Expiration Date: {row[6]}\n")
-                self.report_text.insert(tk.END, "--------------------\n")
-
-        elif report_type == "tally":
-            self.report_text.insert(tk.END, "Tally Report\n")
-            self.report_text.insert(tk.END, "============\n\n")
-
-            for category in categories:
-                self.report_text.insert(tk.END, f"{category} Tally:\n")
-                self.report_text.insert(tk.END, "--------------\n")
-
-                if category == "Building":
-                    cursor.execute("SELECT building, COUNT(*) FROM extinguishers GROUP BY building ORDER BY COUNT(*) DESC")
-                elif category == "Weight":
-                    cursor.execute("SELECT weight, COUNT(*) FROM extinguishers GROUP BY weight ORDER BY COUNT(*) DESC")
-                elif category == "Type":
-                    cursor.execute("SELECT type, COUNT(*) FROM extinguishers GROUP BY type ORDER BY COUNT(*) DESC")
-                elif category == "Supplier":
-                    cursor.execute("SELECT supplier, COUNT(*) FROM extinguishers GROUP BY supplier ORDER BY COUNT(*) DESC")
-
-                rows = cursor.fetchall()
-                for row in rows:
-                    self.report_text.insert(tk.END, f"{row[0]}: {row[1]}\n")
-                
-                self.report_text.insert(tk.END, "\n")
-
-            if len(categories) > 1:
-                self.report_text.insert(tk.END, "Combined Tally:\n")
-                self.report_text.insert(tk.END, "----------------\n")
-
-                group_by = ", ".join(categories)
-                select = ", ".join([f"COALESCE({cat.lower()}, 'N/A') as {cat.lower()}" for cat in categories])
-                query = f"SELECT {select}, COUNT(*) FROM extinguishers GROUP BY {group_by} ORDER BY COUNT(*) DESC"
-                cursor.execute(query)
-                rows = cursor.fetchall()
-
-                for row in rows:
-                    tally_str = ", ".join([f"{cat}: {row[i]}" for i, cat in enumerate(categories)])
-                    self.report_text.insert(tk.END, f"{tally_str}: {row[-1]}\n")
-
-        self.report_text.see(tk.END)
+        report_type, options = self.last_report
+        self.run_job(save_service_report if self.client else save_report, file_path, report_type, options,
+                     description="Save report",
+                     on_done=lambda result: self.status_var.set(f"Report saved to {file_path}"))
 
     def import_csv(self, file_path=None):
+        if self.local_only("Importing"):
+            return
         if not file_path:
             file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
             if not file_path:
                 return
 
-        try:
-            with open(file_path, 'r') as csv_file:
-                csv_reader = csv.reader(csv_file)
-                next(csv_reader)  # Skip header row
-                cursor = self.conn.cursor()
-                cursor.executemany('''
-                    INSERT INTO extinguishers (building, room, type, weight, date_refilled, date_expiration, supplier, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', csv_reader)
-                self.conn.commit()
-            messagebox.showinfo("Import Successful", "Data has been imported successfully.")
-        except Exception as e:
-            messagebox.showerror("Import Error", f"An error occurred while importing: {str(e)}")
-
-    def export_csv(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
+        def imported(stats):
+            self.status_var.set(f"Imported {stats.rows_read:,} rows in {stats.elapsed:.1f}s")
+            # Applied as a diff against the rows on screen
+            self.inventory_view.reload()
+            title = "Import Stopped" if stats.stopped else "Import Successful"
+            messagebox.showinfo(title, stats.summary())
+
+        # Batches committed before a failure or cancel stay imported
+        self.run_job(import_file, file_path, self.import_batch_size, description="Import",
+                     on_done=imported, on_error=lambda error: self.inventory_view.reload())
+
+    def export_csv(self, file_path=None, **options):
+        if self.local_only("Exporting"):
+            return
+        file_path = file_path or filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV Files", "*.csv"), ("Compressed CSV", "*.csv.gz *.csv.zst"),
+                       ("Parquet Files", "*.parquet"), ("Arrow Files", "*.arrow"), ("All Files", "*.*")])
         if not file_path:
             return
 
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM extinguishers")
-            rows = cursor.fetchall()
+        def exported(count):
+            self.status_var.set(f"Exported {count:,} rows")
+            messagebox.showinfo("Export Successful", "Data has been exported successfully.")
 
-            with open(file_path, 'w', newline='') as csv_file:
-                csv_writer = csv.writer(csv_file)
-                csv_writer.writerow(["ID", "Building", "Room", "Type", "Weight", "Date Refilled", "Expiration Date", "Supplier", "Notes"])
-                csv_writer.writerows(rows)
+        self.run_job(export_file, file_path, options, description="Export", on_done=exported)
 
-            messagebox.showinfo("Export Successful", "Data has been exported successfully.")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"An error occurred while exporting: {str(e)}")
+    def show_export_dialog(self):
+        if self.local_only("Exporting"):
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Export Options")
+
+        # Columns to include, all by default
+        ttk.Label(dialog, text="Columns:").grid(row=0, column=0, padx=5, pady=5, sticky="nw")
+        columns_frame = ttk.Frame(dialog)
+        columns_frame.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        column_vars = {}
+        for i, column in enumerate(inventory_export.EXPORT_COLUMNS):
+            column_vars[column] = tk.BooleanVar(value=True)
+            tk.Checkbutton(columns_frame, text=inventory_export.HEADINGS[column],
+                           variable=column_vars[column]).grid(row=i // 3, column=i % 3, sticky="w")
+
+        ttk.Label(dialog, text="Building:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        building_var = tk.StringVar(value="All")
+        self.lookup_combobox(dialog, "building", extra=["All"], textvariable=building_var).grid(
+            row=1, column=1, padx=5, pady=5, sticky="w")
+
+        ttk.Label(dialog, text="Expiring within (days):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        horizon_var = tk.StringVar()
+        ttk.Entry(dialog, textvariable=horizon_var, width=8).grid(row=2, column=1, padx=5, pady=5, sticky="w")
+
+        overdue_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(dialog, text="Include already overdue", variable=overdue_var).grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
+        def export():
+            columns = [column for column, var in column_vars.items() if var.get()]
+            if not columns:
+                messagebox.showerror("Invalid Value", "Choose at least one column.")
+                return
+            try:
+                horizon_days = int(horizon_var.get()) if horizon_var.get().strip() else None
+            except ValueError:
+                messagebox.showerror("Invalid Value", "Days must be a whole number or left blank.")
+                return
+            building = building_var.get()
+            dialog.destroy()
+            self.export_csv(columns=columns, building=None if building in ("", "All") else building,
+                            expiring_within=horizon_days, include_overdue=overdue_var.get())
+
+        ttk.Button(dialog, text="Export...", command=export).grid(row=4, column=0, columnspan=2, pady=10)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire Extinguisher Inventory")
+    parser.add_argument("initial_csv", nargs="?", help="CSV file to import on startup")
+    parser.add_argument("--db", default=inventory_db.DEFAULT_DB_PATH, help="inventory database file")
+    parser.add_argument("--memory", action="store_true", help="use a throwaway in-memory database")
+    parser.add_argument("--server", default=os.environ.get(inventory_service.SERVER_ENV),
+                        help="inventory service URL for client mode, e.g. http://127.0.0.1:8765")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = FireExtinguisherApp(root)
-    root.mainloop()
\ No newline at end of file
+    app = FireExtinguisherApp(root, args.initial_csv, inventory_db.MEMORY if args.memory else args.db, args.server)
+    root.mainloop()
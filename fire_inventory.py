@@ -1,62 +1,226 @@
 import streamlit as st
-import sqlite3
-from datetime import datetime, timedelta
+import os
+import threading
 import pandas as pd
 
+import inventory_db
+import inventory_forecast
+import inventory_service
+
+PAGE_SIZES = [25, 50, 100, 250]
+FRAME_COLUMNS = ["id"] + list(inventory_db.COLUMNS)
+# Dropdown entry for typing in a building, type or supplier not listed yet
+NEW_VALUE = "(new...)"
+
 class FireExtinguisherApp:
-    def __init__(self):
-        self.conn = sqlite3.connect(':memory:')
+    # One instance is shared by every session and rerun (see get_app), so its
+    # connection is used from several script threads and guarded by a lock.
+    # Given a server URL it runs in client mode instead: every operation goes
+    # to an inventory service (inventory_service.py) shared with other
+    # operators, and there is no local database.
+    def __init__(self, db_path=inventory_db.DEFAULT_DB_PATH, server=None):
+        self.db_path = db_path
+        self.client = inventory_service.InventoryClient(server) if server else None
+        self.lock = threading.Lock()
+        self.writes = 0
+        if self.client:
+            self.conn = self.lookups = None
+            return
+        self.conn = inventory_db.connect(db_path, check_same_thread=False)
         self.create_table()
+        self.lookups = inventory_db.LookupCache(self.conn)
 
     def create_table(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS extinguishers (
-                id INTEGER PRIMARY KEY,
-                building TEXT,
-                room TEXT,
-                type TEXT,
-                weight REAL,
-                date_refilled TEXT,
-                date_expiration TEXT,
-                supplier TEXT,
-                notes TEXT
-            )
-        ''')
-        self.conn.commit()
+        with self.lock:
+            inventory_db.migrate(self.conn)
+
+    def data_version(self):
+        # Changes whenever the data may have changed: our own writes bump the
+        # counter, and SQLite's data_version moves on commits made by other
+        # connections (e.g. the desktop app on the same file). Cached queries
+        # take it as an argument, so a write invalidates them. A service
+        # reports its journal position, which moves on every change.
+        if self.client:
+            return self.client.version()
+        with self.lock:
+            return self.writes, self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def lookup_values(self, column):
+        # Known buildings, types, suppliers or weights for the dropdowns
+        if self.client:
+            return self.client.lookup_values(column)
+        with self.lock:
+            return list(self.lookups.values(column))
 
     def add_extinguisher(self, building, room, type, weight, date_refilled, date_expiration, supplier, notes):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO extinguishers (building, room, type, weight, date_refilled, date_expiration, supplier, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (building, room, type, weight, date_refilled, date_expiration, supplier, notes))
-        self.conn.commit()
+        record = (building, room, type, weight, date_refilled, date_expiration, supplier, notes)
+        if self.client:
+            return self.client.add(record)
+        with self.lock:
+            row_id = inventory_db.insert_extinguisher(self.conn, record)
+            self.writes += 1
+        return row_id
 
     def get_all_extinguishers(self):
-        return pd.read_sql_query("SELECT * from extinguishers", self.conn)
+        if self.client:
+            return pd.DataFrame(self.client.all_rows(), columns=FRAME_COLUMNS)
+        with self.lock:
+            return pd.read_sql_query("SELECT * from extinguishers", self.conn)
+
+    def get_page(self, filters, sort_column="id", descending=False, page=0, page_size=PAGE_SIZES[0], search=None):
+        # One page of the filtered inventory and the filtered row count; the
+        # database does the filtering, full-text search, sorting and paging
+        if self.client:
+            rows, total = self.client.page(filters, sort_column, descending, page * page_size, page_size, search)
+            return pd.DataFrame(rows, columns=FRAME_COLUMNS), total
+        pager = inventory_db.InventoryPager(self.conn)
+        pager.set_filters(**filters)
+        pager.set_search(search)
+        pager.set_sort(sort_column, descending)
+        with self.lock:
+            total = pager.count()
+            rows = pager.fetch_at(page * page_size, page_size)
+        return pd.DataFrame(rows, columns=FRAME_COLUMNS), total
+
+    def get_expiring_extinguishers(self, horizon_days=30, building=None, include_overdue=True):
+        if self.client:
+            found = self.client.expiring(horizon_days, building, include_overdue)
+            return {bucket: pd.DataFrame(rows, columns=FRAME_COLUMNS) for bucket, rows in found.items()}
+        buckets = inventory_db.EXPIRY_BUCKETS if include_overdue else ("upcoming",)
+        frames = {}
+        with self.lock:
+            for bucket in buckets:
+                sql, params = inventory_db.expiring_query(bucket, horizon_days, building)
+                frames[bucket] = pd.read_sql_query(sql, self.conn, params=params)
+        return frames
+
+    def get_forecast(self, months=inventory_forecast.DEFAULT_MONTHS):
+        # Only the small forecast cube is read under the lock; the projection
+        # itself runs on the frame afterwards
+        if self.client:
+            return inventory_forecast.forecast(inventory_forecast.frame_from_rows(self.client.forecast_rows()), months)
+        with self.lock:
+            frame = inventory_forecast.load_frame(self.conn)
+        return inventory_forecast.forecast(frame, months)
+
+@st.cache_resource
+def get_app(db_path=inventory_db.DEFAULT_DB_PATH, server=os.environ.get(inventory_service.SERVER_ENV)):
+    # Created once per server process instead of on every rerun; set
+    # FIRE_INVENTORY_SERVER to an inventory service URL for client mode
+    return FireExtinguisherApp(db_path, server)
+
+# Query results are cached per data version; the leading underscore keeps
+# Streamlit from hashing the app itself
+@st.cache_data(max_entries=256)
+def load_page(_app, version, filters, sort_column, descending, page, page_size, search=None):
+    return _app.get_page(dict(filters), sort_column, descending, page, page_size, search)
+
+@st.cache_data(max_entries=4)
+def load_all(_app, version):
+    return _app.get_all_extinguishers()
+
+@st.cache_data(max_entries=32)
+def load_expiring(_app, version, horizon_days, building, include_overdue):
+    return _app.get_expiring_extinguishers(horizon_days, building, include_overdue)
+
+@st.cache_data(max_entries=8)
+def load_forecast(_app, version, months):
+    return _app.get_forecast(months)
+
+def show_forecast(result):
+    months = len(result.months)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Already expired", f"{result.overdue:,}")
+    col2.metric(f"Refills due in {months} months", f"{int(result.workload['Units'].sum()):,}")
+    col3.metric("Agent needed (lbs)", f"{result.workload['Agent (lbs)'].sum():,.0f}")
+    if result.undated:
+        st.caption(f"{result.undated:,} units have no expiration date and are left out")
+
+    st.write("Refill workload per month (already expired units are due in the first month)")
+    st.bar_chart(result.workload["Units"])
+    st.dataframe(result.workload)
+
+    st.write("Units expiring per month by building")
+    by_building = result.expiring[result.months].groupby(level="building", observed=True).sum()
+    st.bar_chart(by_building.T)
+    st.dataframe(result.expiring)
+
+    st.write("Agent (lbs) due per month by supplier")
+    st.line_chart(result.agent.T)
+    st.dataframe(result.agent)
+
+def lookup_input(app, label, column):
+    # Dropdown of the known values; NEW_VALUE opens a text box for a new one
+    choice = st.selectbox(label, app.lookup_values(column) + [NEW_VALUE])
+    if choice == NEW_VALUE:
+        return st.text_input(f"New {label.lower()}")
+    return choice
+
+def show_inventory(app, version):
+    search = st.text_input("Search building, room, supplier or notes", key="search").strip()
+    # While searching, matches come best first unless another sort is picked
+    rank = inventory_db.InventoryPager.RANK
+    sort_options = list(inventory_db.InventoryPager.SORTABLE)
+    searching = inventory_db.search_expression(search) is not None
+    if searching:
+        sort_options.insert(0, rank)
+        if not st.session_state.get("searching"):
+            st.session_state["sort_column"] = rank
+    elif st.session_state.get("sort_column") == rank:
+        st.session_state["sort_column"] = "id"
+    st.session_state["searching"] = searching
+
+    with st.expander("Filter and sort", expanded=False):
+        col1, col2 = st.columns(2)
+        building = col1.selectbox("Building", ["All"] + app.lookup_values("building"), key="filter_building")
+        type = col2.selectbox("Type", ["All"] + app.lookup_values("type"), key="filter_type")
+        room = col1.text_input("Room starts with", key="filter_room")
+        supplier = col2.selectbox("Supplier", ["All"] + app.lookup_values("supplier"), key="filter_supplier")
+        sort_column = col1.selectbox("Sort by", sort_options, key="sort_column",
+                                     format_func=lambda c: "relevance" if c == rank else c)
+        descending = col2.checkbox("Descending", key="sort_descending")
+
+    filters = (("building", None if building == "All" else building), ("type", None if type == "All" else type),
+               ("room", room.strip()), ("supplier", None if supplier == "All" else supplier))
+    page_size = st.sidebar.selectbox("Rows per page", PAGE_SIZES, key="page_size")
+
+    # Start from the first page whenever the filters or sort change
+    view = (filters, search, sort_column, descending, page_size)
+    if st.session_state.get("inventory_view") != view:
+        st.session_state["inventory_view"] = view
+        st.session_state["inventory_page"] = 1
+
+    _, total = load_page(app, version, filters, sort_column, descending, 0, page_size, search)
+    pages = max(1, -(-total // page_size))
+    st.session_state["inventory_page"] = min(st.session_state.get("inventory_page", 1), pages)
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="inventory_page")
+
+    frame, total = load_page(app, version, filters, sort_column, descending, page - 1, page_size, search)
+    st.caption(f"{total} extinguishers, showing {len(frame)}")
+    st.dataframe(frame)
 
 def main():
     st.title("Fire Extinguisher Inventory")
 
-    app = FireExtinguisherApp()
+    app = get_app()
+    version = app.data_version()
 
     menu = ["View Inventory", "Add Extinguisher", "Generate Report"]
     choice = st.sidebar.selectbox("Menu", menu)
 
     if choice == "View Inventory":
         st.subheader("Current Inventory")
-        st.dataframe(app.get_all_extinguishers())
+        show_inventory(app, version)
 
     elif choice == "Add Extinguisher":
         st.subheader("Add New Extinguisher")
-        building = st.text_input("Building")
+        building = lookup_input(app, "Building", "building")
         room = st.text_input("Room")
-        type = st.selectbox("Type", ["Red", "Green", "Gray"])
+        type = lookup_input(app, "Type", "type")
         weight = st.number_input("Weight (lbs)", min_value=0.0, step=0.1)
         date_refilled = st.date_input("Date Refilled")
         date_expiration = st.date_input("Expiration Date")
-        supplier = st.text_input("Supplier")
+        supplier = lookup_input(app, "Supplier", "supplier")
         notes = st.text_area("Notes")
 
         if st.button("Add Extinguisher"):
@@ -66,13 +230,25 @@ def main():
 
     elif choice == "Generate Report":
         st.subheader("Generate Report")
-        report_type = st.selectbox("Report Type", ["Full Inventory", "Expiring Soon"])
+        report_type = st.selectbox("Report Type", ["Full Inventory", "Expiring Soon", "Forecast"])
+        if report_type == "Expiring Soon":
+            horizon_days = st.number_input("Days ahead", min_value=0, value=30, step=1)
+            building = st.selectbox("Building", ["All"] + app.lookup_values("building"))
+            include_overdue = st.checkbox("Include already overdue", value=True)
+        elif report_type == "Forecast":
+            months = st.selectbox("Months ahead", inventory_forecast.MONTH_CHOICES)
         if st.button("Generate"):
             if report_type == "Full Inventory":
-                st.dataframe(app.get_all_extinguishers())
+                st.dataframe(load_all(app, version))
             elif report_type == "Expiring Soon":
-                # Implement expiring soon logic here
-                st.write("Expiring Soon report to be implemented")
+                buckets = load_expiring(app, version, int(horizon_days), None if building == "All" else building, include_overdue)
+                if "overdue" in buckets:
+                    st.write(f"Already expired: {len(buckets['overdue'])}")
+                    st.dataframe(buckets["overdue"])
+                st.write(f"Expiring within {int(horizon_days)} days: {len(buckets['upcoming'])}")
+                st.dataframe(buckets["upcoming"])
+            elif report_type == "Forecast":
+                show_forecast(load_forecast(app, version, months))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
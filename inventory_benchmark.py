@@ -0,0 +1,268 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import inventory_db
+import inventory_export
+import inventory_forecast
+import inventory_import
+import inventory_reports
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = "benchmark_baseline.json"
+# A timing is a regression when its median is this much slower than the
+# baseline's...
+DEFAULT_TOLERANCE = 0.25
+# ...and slower by at least this many seconds, so timer noise on fast paths
+# does not count. Its fastest run must also be slower than the baseline's
+# slowest: runs that overlap are noise, not a regression.
+MIN_REGRESSION = 0.01
+# Timings are only comparable on one machine, so the baseline is meant to be
+# recorded (--update-baseline) on the machine that runs the gate. Each run
+# also times a fixed calibration workload; when that is more than the
+# tolerance off the baseline's, the baseline is scaled by the ratio, which
+# evens out a generally faster or slower machine but not one that differs
+# in kind (disk, SQLite version), where it must be re-recorded.
+CALIBRATION_ROWS = 200000
+
+SUPPLIERS = ["Acme Fire Safety", "Blaze Guard", "Firetech Supply", "Metro Safety Co.", "Red Line Services"]
+NOTES = ["", "", "", "near stairwell", "lobby entrance", "kitchen", "laboratory", "hallway by elevator",
+         "parking level", "server room", "pressure gauge low, recheck", "replaced bracket"]
+
+
+def generate_rows(count, seed=1):
+    # Synthetic inventory using the same buildings, types and weights as the
+    # entry forms. Every (building, room, type) is unique, so an import of the
+    # file inserts every row; dates spread over the last two years with
+    # expirations a year after refill.
+    rng = random.Random(seed)
+    today = date.today()
+    buildings = inventory_db.BUILDINGS
+    for i in range(count):
+        building = buildings[i % len(buildings)]
+        unit = i // len(buildings)
+        room = f"{unit // 500 + 1}{unit % 500:03d}"
+        refilled = today - timedelta(days=rng.randrange(730))
+        expiration = refilled + timedelta(days=365 + rng.randrange(-15, 16))
+        yield (building, room, rng.choice(inventory_db.TYPES), float(rng.choice(inventory_db.WEIGHTS)),
+               refilled.isoformat(), expiration.isoformat(), rng.choice(SUPPLIERS), rng.choice(NOTES))
+
+
+def write_csv(path, count, seed=1):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow([inventory_export.HEADINGS[column] for column in inventory_db.COLUMNS])
+        writer.writerows(generate_rows(count, seed))
+
+
+def timed(func, *args, repeat=1):
+    # Every one of `repeat` runs, in seconds
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def calibrate(repeat=5):
+    # Median seconds for a fixed SQLite and Python workload
+    def work():
+        conn = sqlite3.connect(inventory_db.MEMORY)
+        conn.execute("CREATE TABLE t (a INTEGER, b TEXT, c REAL)")
+        conn.executemany("INSERT INTO t VALUES (?, ?, ?)", ((i, f"r{i % 977}", i * 0.5) for i in range(CALIBRATION_ROWS)))
+        conn.execute("CREATE INDEX t_b ON t (b)")
+        conn.execute("SELECT b, COUNT(*), SUM(c) FROM t GROUP BY b ORDER BY 2 DESC").fetchall()
+        conn.close()
+
+    return round(statistics.median(timed(work, repeat=repeat)), 6)
+
+
+def machine_scale(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # How much slower this machine is than the baseline's, by calibration;
+    # 1 within the tolerance, which is run-to-run noise on one machine
+    now = results.get("meta", {}).get("calibration")
+    before = baseline.get("meta", {}).get("calibration")
+    if not now or not before or max(now, before) / min(now, before) <= 1 + tolerance:
+        return 1.0
+    return now / before
+
+
+def _import_new(db_path, csv_path):
+    # An import into a new, empty database file, as a first import is
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    conn = inventory_db.connect(db_path)
+    try:
+        inventory_import.import_csv(conn, csv_path)
+    finally:
+        inventory_db.close(conn)
+
+
+def _view_pages(conn, sort_column, descending):
+    # What refresh_inventory and scrolling do: count, the first window, a few
+    # scrolled pages after it and a jump to the middle
+    pager = inventory_db.InventoryPager(conn, sort_column, descending)
+    total = pager.count()
+    rows = pager.fetch_at(0, 140)
+    for _ in range(10):
+        rows = pager.fetch_after(pager.key(rows[-1]), 40)
+    pager.fetch_at(total // 2, 140)
+
+
+def _render(conn, report_type, **options):
+    for _ in inventory_reports.render_text(inventory_reports.build_report(conn, report_type, **options)):
+        pass
+
+
+def _streamlit_get_all(db_path):
+    import fire_inventory
+    app = fire_inventory.FireExtinguisherApp(db_path)
+    try:
+        app.get_all_extinguishers()
+    finally:
+        inventory_db.close(app.conn)
+
+
+def run_size(count, workdir, repeat=3, log=print):
+    # Returns ({benchmark: median seconds}, {benchmark: [fastest, slowest]})
+    results, ranges = {}, {}
+    csv_path = os.path.join(workdir, f"inventory_{count}.csv")
+    db_path = os.path.join(workdir, f"inventory_{count}.db")
+    write_csv(csv_path, count)
+
+    def record(name, runs):
+        results[name] = round(statistics.median(runs), 6)
+        ranges[name] = [round(min(runs), 6), round(max(runs), 6)]
+        log(f"  {name:<28} {results[name]:9.4f}s  ({min(runs):.4f}-{max(runs):.4f}s)")
+
+    record("import_csv", timed(_import_new, db_path, csv_path, repeat=repeat))
+    conn = inventory_db.connect(db_path)
+    # Re-importing the same file matches every row and changes nothing
+    record("import_csv_unchanged", timed(inventory_import.import_csv, conn, csv_path, repeat=repeat))
+
+    record("view_refresh", timed(_view_pages, conn, "id", False, repeat=repeat))
+    record("view_refresh_sorted", timed(_view_pages, conn, "building", True, repeat=repeat))
+    record("search", timed(inventory_db.search_extinguishers, conn, "stair", 100, repeat=repeat))
+
+    record("report_full", timed(_render, conn, "full", repeat=repeat))
+    record("report_expiring", timed(_render, conn, "expiring", repeat=repeat))
+    for n in range(1, len(inventory_reports.TALLY_CATEGORIES) + 1):
+        categories = inventory_reports.TALLY_CATEGORIES[:n]
+        record(f"report_tally_{n}", timed(lambda: _render(conn, "tally", categories=categories), repeat=repeat))
+    if inventory_forecast.pd is not None:
+        record("report_forecast", timed(lambda: _render(conn, "forecast", months=24), repeat=repeat))
+    else:
+        log("  report_forecast              skipped (pandas not installed)")
+
+    export_path = os.path.join(workdir, "export.csv")
+    record("export_csv", timed(inventory_export.export, conn, export_path, repeat=repeat))
+    if inventory_export.pyarrow is not None:
+        record("export_parquet", timed(inventory_export.export, conn, os.path.join(workdir, "export.parquet"), repeat=repeat))
+    inventory_db.close(conn)
+
+    try:
+        import fire_inventory  # noqa: F401
+    except ImportError:
+        log("  streamlit_get_all            skipped (streamlit or pandas not installed)")
+    else:
+        record("streamlit_get_all", timed(_streamlit_get_all, db_path, repeat=repeat))
+    return results, ranges
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns (size, benchmark, baseline seconds, seconds) for every median
+    # that regressed against the baseline, scaled by machine_scale(); new
+    # benchmarks are not compared
+    scale = machine_scale(results, baseline, tolerance)
+    regressions = []
+    for size, timings in results.get("results", {}).items():
+        reference = baseline.get("results", {}).get(size, {})
+        for name, seconds in timings.items():
+            recorded = reference.get(name)
+            if recorded is None:
+                continue
+            before = recorded * scale
+            if seconds <= before * (1 + tolerance) or seconds - before <= MIN_REGRESSION:
+                continue
+            fastest = results.get("ranges", {}).get(size, {}).get(name, [seconds])[0]
+            slowest = baseline.get("ranges", {}).get(size, {}).get(name, [recorded, recorded])[1] * scale
+            if fastest > slowest:
+                regressions.append((size, name, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time imports, the inventory view, reports and exports on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help=f"inventory sizes to generate (default {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the median is compared")
+    parser.add_argument("--output", default=RESULTS_PATH, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, e.g. 0.25 for 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="save these results as the new baseline")
+    parser.add_argument("--workdir", help="keep generated files here instead of a temporary directory")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "date": date.today().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "calibration": calibrate(),
+        },
+        "results": {},
+        "ranges": {},
+    }
+    workdir = args.workdir or tempfile.mkdtemp(prefix="inventory-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        for count in args.sizes:
+            print(f"{count:,} rows")
+            results["results"][str(count)], results["ranges"][str(count)] = run_size(count, workdir, args.repeat)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    scale = machine_scale(results, baseline, args.tolerance)
+    if scale != 1.0:
+        print(f"This machine runs the calibration {scale:.2f}x as long as the baseline's; baseline timings are "
+              f"scaled to match. Re-record the baseline here for a reliable comparison.")
+    regressions = compare(results, baseline, args.tolerance)
+    for size, name, before, seconds in regressions:
+        print(f"REGRESSION {size} rows {name}: {before:.4f}s -> {seconds:.4f}s ({seconds / before - 1:+.0%})")
+    if regressions:
+        return 1
+    print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
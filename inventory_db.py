@@ -0,0 +1,1263 @@
+import functools
+import itertools
+import json
+import os
+import re
+import sqlite3
+import urllib.parse
+from datetime import date, datetime, timedelta
+
+# Both apps share one on-disk inventory unless told otherwise.
+# Pass MEMORY (":memory:") to get the old throwaway database, e.g. for tests.
+DEFAULT_DB_PATH = os.environ.get("FIRE_INVENTORY_DB", "fire_inventory.db")
+MEMORY = ":memory:"
+
+_memory_databases = itertools.count(1)
+
+# Page cache is in KiB when negative (64 MB), mmap window is in bytes (256 MB).
+# synchronous=NORMAL is durable across app crashes in WAL mode and only risks
+# the last commit on power loss.
+PRAGMAS = {
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Default choices offered by the entry forms
+BUILDINGS = ["EDS", "BRS", "MB", "SB", "CHTM", "PE", "Legarda", "Campo Libertad", "Others"]
+TYPES = ["Red", "Green", "Gray"]
+WEIGHTS = [5, 10, 20, 50, 120, 150, 180]
+
+COLUMNS = ("building", "room", "type", "weight", "date_refilled", "date_expiration", "supplier", "notes")
+
+# Dates are stored as ISO yyyy-mm-dd so that text order is date order and the
+# expiration index can answer range queries. These are the spellings accepted
+# from the entry forms and imported CSV files; the first match wins.
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%m-%d-%Y", "%d-%b-%Y", "%b %d, %Y", "%Y-%m-%d %H:%M:%S")
+
+
+def normalize_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+
+    text = str(value).strip()
+    if not text:
+        return None
+    return _parse_date_text(text)
+
+
+# Inventories repeat the same handful of refill/expiry dates across thousands
+# of rows, so parsed spellings are memoized for bulk imports.
+@functools.lru_cache(maxsize=8192)
+def _parse_date_text(text):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized date: {text!r}")
+
+
+def normalize_weight(value):
+    if value is None or str(value).strip() == "":
+        return None
+    weight = float(value)
+    if weight < 0:
+        raise ValueError(f"Weight cannot be negative: {value!r}")
+    return weight
+
+
+def normalize_record(record):
+    # record is (building, room, type, weight, date_refilled, date_expiration, supplier, notes)
+    building, room, type_, weight, date_refilled, date_expiration, supplier, notes = record
+    return (building, room, type_, normalize_weight(weight), normalize_date(date_refilled),
+            normalize_date(date_expiration), supplier, notes)
+
+
+def _normalize_date_or_keep(value):
+    try:
+        return normalize_date(value)
+    except ValueError:
+        return value
+
+
+def _migration_1(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extinguishers (
+            id INTEGER PRIMARY KEY,
+            building TEXT,
+            room TEXT,
+            type TEXT,
+            weight REAL,
+            date_refilled TEXT,
+            date_expiration TEXT,
+            supplier TEXT,
+            notes TEXT
+        )
+    ''')
+
+
+def _migration_2(cursor):
+    # Rewrite dates entered before normalization; anything unparseable is kept
+    # as-is rather than lost.
+    cursor.connection.create_function("normalize_date", 1, _normalize_date_or_keep, deterministic=True)
+    cursor.execute('''
+        UPDATE extinguishers
+        SET date_refilled = normalize_date(date_refilled), date_expiration = normalize_date(date_expiration)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extinguishers_expiration ON extinguishers (date_expiration)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extinguishers_refilled ON extinguishers (date_refilled)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extinguishers_building_expiration ON extinguishers (building, date_expiration)")
+
+
+def _migration_3(cursor):
+    # Natural key used by CSV imports to match incoming rows to existing units
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extinguishers_natural_key ON extinguishers (building, room, type)")
+
+
+def _migration_4(cursor):
+    # One index per sortable column. Each also carries the rowid, so
+    # "ORDER BY column, id" pages of the inventory view are plain index walks.
+    for column in ("building", "room", "type", "weight", "supplier"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_extinguishers_{column} ON extinguishers ({column})")
+
+
+# Tally categories and the columns they group on
+TALLY_COLUMNS = {"Building": "building", "Weight": "weight", "Type": "type", "Supplier": "supplier"}
+
+
+# Cube trigger bodies. Each cube column is keyed on the trigger row's column
+# of the same name unless values gives SQL expressions of the row instead.
+def _cube_values(row, columns, values):
+    return values or [f"{row}.{column}" for column in columns]
+
+
+def _cube_key(row, columns, values=None):
+    return " AND ".join(f"{column} IS {value}" for column, value in zip(columns, _cube_values(row, columns, values)))
+
+
+def _cube_increment(row, columns=tuple(TALLY_COLUMNS.values()), table="tally_cube", values=None):
+    return f'''
+        UPDATE {table} SET count = count + 1 WHERE {_cube_key(row, columns, values)};
+        INSERT INTO {table} ({", ".join(columns)}, count)
+        SELECT {", ".join(_cube_values(row, columns, values))}, 1
+        WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {_cube_key(row, columns, values)});
+    '''
+
+
+def _cube_decrement(row, columns=tuple(TALLY_COLUMNS.values()), table="tally_cube", values=None):
+    return f'''
+        UPDATE {table} SET count = count - 1 WHERE {_cube_key(row, columns, values)};
+        DELETE FROM {table} WHERE count <= 0 AND {_cube_key(row, columns, values)};
+    '''
+
+
+def _migration_5(cursor):
+    # Materialized tally: one row per distinct building/weight/type/supplier
+    # combination with its unit count, kept current by triggers. Any tally is
+    # then a pass over a few hundred cube rows instead of the whole table.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tally_cube (
+            building TEXT,
+            weight REAL,
+            type TEXT,
+            supplier TEXT,
+            count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tally_cube_key ON tally_cube (building, weight, type, supplier)")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_tally_insert AFTER INSERT ON extinguishers BEGIN
+            {_cube_increment("NEW")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_tally_delete AFTER DELETE ON extinguishers BEGIN
+            {_cube_decrement("OLD")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_tally_update AFTER UPDATE OF building, weight, type, supplier ON extinguishers
+        WHEN OLD.building IS NOT NEW.building OR OLD.weight IS NOT NEW.weight
+            OR OLD.type IS NOT NEW.type OR OLD.supplier IS NOT NEW.supplier
+        BEGIN
+            {_cube_decrement("OLD")}
+            {_cube_increment("NEW")}
+        END
+    """)
+    cursor.execute('''
+        INSERT INTO tally_cube (building, weight, type, supplier, count)
+        SELECT building, weight, type, supplier, COUNT(*) FROM extinguishers
+        GROUP BY building, weight, type, supplier
+    ''')
+
+
+# Columns covered by the full-text search index
+SEARCH_COLUMNS = ("building", "room", "supplier", "notes")
+
+
+def _migration_6(cursor):
+    # Full-text index over the free-text columns. It reads its text from the
+    # extinguishers table (external content) so nothing is stored twice; the
+    # triggers feed it the old and new values of every change. The prefix
+    # indexes make two and three character prefix searches cheap.
+    columns = ", ".join(SEARCH_COLUMNS)
+    new = ", ".join(f"NEW.{column}" for column in SEARCH_COLUMNS)
+    old = ", ".join(f"OLD.{column}" for column in SEARCH_COLUMNS)
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in SEARCH_COLUMNS)
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS extinguishers_fts USING fts5(
+            {columns}, content='extinguishers', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_fts_insert AFTER INSERT ON extinguishers BEGIN
+            INSERT INTO extinguishers_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_fts_delete AFTER DELETE ON extinguishers BEGIN
+            INSERT INTO extinguishers_fts (extinguishers_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_fts_update AFTER UPDATE OF {columns} ON extinguishers
+        WHEN {changed}
+        BEGIN
+            INSERT INTO extinguishers_fts (extinguishers_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+            INSERT INTO extinguishers_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+    rebuild_search_index(cursor)
+
+
+def _journal_data(row):
+    return "json_object(" + ", ".join(f"'{column}', {row}.{column}" for column in COLUMNS) + ")"
+
+
+def _migration_7(cursor):
+    # Append-only change journal for incremental sync. Triggers record every
+    # insert, update and delete with the row's values after the change (none
+    # for deletes) under an ever-increasing sequence number; AUTOINCREMENT
+    # keeps numbers from being reused even if the newest entries are removed.
+    # Each database also gets a random id so replicas can tell sources apart.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_journal (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            data TEXT,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_info (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO inventory_info (key, value) VALUES ('database_id', lower(hex(randomblob(16))))")
+
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_journal_insert AFTER INSERT ON extinguishers BEGIN
+            INSERT INTO change_journal (op, row_id, data) VALUES ('insert', NEW.id, {_journal_data("NEW")});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_journal_update AFTER UPDATE ON extinguishers
+        WHEN {changed}
+        BEGIN
+            INSERT INTO change_journal (op, row_id, data) VALUES ('update', NEW.id, {_journal_data("NEW")});
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS extinguishers_journal_delete AFTER DELETE ON extinguishers BEGIN
+            INSERT INTO change_journal (op, row_id) VALUES ('delete', OLD.id);
+        END
+    """)
+    # Existing rows start the journal, so a delta from 0 is a full copy
+    journal_inserts(cursor)
+
+
+# Columns stored as integer keys into small lookup tables of their distinct
+# values. Rows live in RECORDS; the extinguishers view decodes them back to
+# the original columns for reading.
+LOOKUP_TABLES = {"building": "buildings", "type": "extinguisher_types", "supplier": "suppliers"}
+# Offered by the entry forms whether or not any unit has them yet
+STANDARD_LOOKUPS = {"building": BUILDINGS, "type": TYPES}
+RECORDS = "extinguisher_records"
+
+
+def stored_column(column):
+    # The RECORDS column holding a view column
+    return f"{column}_id" if column in LOOKUP_TABLES else column
+
+
+def column_expression(column):
+    # A view column in queries over ROW_SOURCE
+    if column in LOOKUP_TABLES:
+        return f"{LOOKUP_TABLES[column]}.name"
+    return f"r.{column}"
+
+
+def lookup_id(column, value):
+    # SQL for the stored form of value (an SQL expression) in column: the
+    # lookup key for encoded columns, NULL for a name not in the table yet
+    if column in LOOKUP_TABLES:
+        return f"(SELECT id FROM {LOOKUP_TABLES[column]} WHERE name = {value})"
+    return value
+
+
+def row_source(columns=COLUMNS):
+    # RECORDS as r, joined to the lookup tables of the given columns only:
+    # SQLite does not drop unused LEFT JOINs by itself, so a COUNT(*) over
+    # every join would still look up each row's names
+    return f"{RECORDS} r" + "".join(f" LEFT JOIN {table} ON {table}.id = r.{column}_id"
+                                    for column, table in LOOKUP_TABLES.items() if column in columns)
+
+
+# Rows with their values decoded, as in the extinguishers view
+ROW_SOURCE = row_source()
+ROW_COLUMNS = ", ".join(f"{column_expression(column)} AS {column}" if column in LOOKUP_TABLES else f"r.{column}"
+                        for column in ("id",) + COLUMNS)
+# Stored columns and value placeholders for writing a whole record to RECORDS
+RECORD_COLUMNS = ", ".join(stored_column(column) for column in COLUMNS)
+RECORD_VALUES = ", ".join(lookup_id(column, "?") for column in COLUMNS)
+
+
+def add_lookup_values(cursor, record):
+    # Adds any new building, type or supplier in record (a tuple of COLUMNS)
+    # to its lookup table, so RECORD_VALUES can encode it
+    for column, value in zip(COLUMNS, record):
+        if column in LOOKUP_TABLES and value is not None:
+            cursor.execute(f"INSERT OR IGNORE INTO {LOOKUP_TABLES[column]} (name) VALUES (?)", (value,))
+
+
+def add_staged_lookup_values(cursor, table):
+    # The same for every row of a staging table with the view's columns
+    for column, lookup in LOOKUP_TABLES.items():
+        cursor.execute(f"INSERT OR IGNORE INTO {lookup} (name) SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+
+
+class LookupCache:
+    # The lookup tables held in memory for the entry forms' dropdowns. They
+    # are small and rarely change, so they are read once and re-read only
+    # after the database has changed: data_version moves when another
+    # connection commits, total_changes when this one writes.
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._version = None
+        self._values = {}
+
+    def _current(self):
+        version = (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+        if version != self._version:
+            self._values = {}
+            self._version = version
+        return self._values
+
+    def values(self, column):
+        # The standard buildings, types and weights and every other value
+        # some unit still has, in the order they were first added. Names no
+        # unit uses any more (a typo since corrected, a supplier whose last
+        # unit was deleted) stay in the lookup table but are not offered.
+        values = self._current()
+        if column not in values:
+            if column == "weight":
+                stored = [row[0] for row in self.conn.execute(
+                    "SELECT DISTINCT weight FROM tally_cube WHERE weight IS NOT NULL ORDER BY weight")]
+                values[column] = WEIGHTS + [weight for weight in stored if weight not in WEIGHTS]
+            else:
+                values[column] = [row[0] for row in self.conn.execute(f"""
+                    SELECT name FROM {LOOKUP_TABLES[column]}
+                    WHERE id IN (SELECT {column}_id FROM tally_cube) OR name IN (SELECT value FROM json_each(?))
+                    ORDER BY id
+                """, (json.dumps(STANDARD_LOOKUPS.get(column, [])),))]
+        return values[column]
+
+
+def _decoded(row, column):
+    # A trigger row's value as the view shows it
+    if column in LOOKUP_TABLES:
+        return f"(SELECT name FROM {LOOKUP_TABLES[column]} WHERE id = {row}.{column}_id)"
+    return f"{row}.{column}"
+
+
+def _migration_8(cursor):
+    # Dictionary-encode building, type and supplier: each distinct value is
+    # stored once in its lookup table and rows hold its integer key, which
+    # shrinks the rows and their indexes and lets the tally cube group on
+    # integers. The old table becomes the extinguishers view over the new
+    # one, so reads are unchanged; writes through the view are translated by
+    # INSTEAD OF triggers, while the app's own writers go to RECORDS directly.
+    for column, table in LOOKUP_TABLES.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    # The form defaults first, so they keep their order in the dropdowns
+    cursor.executemany("INSERT OR IGNORE INTO buildings (name) VALUES (?)", [(name,) for name in BUILDINGS])
+    cursor.executemany("INSERT OR IGNORE INTO extinguisher_types (name) VALUES (?)", [(name,) for name in TYPES])
+    for column, table in LOOKUP_TABLES.items():
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO {table} (name)
+            SELECT DISTINCT {column} FROM extinguishers WHERE {column} IS NOT NULL ORDER BY {column}
+        """)
+
+    cursor.execute(f'''
+        CREATE TABLE {RECORDS} (
+            id INTEGER PRIMARY KEY,
+            building_id INTEGER REFERENCES buildings (id),
+            room TEXT,
+            type_id INTEGER REFERENCES extinguisher_types (id),
+            weight REAL,
+            date_refilled TEXT,
+            date_expiration TEXT,
+            supplier_id INTEGER REFERENCES suppliers (id),
+            notes TEXT
+        )
+    ''')
+    cursor.execute(f"""
+        INSERT INTO {RECORDS} (id, {RECORD_COLUMNS})
+        SELECT e.id, {", ".join(lookup_id(column, "e." + column) for column in COLUMNS)}
+        FROM extinguishers e ORDER BY e.id
+    """)
+    # Takes the old table's indexes and triggers with it
+    cursor.execute("DROP TABLE extinguishers")
+
+    cursor.execute(f"CREATE VIEW extinguishers AS SELECT {ROW_COLUMNS} FROM {ROW_SOURCE}")
+    add_new = "\n".join(
+        f"INSERT OR IGNORE INTO {table} (name) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;"
+        for column, table in LOOKUP_TABLES.items())
+    new_values = ", ".join(lookup_id(column, "NEW." + column) for column in COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER extinguishers_insert INSTEAD OF INSERT ON extinguishers BEGIN
+            {add_new}
+            INSERT INTO {RECORDS} (id, {RECORD_COLUMNS}) VALUES (NEW.id, {new_values});
+        END
+    """)
+    assignments = ", ".join(f"{stored_column(column)} = {lookup_id(column, 'NEW.' + column)}" for column in COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER extinguishers_update INSTEAD OF UPDATE ON extinguishers BEGIN
+            {add_new}
+            UPDATE {RECORDS} SET id = NEW.id, {assignments} WHERE id = OLD.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER extinguishers_delete INSTEAD OF DELETE ON extinguishers BEGIN
+            DELETE FROM {RECORDS} WHERE id = OLD.id;
+        END
+    """)
+
+    # The indexes of migrations 2-4, on the stored columns
+    for name, columns in (("expiration", "date_expiration"), ("refilled", "date_refilled"),
+                          ("building_expiration", "building_id, date_expiration"),
+                          ("natural_key", "building_id, room, type_id"),
+                          ("building", "building_id"), ("room", "room"), ("type", "type_id"),
+                          ("weight", "weight"), ("supplier", "supplier_id")):
+        cursor.execute(f"CREATE INDEX idx_{RECORDS}_{name} ON {RECORDS} ({columns})")
+
+    # Tally cube keyed by the integer columns
+    cube = tuple(stored_column(column) for column in TALLY_COLUMNS.values())
+    cursor.execute("DROP TABLE tally_cube")
+    cursor.execute('''
+        CREATE TABLE tally_cube (
+            building_id INTEGER,
+            weight REAL,
+            type_id INTEGER,
+            supplier_id INTEGER,
+            count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(f"CREATE INDEX idx_tally_cube_key ON tally_cube ({', '.join(cube)})")
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_tally_insert AFTER INSERT ON {RECORDS} BEGIN
+            {_cube_increment("NEW", cube)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_tally_delete AFTER DELETE ON {RECORDS} BEGIN
+            {_cube_decrement("OLD", cube)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_tally_update AFTER UPDATE OF {", ".join(cube)} ON {RECORDS}
+        WHEN {" OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in cube)}
+        BEGIN
+            {_cube_decrement("OLD", cube)}
+            {_cube_increment("NEW", cube)}
+        END
+    """)
+    rebuild_tally_cube(cursor)
+
+    # The search index keeps its contents (same ids, same text) and now reads
+    # from the view; its triggers decode the keys
+    columns = ", ".join(SEARCH_COLUMNS)
+    new = ", ".join(_decoded("NEW", column) for column in SEARCH_COLUMNS)
+    old = ", ".join(_decoded("OLD", column) for column in SEARCH_COLUMNS)
+    stored = [stored_column(column) for column in SEARCH_COLUMNS]
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_fts_insert AFTER INSERT ON {RECORDS} BEGIN
+            INSERT INTO extinguishers_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_fts_delete AFTER DELETE ON {RECORDS} BEGIN
+            INSERT INTO extinguishers_fts (extinguishers_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_fts_update AFTER UPDATE OF {", ".join(stored)} ON {RECORDS}
+        WHEN {" OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in stored)}
+        BEGIN
+            INSERT INTO extinguishers_fts (extinguishers_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+            INSERT INTO extinguishers_fts (rowid, {columns}) VALUES (NEW.id, {new});
+        END
+    """)
+
+    # The journal still records decoded values, so deltas are unchanged
+    data = "json_object(" + ", ".join(f"'{column}', {_decoded('NEW', column)}" for column in COLUMNS) + ")"
+    changed = " OR ".join(f"OLD.{stored_column(column)} IS NOT NEW.{stored_column(column)}" for column in COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_journal_insert AFTER INSERT ON {RECORDS} BEGIN
+            INSERT INTO change_journal (op, row_id, data) VALUES ('insert', NEW.id, {data});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_journal_update AFTER UPDATE ON {RECORDS}
+        WHEN {changed}
+        BEGIN
+            INSERT INTO change_journal (op, row_id, data) VALUES ('update', NEW.id, {data});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_journal_delete AFTER DELETE ON {RECORDS} BEGIN
+            INSERT INTO change_journal (op, row_id) VALUES ('delete', OLD.id);
+        END
+    """)
+
+
+# Forecast cube: unit counts by building, type, supplier, weight, the month a
+# unit expires ("YYYY-MM") and its refill cycle, the months from refill to
+# expiration. A few tens of thousands of rows however large the inventory.
+FORECAST_COLUMNS = ("building_id", "type_id", "supplier_id", "weight", "expires", "cycle")
+
+
+def _forecast_values(row):
+    # The forecast cube key of a RECORDS row. Dates are stored as ISO text,
+    # so the month and the cycle come from substrings without date parsing.
+    # Legacy dates that never parsed give nonsense; the forecast ignores
+    # them (inventory_forecast.frame_from_rows).
+    expiration, refilled = f"{row}.date_expiration", f"{row}.date_refilled"
+    return [f"{row}.building_id", f"{row}.type_id", f"{row}.supplier_id", f"{row}.weight",
+            f"substr({expiration}, 1, 7)",
+            f"(substr({expiration}, 1, 4) - substr({refilled}, 1, 4)) * 12"
+            f" + substr({expiration}, 6, 2) - substr({refilled}, 6, 2)"]
+
+
+def _migration_9(cursor):
+    # Materialized forecast input, kept current by triggers like the tally
+    # cube, so forecasting reads one row per group instead of every unit
+    cursor.execute('''
+        CREATE TABLE forecast_cube (
+            building_id INTEGER,
+            type_id INTEGER,
+            supplier_id INTEGER,
+            weight REAL,
+            expires TEXT,
+            cycle INTEGER,
+            count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(f"CREATE INDEX idx_forecast_cube_key ON forecast_cube ({', '.join(FORECAST_COLUMNS)})")
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_forecast_insert AFTER INSERT ON {RECORDS} BEGIN
+            {_cube_increment("NEW", FORECAST_COLUMNS, "forecast_cube", _forecast_values("NEW"))}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_forecast_delete AFTER DELETE ON {RECORDS} BEGIN
+            {_cube_decrement("OLD", FORECAST_COLUMNS, "forecast_cube", _forecast_values("OLD"))}
+        END
+    """)
+    stored = ("building_id", "type_id", "supplier_id", "weight", "date_refilled", "date_expiration")
+    cursor.execute(f"""
+        CREATE TRIGGER {RECORDS}_forecast_update AFTER UPDATE OF {", ".join(stored)} ON {RECORDS}
+        WHEN {" OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in stored)}
+        BEGIN
+            {_cube_decrement("OLD", FORECAST_COLUMNS, "forecast_cube", _forecast_values("OLD"))}
+            {_cube_increment("NEW", FORECAST_COLUMNS, "forecast_cube", _forecast_values("NEW"))}
+        END
+    """)
+    rebuild_forecast_cube(cursor)
+
+
+# Schema history, oldest first. The schema version stored in the database
+# (PRAGMA user_version) is the number of entries already applied, so new
+# migrations must only ever be appended.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def shared_memory_path():
+    # A named in-memory database that other connections in this process (e.g.
+    # a background worker) can open too. It lives while any connection to it
+    # is open. Readers skip shared-cache table locks so they never block on a
+    # writer; concurrent writers can still see "database table is locked".
+    return f"file:fire-inventory-{os.getpid()}-{next(_memory_databases)}?mode=memory&cache=shared"
+
+
+def connect(path=DEFAULT_DB_PATH, pragmas=None, check_same_thread=True, factory=sqlite3.Connection):
+    in_memory = path == MEMORY or "mode=memory" in path
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread, uri=path.startswith("file:"), factory=factory)
+    if in_memory:
+        conn.execute("PRAGMA read_uncommitted=1")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    settings = dict(PRAGMAS)
+    settings.update(pragmas or {})
+    for name, value in settings.items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+    migrate(conn)
+    return conn
+
+
+def connect_read_only(path):
+    # Reads a database file in place, e.g. another site's inventory: nothing
+    # is migrated or written, not even the journal mode, so only a database
+    # already at this app's schema version can be read
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such database: {path}")
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+    try:
+        for name in ("cache_size", "mmap_size", "temp_store", "busy_timeout"):
+            conn.execute(f"PRAGMA {name}={PRAGMAS[name]}")
+        # Also tells close() not to run PRAGMA optimize, which writes
+        conn.execute("PRAGMA query_only=ON")
+        version = schema_version(conn)
+        if version != SCHEMA_VERSION:
+            raise RuntimeError(f"{path} has schema version {version}, not {SCHEMA_VERSION}; "
+                               f"open it once with this version of the app to upgrade it")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this app supports ({SCHEMA_VERSION})")
+
+    # Each migration runs in its own transaction together with the version bump,
+    # so an interrupted upgrade resumes from the last completed step.
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version={number}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+
+def close(conn):
+    # Let SQLite refresh planner statistics for tables whose indexes were used
+    # heavily this session; it is a no-op most of the time. A read-only
+    # connection (connect_read_only) can't store them and is just closed.
+    try:
+        if not conn.execute("PRAGMA query_only").fetchone()[0]:
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+
+# Single-row writes commit straight away unless commit=False, which lets a
+# caller group many of them into one transaction. Updates and deletes return
+# the number of rows changed (0 for an unknown id).
+def insert_extinguisher(conn, record, commit=True):
+    record = normalize_record(record)
+    cursor = conn.cursor()
+    add_lookup_values(cursor, record)
+    cursor.execute(f"INSERT INTO {RECORDS} ({RECORD_COLUMNS}) VALUES ({RECORD_VALUES})", record)
+    if commit:
+        conn.commit()
+    return cursor.lastrowid
+
+
+def update_extinguisher(conn, row_id, record, commit=True):
+    record = normalize_record(record)
+    cursor = conn.cursor()
+    add_lookup_values(cursor, record)
+    cursor.execute(f"UPDATE {RECORDS} SET ({RECORD_COLUMNS}) = ({RECORD_VALUES}) WHERE id = ?", record + (row_id,))
+    if commit:
+        conn.commit()
+    return cursor.rowcount
+
+
+def delete_extinguisher(conn, row_id, commit=True):
+    cursor = conn.execute(f"DELETE FROM {RECORDS} WHERE id = ?", (row_id,))
+    if commit:
+        conn.commit()
+    return cursor.rowcount
+
+
+# Rows written per executemany() call by bulk changes; progress is reported
+# and cancellation checked between chunks, all inside one transaction
+BULK_CHUNK = 5000
+
+
+def normalize_fields(fields):
+    # {column: value} for a bulk edit, normalized like normalize_record()
+    normalized = {}
+    for column, value in fields.items():
+        if column not in COLUMNS:
+            raise ValueError(f"Cannot edit column {column!r}")
+        if column == "weight":
+            value = normalize_weight(value)
+        elif column in ("date_refilled", "date_expiration"):
+            value = normalize_date(value)
+        normalized[column] = value
+    return normalized
+
+
+class BulkChange:
+    # One committed bulk edit or delete: the rows as they were before it and
+    # the journal range it wrote, first to seq, which is everything undo
+    # needs. undone lists the (first, last) journal ranges of later changes
+    # that have been undone since, and of their undos; together they put the
+    # rows back as this change left them.
+
+    def __init__(self, op, description, rows, first, seq):
+        self.op = op
+        self.description = description
+        self.rows = rows
+        self.first = first
+        self.seq = seq
+        self.undone = []
+
+    @property
+    def ids(self):
+        return [row[0] for row in self.rows]
+
+
+def _bulk_write(conn, sql, prepare, progress):
+    # Runs sql for every parameter tuple prepare(cursor) returns, all in one
+    # write transaction that prepare runs inside too, so what it reads cannot
+    # change before the write. progress(done, total) may raise to cancel,
+    # which rolls the whole batch back. Returns the (first, last) journal
+    # seq the write took up.
+    cursor = conn.cursor()
+    last_seq = "SELECT COALESCE(MAX(seq), 0) FROM change_journal"
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        first = cursor.execute(last_seq).fetchone()[0] + 1
+        params = prepare(cursor)
+        for start in range(0, len(params), BULK_CHUNK):
+            cursor.executemany(sql, params[start:start + BULK_CHUNK])
+            if progress:
+                progress(min(start + BULK_CHUNK, len(params)), len(params))
+        last = cursor.execute(last_seq).fetchone()[0]
+        cursor.execute("COMMIT")
+    except BaseException:
+        # BEGIN itself may have failed, e.g. on a locked database
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    return first, last
+
+
+def _rows_by_id(cursor, ids):
+    return cursor.execute("SELECT * FROM extinguishers WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+                          (json.dumps(list(ids)),)).fetchall()
+
+
+def bulk_update(conn, ids, fields, progress=None):
+    # Sets the same fields on every row in ids; returns a BulkChange for undo
+    fields = normalize_fields(fields)
+    if not fields:
+        raise ValueError("No fields to change")
+    values = tuple(fields.values())
+    assignments = ", ".join(f"{stored_column(column)} = {lookup_id(column, '?')}" for column in fields)
+    rows = []
+
+    def prepare(cursor):
+        rows.extend(_rows_by_id(cursor, ids))
+        add_lookup_values(cursor, [fields.get(column) for column in COLUMNS])
+        return [values + (row[0],) for row in rows]
+
+    first, seq = _bulk_write(conn, f"UPDATE {RECORDS} SET {assignments} WHERE id = ?", prepare, progress)
+    return BulkChange("update", f"Edit {len(rows):,} extinguishers", rows, first, seq)
+
+
+def bulk_delete(conn, ids, progress=None):
+    rows = []
+
+    def prepare(cursor):
+        rows.extend(_rows_by_id(cursor, ids))
+        return [(row[0],) for row in rows]
+
+    first, seq = _bulk_write(conn, f"DELETE FROM {RECORDS} WHERE id = ?", prepare, progress)
+    return BulkChange("delete", f"Delete {len(rows):,} extinguishers", rows, first, seq)
+
+
+def undo_bulk_change(conn, change, progress=None):
+    # Puts the rows back as they were before the change. Refused if any of
+    # them has been edited, deleted or re-used since, as the journal shows,
+    # so an undo never overwrites later work; the change's undone ranges
+    # don't count. Returns the journal ranges of the change and of the undo,
+    # which cancel out, for the undone lists of earlier changes.
+    if change.op == "delete":
+        sql = f"INSERT INTO {RECORDS} (id, {RECORD_COLUMNS}) VALUES (?, {RECORD_VALUES})"
+        params = [tuple(row) for row in change.rows]
+    else:
+        sql = f"UPDATE {RECORDS} SET ({RECORD_COLUMNS}) = ({RECORD_VALUES}) WHERE id = ?"
+        params = [tuple(row[1:]) + (row[0],) for row in change.rows]
+
+    def prepare(cursor):
+        changed = cursor.execute('''
+            SELECT COUNT(DISTINCT row_id) FROM change_journal
+            WHERE seq > ? AND row_id IN (SELECT value FROM json_each(?))
+              AND NOT EXISTS (SELECT 1 FROM json_each(?) r
+                              WHERE seq BETWEEN json_extract(r.value, '$[0]') AND json_extract(r.value, '$[1]'))
+        ''', (change.seq, json.dumps(change.ids), json.dumps(change.undone))).fetchone()[0]
+        if changed:
+            raise ValueError(f"Cannot undo \"{change.description}\": {changed:,} of its rows have changed since")
+        # Lookup values are never removed, so every name the rows had still encodes
+        return params
+
+    return [(change.first, change.seq), _bulk_write(conn, sql, prepare, progress)]
+
+
+def rebuild_tally_cube(cursor):
+    # Recomputes the cube from scratch; the triggers keep it current after that
+    columns = ", ".join(stored_column(column) for column in TALLY_COLUMNS.values())
+    cursor.execute("DELETE FROM tally_cube")
+    cursor.execute(f"INSERT INTO tally_cube ({columns}, count) SELECT {columns}, COUNT(*) FROM {RECORDS} GROUP BY {columns}")
+
+
+def rebuild_forecast_cube(cursor):
+    columns = ", ".join(FORECAST_COLUMNS)
+    cursor.execute("DELETE FROM forecast_cube")
+    cursor.execute(f"""
+        INSERT INTO forecast_cube ({columns}, count)
+        SELECT {", ".join(_forecast_values("r"))}, COUNT(*) FROM {RECORDS} r GROUP BY {", ".join(_forecast_values("r"))}
+    """)
+
+
+def rebuild_search_index(cursor):
+    cursor.execute("INSERT INTO extinguishers_fts (extinguishers_fts) VALUES ('rebuild')")
+
+
+def journal_inserts(cursor):
+    # Journals every row as an insert, for rows that were loaded with the
+    # journal triggers off (the migration, or a bulk import into an empty table)
+    cursor.execute(f"""
+        INSERT INTO change_journal (op, row_id, data)
+        SELECT 'insert', id, {_journal_data("extinguishers")} FROM extinguishers ORDER BY id
+    """)
+
+
+def database_id(conn):
+    return conn.execute("SELECT value FROM inventory_info WHERE key = 'database_id'").fetchone()[0]
+
+
+def search_expression(text):
+    # Turns what the user typed into an FTS5 query: every word must match the
+    # start of a word in building, room, supplier or notes. None if there is
+    # nothing to search for.
+    words = re.findall(r"[^\W_]+", text or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_extinguishers(conn, text, limit=100):
+    # Best matches first, by FTS5's bm25 relevance
+    expression = search_expression(text)
+    if expression is None:
+        return []
+    # Ranked and cut to the limit inside the index, so only the returned
+    # rows are joined to their names
+    return conn.execute('''
+        SELECT e.* FROM (
+            SELECT rowid, rank FROM extinguishers_fts WHERE extinguishers_fts MATCH ? ORDER BY rank, rowid LIMIT ?
+        ) f JOIN extinguishers e ON e.id = f.rowid
+        ORDER BY f.rank, e.id
+    ''', (expression, limit)).fetchall()
+
+
+def tally_cube_rows(conn):
+    # (building, weight, type, supplier, count) for every tally cube row.
+    # Grouped on the integer keys; names are joined on for the few cube rows.
+    decoded = ", ".join(f"{LOOKUP_TABLES[column]}.name" if column in LOOKUP_TABLES else f"c.{column}"
+                        for column in TALLY_COLUMNS.values())
+    joins = " ".join(f"LEFT JOIN {table} ON {table}.id = c.{column}_id" for column, table in LOOKUP_TABLES.items())
+    return conn.execute(f"SELECT {decoded}, c.count FROM tally_cube c {joins}").fetchall()
+
+
+def tally(conn, categories):
+    return tally_rows(tally_cube_rows(conn), categories)
+
+
+def tally_rows(rows, categories):
+    # Counts for every grouping level of the chosen categories (each single
+    # category, every combination of them, and the grand total under ()),
+    # like GROUP BY GROUPING SETS, computed in one pass over cube rows; rows
+    # from several inventories' cubes add up.
+    # Returns {categories tuple: [(value, ..., count), ...]} ordered by count.
+    positions = [list(TALLY_COLUMNS).index(category) for category in categories]
+    levels = [tuple(c for i, c in enumerate(categories) if mask >> i & 1) for mask in range(1 << len(categories))]
+    level_positions = [[positions[categories.index(c)] for c in level] for level in levels]
+    totals = [{} for _ in levels]
+
+    for row in rows:
+        count = row[4]
+        for counts, cols in zip(totals, level_positions):
+            key = tuple(row[p] for p in cols)
+            counts[key] = counts.get(key, 0) + count
+
+    return {level: sorted((key + (count,) for key, count in counts.items()), key=lambda r: (-r[-1], str(r[:-1])))
+            for level, counts in zip(levels, totals)}
+
+
+# Expiry buckets: "overdue" is everything already past its expiration date,
+# "upcoming" is today through today + horizon_days. Both are range scans on the
+# expiration index (or on building + expiration when filtered by building).
+EXPIRY_BUCKETS = ("overdue", "upcoming")
+
+
+def _expiry_range(bucket, horizon_days, today):
+    today = today or date.today()
+    if bucket == "overdue":
+        return ["date_expiration < ?"], [today.isoformat()]
+    if bucket == "upcoming":
+        return ["date_expiration BETWEEN ? AND ?"], [today.isoformat(), (today + timedelta(days=horizon_days)).isoformat()]
+    raise ValueError(f"Unknown expiry bucket: {bucket!r}")
+
+
+def expiring_query(bucket, horizon_days=30, building=None, today=None, columns="*"):
+    clauses, params = _expiry_range(bucket, horizon_days, today)
+    if building:
+        clauses.append("building = ?")
+        params.append(building)
+
+    sql = f"SELECT {columns} FROM extinguishers WHERE {' AND '.join(clauses)} ORDER BY date_expiration, id"
+    return sql, params
+
+
+def expiring_counts(conn, horizon_days=30, today=None):
+    # {bucket: [(building, count)]}, counted on the stored building keys with
+    # the covering building + expiration index instead of through the view
+    counts = {}
+    for bucket in EXPIRY_BUCKETS:
+        clauses, params = _expiry_range(bucket, horizon_days, today)
+        counts[bucket] = conn.execute(f"""
+            SELECT buildings.name, COUNT(*) FROM {row_source(("building",))}
+            WHERE {" AND ".join(clauses)} GROUP BY r.building_id
+        """, params).fetchall()
+    return counts
+
+
+def expiring_extinguishers(conn, horizon_days=30, building=None, today=None, include_overdue=True):
+    buckets = EXPIRY_BUCKETS if include_overdue else ("upcoming",)
+    return {bucket: conn.execute(*expiring_query(bucket, horizon_days, building, today)).fetchall()
+            for bucket in buckets}
+
+
+class InventoryPager:
+    # Keyset pagination over the extinguishers for the inventory view.
+    # Pages are addressed by the (sort value, id) key of a neighbouring row, so
+    # fetching the next or previous window costs the same at any depth.
+    # Filters and the full-text search are pushed into the WHERE clause. While
+    # searching, sort_column RANK orders by relevance instead: the best
+    # SEARCH_LIMIT matches are ranked once and paged by position. Queries go
+    # to RECORDS rather than the view, joining only the lookup tables they
+    # need, so that lookup columns can be read by their stored keys.
+
+    SORTABLE = ("id",) + COLUMNS
+    RANK = "rank"
+    SEARCH_LIMIT = 1000
+    # Filters are equality matches, except these which match a prefix
+    PREFIX_FILTERS = ("room",)
+
+    def __init__(self, conn, sort_column="id", descending=False):
+        self.conn = conn
+        self.sort_column = sort_column
+        self.descending = descending
+        self.filters = {}
+        self.search = None
+        self._count = None
+        self._ranking = None
+
+    @property
+    def ranked(self):
+        return self.sort_column == self.RANK
+
+    def set_sort(self, column, descending=False):
+        if column not in self.SORTABLE and not (column == self.RANK and self.search):
+            raise ValueError(f"Cannot sort by {column!r}")
+        self.sort_column = column
+        self.descending = descending
+        self.invalidate()
+
+    def set_filters(self, **filters):
+        for column in filters:
+            if column not in COLUMNS:
+                raise ValueError(f"Cannot filter by {column!r}")
+        self.filters = {column: value for column, value in filters.items() if value not in (None, "")}
+        self.invalidate()
+
+    def set_search(self, text):
+        self.search = search_expression(text)
+        if self.search is None and self.ranked:
+            self.sort_column, self.descending = "id", False
+        self.invalidate()
+
+    def invalidate(self):
+        self._count = None
+        self._ranking = None
+
+    def ranking(self):
+        # Ids of the best matches in relevance order, mapped to their position
+        if self._ranking is None:
+            clauses, params = self.where(search=False)
+            sql = "SELECT rowid FROM extinguishers_fts WHERE extinguishers_fts MATCH ?"
+            if clauses:
+                sql += f" AND rowid IN (SELECT r.id FROM {row_source(self.filters)} WHERE " + " AND ".join(clauses) + ")"
+            sql += " ORDER BY rank, rowid LIMIT ?"
+            ids = [row[0] for row in self.conn.execute(sql, [self.search] + params + [self.SEARCH_LIMIT])]
+            self._ranking = {row_id: position for position, row_id in enumerate(ids)}
+        return self._ranking
+
+    def where(self, search=True):
+        clauses, params = [], []
+        if search and self.search:
+            clauses.append("r.id IN (SELECT rowid FROM extinguishers_fts WHERE extinguishers_fts MATCH ?)")
+            params.append(self.search)
+        for column, value in self.filters.items():
+            if column in self.PREFIX_FILTERS:
+                clauses.append(f"{column_expression(column)} LIKE ? ESCAPE '\\'")
+                params.append(str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+            else:
+                clauses.append(f"{column_expression(column)} = ?")
+                params.append(value)
+        return clauses, params
+
+    def count(self):
+        if self._count is None and self.ranked:
+            self._count = len(self.ranking())
+        if self._count is None:
+            clauses, params = self.where()
+            sql = f"SELECT COUNT(*) FROM {row_source(self.filters)}"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            self._count = self.conn.execute(sql, params).fetchone()[0]
+        return self._count
+
+    def ids(self):
+        # Every row id in the view, e.g. for a bulk change to all filtered rows
+        if self.ranked:
+            return list(self.ranking())
+        clauses, params = self.where()
+        sql = f"SELECT r.id FROM {row_source(self.filters)}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def key(self, row):
+        # The keyset position of a row as returned by fetch_*
+        if self.ranked:
+            return (self.ranking().get(row[0], len(self.ranking())), row[0])
+        return (row[self.SORTABLE.index(self.sort_column)], row[0])
+
+    def _segments(self, key, ascending, inclusive):
+        # The rows past a key as a list of WHERE fragments to read in order:
+        # the rest of the key's own sort value, then the following values, and
+        # the NULL block (which SQLite sorts first) where it falls. Keeping each
+        # segment a single range lets the sort index seek straight to it.
+        column = self.sort_column
+        op = (">" if ascending else "<") + ("=" if inclusive else "")
+        if column in LOOKUP_TABLES:
+            return self._lookup_segments(key, ascending, op)
+        if key is None:
+            return [([], [])]
+
+        value, row_id = key
+        if column == "id":
+            return [([f"r.id {op} ?"], [row_id])]
+        if value is None:
+            segments = [([f"r.{column} IS NULL", f"r.id {op} ?"], [row_id])]
+            if ascending:
+                segments.append(([f"r.{column} IS NOT NULL"], []))
+            return segments
+
+        segments = [
+            ([f"r.{column} = ?", f"r.id {op} ?"], [value, row_id]),
+            ([f"r.{column} {op[0]} ?"], [value]),
+        ]
+        if not ascending:
+            segments.append(([f"r.{column} IS NULL"], []))
+        return segments
+
+    def _lookup_blocks(self, ascending):
+        # [(stored key, name)] of every value of a lookup sort column in sort
+        # order, the NULL block first ascending and last descending
+        table = LOOKUP_TABLES[self.sort_column]
+        blocks = [(None, None)] + self.conn.execute(f"SELECT id, name FROM {table} ORDER BY name").fetchall()
+        return blocks if ascending else blocks[::-1]
+
+    def _block(self, stored_id):
+        if stored_id is None:
+            return [f"r.{self.sort_column}_id IS NULL"], []
+        return [f"r.{self.sort_column}_id = ?"], [stored_id]
+
+    def _lookup_segments(self, key, ascending, op):
+        # A lookup column is read one name at a time, each name a walk of its
+        # (stored key, id) index in id order. The lookup tables are small, and
+        # SQLite would otherwise join every row to its name and sort them all.
+        blocks = self._lookup_blocks(ascending)
+        if key is None:
+            return [self._block(stored_id) for stored_id, _ in blocks]
+        value, row_id = key
+        start = [name for _, name in blocks].index(value)
+        clauses, params = self._block(blocks[start][0])
+        return [(clauses + [f"r.id {op} ?"], params + [row_id])] + [self._block(stored_id) for stored_id, _ in blocks[start + 1:]]
+
+    def _query(self, extra_clauses, extra_params, ascending, limit, columns=ROW_COLUMNS, source=ROW_SOURCE):
+        clauses, params = self.where()
+        direction = "ASC" if ascending else "DESC"
+        column = self.sort_column
+        if column == "id" or column in LOOKUP_TABLES:
+            # Lookup segments each hold a single name
+            order = f"r.id {direction}"
+        else:
+            order = f"r.{column} {direction}, r.id {direction}"
+        sql = f"SELECT {columns} FROM {source}"
+        if clauses or extra_clauses:
+            sql += " WHERE " + " AND ".join(clauses + extra_clauses)
+        sql += f" ORDER BY {order} LIMIT ?"
+        return sql, params + extra_params + [limit]
+
+    def _fetch(self, key, forward, inclusive, limit):
+        # Walking "forward" means in display order; going back reverses both
+        # the comparison and the ORDER BY
+        if self.ranked:
+            return self._fetch_ranked(key, forward, inclusive, limit)
+        ascending = forward != self.descending
+        rows = []
+        for extra_clauses, extra_params in self._segments(key, ascending, inclusive):
+            rows += self.conn.execute(*self._query(extra_clauses, extra_params, ascending, limit - len(rows))).fetchall()
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def _fetch_ranked(self, key, forward, inclusive, limit):
+        ids = list(self.ranking())
+        position = key[0] if key else (0 if forward else len(ids))
+        if forward:
+            start = position if inclusive else position + 1
+            chosen = ids[start:start + limit]
+        else:
+            chosen = ids[max(0, position - limit):position][::-1]
+        rows = {row[0]: row for row in self.fetch_ids(chosen)}
+        return [rows[row_id] for row_id in chosen if row_id in rows]
+
+    def fetch_after(self, key, limit, inclusive=False):
+        return self._fetch(key, True, inclusive, limit)
+
+    def fetch_before(self, key, limit):
+        rows = self._fetch(key, False, False, limit)
+        rows.reverse()
+        return rows
+
+    def key_at(self, offset):
+        # Only used to jump (e.g. dragging the scrollbar): the OFFSET walk reads
+        # just the sort index, then the page itself is fetched by key
+        if self.ranked:
+            ids = list(self.ranking())
+            return (offset, ids[offset]) if 0 <= offset < len(ids) else None
+        column = self.sort_column
+        ascending = not self.descending
+        source = row_source(self.filters)
+        offset = max(offset, 0)
+        if column not in LOOKUP_TABLES:
+            sql, params = self._query([], [], ascending, 1, columns=f"r.{column}, r.id", source=source)
+            row = self.conn.execute(sql + " OFFSET ?", params + [offset]).fetchone()
+            return tuple(row) if row else None
+
+        # Lookup columns: names before the offset are skipped by their row
+        # counts, then the OFFSET walk runs within one name. Unfiltered, the
+        # counts are already in the tally cube.
+        clauses, params = self.where()
+        sizes = None
+        if not clauses:
+            sizes = dict(self.conn.execute(f"SELECT {column}_id, SUM(count) FROM tally_cube GROUP BY {column}_id").fetchall())
+        for stored_id, name in self._lookup_blocks(ascending):
+            block_clauses, block_params = self._block(stored_id)
+            if sizes is not None:
+                size = sizes.get(stored_id, 0)
+            else:
+                sql = f"SELECT COUNT(*) FROM {source} WHERE " + " AND ".join(clauses + block_clauses)
+                size = self.conn.execute(sql, params + block_params).fetchone()[0]
+            if offset < size:
+                sql, params = self._query(block_clauses, block_params, ascending, 1, columns="r.id", source=source)
+                return (name, self.conn.execute(sql + " OFFSET ?", params + [offset]).fetchone()[0])
+            offset -= size
+        return None
+
+    def fetch_at(self, offset, limit):
+        key = self.key_at(offset)
+        return self.fetch_after(key, limit, inclusive=True) if key else []
+
+    def fetch_ids(self, ids):
+        # The given rows as they are now, limited to those passing the filters
+        clauses, params = self.where()
+        rows = []
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            sql = f"SELECT {ROW_COLUMNS} FROM {ROW_SOURCE} WHERE r.id IN ({', '.join('?' * len(chunk))})"
+            if clauses:
+                sql += " AND " + " AND ".join(clauses)
+            rows += self.conn.execute(sql, chunk + params).fetchall()
+        return rows
+
+    def sort_key(self, row):
+        # Python equivalent of the SQL ordering, for placing a single changed
+        # row among cached ones: NULL < numbers < text, ties broken by id
+        value, row_id = self.key(row)
+        if self.ranked:
+            return (value, row_id)
+        if value is None:
+            rank = 0
+        elif isinstance(value, (int, float)):
+            rank = 1
+        else:
+            rank = 2
+        return (rank, value if value is not None else 0, row_id)
@@ -0,0 +1,211 @@
+import collections
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import inventory_db
+
+# Statements slower than this (execute plus fetching their rows) are kept in
+# the slow-query log
+DEFAULT_SLOW_MS = float(os.environ.get("FIRE_INVENTORY_SLOW_MS", "100"))
+SLOW_LOG_SIZE = 200
+# Distinct statements tracked; anything past this is counted under OTHER
+MAX_STATEMENTS = 500
+OTHER = "(other statements)"
+
+
+class Diagnostics:
+    # Timings collected from every instrumented connection and from UI
+    # operations. Shared by the Tk thread and the database worker, so all
+    # updates go through one lock.
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS):
+        self.slow_ms = slow_ms
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # sql -> [count, seconds, max seconds, rows]
+            self.statements = {}
+            # name -> [count, seconds, max seconds, last seconds, rows]
+            self.operations = {}
+            self.slow_queries = collections.deque(maxlen=SLOW_LOG_SIZE)
+
+    def statement(self, sql):
+        # The stats list for a statement, counted as one more execution
+        key = " ".join(sql.split())
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    key = OTHER
+                stats = self.statements.setdefault(key, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+        return key, stats
+
+    def add_statement_time(self, stats, seconds, rows=0):
+        with self.lock:
+            stats[1] += seconds
+            stats[3] += rows
+
+    def finish_statement(self, key, stats, seconds, rows, slow):
+        # Called as a run's fetching goes on with its running totals; the
+        # slow-query entry is created once and kept up to date after that
+        with self.lock:
+            stats[2] = max(stats[2], seconds)
+            if slow is None and seconds * 1000 >= self.slow_ms:
+                slow = {"time": datetime.now().isoformat(timespec="seconds"), "ms": 0.0, "rows": 0,
+                        "thread": threading.current_thread().name, "sql": key}
+                self.slow_queries.append(slow)
+            if slow is not None:
+                slow["ms"] = round(seconds * 1000, 3)
+                slow["rows"] = rows
+        return slow
+
+    def record_operation(self, name, seconds, rows=None):
+        with self.lock:
+            stats = self.operations.setdefault(name, [0, 0.0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] = seconds
+            stats[4] += rows or 0
+
+    @contextlib.contextmanager
+    def operation(self, name):
+        # with diagnostics.operation("refresh") as op: ...; op["rows"] = n
+        op = {"rows": None}
+        start = time.perf_counter()
+        try:
+            yield op
+        finally:
+            self.record_operation(name, time.perf_counter() - start, op["rows"])
+
+    def snapshot(self):
+        with self.lock:
+            statements = [{"sql": sql, "count": count, "total_ms": round(total * 1000, 3),
+                           "avg_ms": round(total * 1000 / count, 3) if count else 0.0,
+                           "max_ms": round(worst * 1000, 3), "rows": rows}
+                          for sql, (count, total, worst, rows) in self.statements.items()]
+            operations = [{"name": name, "count": count, "total_ms": round(total * 1000, 3),
+                           "avg_ms": round(total * 1000 / count, 3) if count else 0.0,
+                           "max_ms": round(worst * 1000, 3), "last_ms": round(last * 1000, 3), "rows": rows}
+                          for name, (count, total, worst, last, rows) in self.operations.items()]
+            slow = [dict(entry) for entry in self.slow_queries]
+        statements.sort(key=lambda s: -s["total_ms"])
+        operations.sort(key=lambda o: o["name"])
+        return {
+            "collected_since": self.started.isoformat(timespec="seconds"),
+            "slow_ms": self.slow_ms,
+            "operations": operations,
+            "statements": statements,
+            "slow_queries": slow,
+        }
+
+    def export_json(self, path, extra=None):
+        data = self.snapshot()
+        data.update(extra or {})
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute() and the fetch calls that follow it, so a SELECT is
+    # charged for the rows it produces, not just its first step. Iterating
+    # the cursor directly is not timed; the app's bulk reads use fetchmany.
+
+    _stats = None
+
+    def _start(self, sql, run):
+        diagnostics = self.connection.diagnostics
+        if diagnostics is None:
+            return run()
+        self._key, self._stats = diagnostics.statement(sql)
+        self._elapsed = 0.0
+        self._rows = 0
+        self._slow = None
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            self._record(time.perf_counter() - start, 0)
+
+    def _record(self, seconds, rows):
+        diagnostics = self.connection.diagnostics
+        self._elapsed += seconds
+        self._rows += rows
+        diagnostics.add_statement_time(self._stats, seconds, rows)
+        self._slow = diagnostics.finish_statement(self._key, self._stats, self._elapsed, self._rows, self._slow)
+
+    def _fetch(self, fetch, *args):
+        if self._stats is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        result = fetch(*args)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        self._record(time.perf_counter() - start, rows)
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._start(sql, lambda: super(InstrumentedCursor, self).execute(sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._start(sql, lambda: super(InstrumentedCursor, self).executemany(sql, seq_of_parameters))
+
+    def executescript(self, sql_script):
+        return self._start(sql_script, lambda: super(InstrumentedCursor, self).executescript(sql_script))
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() would otherwise run on a plain C cursor and skip
+    # the timing, so the shortcuts go through an InstrumentedCursor too
+
+    # Set once connected; statements before that (pragmas, migrations) are not timed
+    diagnostics = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(path, diagnostics, **kwargs):
+    # inventory_db.connect() with every statement timed into diagnostics
+    conn = inventory_db.connect(path, factory=InstrumentedConnection, **kwargs)
+    conn.diagnostics = diagnostics
+    return conn
+
+
+def database_summary(conn, path):
+    # Row count and file size for the Diagnostics tab and JSON export
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return {
+        "database": path,
+        "rows": conn.execute("SELECT COUNT(*) FROM extinguishers").fetchone()[0],
+        "size_bytes": page_count * page_size,
+        "schema_version": inventory_db.schema_version(conn),
+        "sqlite_version": sqlite3.sqlite_version,
+    }
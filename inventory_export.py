@@ -0,0 +1,229 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+from datetime import date
+
+import inventory_db
+
+# Optional: zstd-compressed CSV needs zstandard, Parquet and Arrow need pyarrow
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows are pulled from the cursor this many at a time, so an export never
+# holds more than one batch (one row group for columnar files) in memory
+FETCH_SIZE = 5000
+# Rows per Parquet row group / Arrow record batch; bigger groups compress and
+# scan better when the file is read back
+ROW_GROUP_SIZE = 128 * 1024
+
+EXPORT_COLUMNS = ("id",) + inventory_db.COLUMNS
+# CSV headings; the same ones the importer recognises, so exports round-trip
+HEADINGS = {
+    "id": "ID",
+    "building": "Building",
+    "room": "Room",
+    "type": "Type",
+    "weight": "Weight",
+    "date_refilled": "Date Refilled",
+    "date_expiration": "Expiration Date",
+    "supplier": "Supplier",
+    "notes": "Notes",
+}
+DATE_COLUMNS = ("date_refilled", "date_expiration")
+
+# Longest suffix first so "x.csv.gz" is not taken for plain CSV
+FORMATS = {
+    "csv.gz": "csv.gz",
+    "csv.zst": "csv.zst",
+    "csv": "csv",
+    "parquet": "parquet",
+    "arrow": "arrow",
+    "feather": "arrow",
+}
+
+
+def format_for_path(path):
+    name = os.path.basename(path).lower()
+    for suffix, fmt in FORMATS.items():
+        if name.endswith("." + suffix):
+            return fmt
+    return "csv"
+
+
+def export_queries(columns=None, building=None, expiring_within=None, include_overdue=False, today=None):
+    # The SELECTs for an export, in output order. Expiring exports reuse the
+    # report's range scans on the expiration index.
+    columns = list(columns or EXPORT_COLUMNS)
+    for column in columns:
+        if column not in EXPORT_COLUMNS:
+            raise ValueError(f"Cannot export column {column!r}")
+    projection = ", ".join(columns)
+
+    if expiring_within is not None:
+        buckets = inventory_db.EXPIRY_BUCKETS if include_overdue else ("upcoming",)
+        return columns, [inventory_db.expiring_query(bucket, expiring_within, building, today, columns=projection)
+                         for bucket in buckets]
+
+    sql, params = f"SELECT {projection} FROM extinguishers", []
+    if building:
+        sql += " WHERE building = ?"
+        params.append(building)
+    return columns, [(sql + " ORDER BY id", params)]
+
+
+def iter_batches(conn, queries, size=FETCH_SIZE):
+    for sql, params in queries:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+
+
+def _count(conn, queries):
+    return sum(conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0] for sql, params in queries)
+
+
+def _open_text(path, fmt):
+    if fmt == "csv.gz":
+        return gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6)
+    if fmt == "csv.zst":
+        if zstandard is None:
+            raise RuntimeError("Exporting .csv.zst needs the zstandard package (pip install zstandard)")
+        stream = zstandard.ZstdCompressor(level=6).stream_writer(open(path, "wb"), closefd=True)
+        return io.TextIOWrapper(stream, newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def write_csv(batches, path, fmt, columns, progress):
+    with _open_text(path, fmt) as file:
+        writer = csv.writer(file)
+        writer.writerow([HEADINGS[column] for column in columns])
+        for rows in batches:
+            writer.writerows(rows)
+            progress(len(rows))
+
+
+def _to_date(value):
+    # Dates are stored as ISO text; anything the date migration could not
+    # parse is exported as null rather than failing the whole export
+    try:
+        return date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def arrow_schema(columns):
+    types = {"id": pyarrow.int64(), "weight": pyarrow.float64()}
+    types.update({column: pyarrow.date32() for column in DATE_COLUMNS})
+    return pyarrow.schema([(column, types.get(column, pyarrow.string())) for column in columns])
+
+
+def _record_batch(rows, schema):
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if field.name in DATE_COLUMNS:
+            values = [_to_date(value) for value in values]
+        elif field.name == "weight":
+            # Weights typed into the old forms may still be stored as text
+            values = [_to_float(value) for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_columnar(batches, path, fmt, columns, progress):
+    if pyarrow is None:
+        raise RuntimeError(f"Exporting .{fmt} needs the pyarrow package (pip install pyarrow)")
+    schema = arrow_schema(columns)
+    if fmt == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema, compression="zstd")
+        write = writer.write_table
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        writer = pyarrow.ipc.new_file(path, schema, options=options)
+        write = writer.write_table
+
+    with writer:
+        group, size = [], 0
+        for rows in batches:
+            group.append(_record_batch(rows, schema))
+            size += len(rows)
+            if size >= ROW_GROUP_SIZE:
+                write(pyarrow.Table.from_batches(group, schema), ROW_GROUP_SIZE)
+                group, size = [], 0
+            progress(len(rows))
+        if group:
+            write(pyarrow.Table.from_batches(group, schema), ROW_GROUP_SIZE)
+
+
+def export(conn, path, fmt=None, columns=None, building=None, expiring_within=None, include_overdue=False,
+           today=None, progress=None):
+    # Streams the selected rows and columns to path in constant memory. The
+    # format defaults to the file extension: .csv, .csv.gz, .csv.zst,
+    # .parquet or .arrow. progress(written, total) is called after each batch.
+    # Returns the number of rows written; a failed or cancelled export leaves
+    # no partial file behind.
+    fmt = fmt or format_for_path(path)
+    if fmt not in FORMATS.values():
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    columns, queries = export_queries(columns, building, expiring_within, include_overdue, today)
+    total = _count(conn, queries) if progress else 0
+    written = 0
+
+    def advance(count):
+        nonlocal written
+        written += count
+        if progress:
+            progress(written, total)
+
+    writer = write_csv if fmt.startswith("csv") else write_columnar
+    try:
+        writer(iter_batches(conn, queries), path, fmt, columns, advance)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the inventory to CSV, compressed CSV, Parquet or Arrow")
+    parser.add_argument("output", help="output file; .csv, .csv.gz, .csv.zst, .parquet or .arrow")
+    parser.add_argument("--db", default=inventory_db.DEFAULT_DB_PATH, help="inventory database file")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="override the format implied by the extension")
+    parser.add_argument("--columns", nargs="+", choices=EXPORT_COLUMNS, help="columns to export, in order")
+    parser.add_argument("--building", help="only this building")
+    parser.add_argument("--expiring-within", type=int, metavar="DAYS", help="only units expiring within DAYS days")
+    parser.add_argument("--include-overdue", action="store_true", help="with --expiring-within, also already expired units")
+    args = parser.parse_args(argv)
+
+    conn = inventory_db.connect(args.db)
+    try:
+        count = export(conn, args.output, args.format, args.columns, args.building, args.expiring_within,
+                       args.include_overdue)
+    finally:
+        inventory_db.close(conn)
+    print(f"Exported {count} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+from datetime import date
+
+# Optional: forecasting works on pandas frames
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = pd = None
+
+DEFAULT_MONTHS = 12
+MONTH_CHOICES = (12, 18, 24)
+# Units whose refill date is missing or not before their expiration are
+# assumed to go back on the usual yearly cycle after their next refill
+DEFAULT_CYCLE_MONTHS = 12
+# So are units with a longer cycle than this, which comes from a refill date
+# that never parsed (legacy text such as "unknown" reads as year 0) or a typo
+MAX_CYCLE_MONTHS = 120
+NOT_APPLICABLE = "N/A"
+
+
+def _require_pandas():
+    if pd is None:
+        raise RuntimeError("Forecasting needs the pandas package (pip install pandas)")
+
+
+def _month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+def _month_label(number):
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def cube_rows(conn):
+    # (building, type, supplier, weight, expires, cycle, count) for every
+    # forecast cube row, names decoded; a few tens of thousands of rows
+    # however many units there are
+    return conn.execute('''
+        SELECT b.name, t.name, s.name, c.weight, c.expires, c.cycle, c.count
+        FROM forecast_cube c
+        LEFT JOIN buildings b ON b.id = c.building_id
+        LEFT JOIN extinguisher_types t ON t.id = c.type_id
+        LEFT JOIN suppliers s ON s.id = c.supplier_id
+    ''').fetchall()
+
+
+def load_frame(conn):
+    return frame_from_rows(cube_rows(conn))
+
+
+def frame_from_rows(rows):
+    # The forecast cube as a compact frame with the number of units in each
+    # group, from cube_rows() read here or fetched from an inventory service
+    _require_pandas()
+    frame = pd.DataFrame.from_records(rows, columns=["building", "type", "supplier", "weight", "expires", "cycle", "count"])
+    for column in ("building", "type", "supplier"):
+        frame[column] = frame[column].fillna(NOT_APPLICABLE).astype("category")
+    # Weights typed into the old forms may still be stored as text
+    frame["weight"] = pd.to_numeric(frame["weight"], errors="coerce").fillna(0).astype("float32")
+    # Month numbers (year * 12 + month - 1); dates that never parsed become -1
+    expires = pd.to_datetime(frame["expires"], format="%Y-%m", errors="coerce")
+    frame["expires"] = (expires.dt.year * 12 + expires.dt.month - 1).fillna(-1).astype("int32")
+    cycle = pd.to_numeric(frame["cycle"], errors="coerce")
+    frame["cycle"] = cycle.where((cycle > 0) & (cycle <= MAX_CYCLE_MONTHS), DEFAULT_CYCLE_MONTHS).astype("int32")
+    frame["count"] = frame["count"].astype("int64")
+    return frame
+
+
+class Forecast:
+    # Results of forecast(), all small frames indexed by month label:
+    #   expiring  units expiring each month by (building, type), with an
+    #             Overdue column for units already past their expiration
+    #   workload  units due for a refill and the agent (lbs) they take each
+    #             month, counting overdue units in the first month and
+    #             refilled units again every cycle after that
+    #   agent     agent (lbs) due each month by supplier
+
+    def __init__(self, start, months, expiring, workload, agent, overdue, undated):
+        self.start = start
+        self.months = months
+        self.expiring = expiring
+        self.workload = workload
+        self.agent = agent
+        self.overdue = overdue
+        self.undated = undated
+
+
+def forecast(frame, months=DEFAULT_MONTHS, start=None):
+    # Projects the next `months` calendar months from start (default this
+    # month) with array arithmetic over the cube frame; no per-unit loops.
+    _require_pandas()
+    start = _month_number(start or date.today())
+    labels = [_month_label(start + offset) for offset in range(months)]
+
+    dated = frame[frame["expires"] >= 0]
+    undated = int(frame["count"].sum() - dated["count"].sum())
+    offset = dated["expires"].to_numpy() - start
+    counts = dated["count"].to_numpy()
+    overdue = int(counts[offset < 0].sum())
+
+    # Expirations: units whose current expiration falls in the window
+    window = (offset >= 0) & (offset < months)
+    grouped = (dated[window].assign(month=offset[window])
+               .groupby(["building", "type", "month"], observed=True)["count"].sum()
+               .unstack("month", fill_value=0)
+               .reindex(columns=range(months), fill_value=0))
+    grouped.columns = labels
+    late = dated[offset < 0].groupby(["building", "type"], observed=True)["count"].sum()
+    expiring = grouped.join(late.rename("Overdue"), how="outer").fillna(0).astype("int64")
+    expiring = expiring[["Overdue"] + labels]
+
+    # Refills: each group comes due in its expiration month (overdue ones
+    # straight away) and then every `cycle` months; np.repeat expands the
+    # groups into one entry per refill inside the window
+    first = np.maximum(offset, 0)
+    cycle = dated["cycle"].to_numpy()
+    refills = np.where(first < months, (months - 1 - first) // cycle + 1, 0)
+    group = np.repeat(np.arange(len(first)), refills)
+    nth = np.arange(len(group)) - np.repeat(np.cumsum(refills) - refills, refills)
+    due = first[group] + nth * cycle[group]
+    units = counts[group]
+    lbs = units * dated["weight"].to_numpy()[group]
+
+    workload = pd.DataFrame({
+        "Units": np.bincount(due, weights=units, minlength=months).astype("int64"),
+        "Agent (lbs)": np.bincount(due, weights=lbs, minlength=months).round(1),
+    }, index=pd.Index(labels, name="Month"))
+    suppliers = dated["supplier"].cat
+    cells = suppliers.codes.to_numpy()[group].astype("int64") * months + due
+    agent = pd.DataFrame(np.bincount(cells, weights=lbs, minlength=len(suppliers.categories) * months)
+                         .reshape(-1, months).round(1),
+                         index=pd.Index(suppliers.categories, name="Supplier"), columns=labels)
+    agent = agent[agent.sum(axis=1) > 0]
+    return Forecast(labels[0], labels, expiring, workload, agent, overdue, undated)
+
+
+def forecast_inventory(conn, months=DEFAULT_MONTHS, start=None):
+    return forecast(load_frame(conn), months, start)
+
@@ -0,0 +1,294 @@
+import csv
+import os
+import time
+
+import inventory_db
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Header spellings recognised in incoming files, mapped to table columns. Our
+# own export ("ID", "Building", ..., "Expiration Date", ...) round-trips.
+HEADER_ALIASES = {
+    "building": "building",
+    "room": "room",
+    "type": "type",
+    "weight": "weight",
+    "weight (lbs)": "weight",
+    "date refilled": "date_refilled",
+    "date_refilled": "date_refilled",
+    "expiration date": "date_expiration",
+    "date expiration": "date_expiration",
+    "date_expiration": "date_expiration",
+    "supplier": "supplier",
+    "notes": "notes",
+}
+
+
+class ImportStats:
+    def __init__(self, total_bytes=0):
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.quarantine_path = None
+        # Set when the progress callback asked to stop early
+        self.stopped = False
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def fraction_done(self):
+        return min(self.bytes_read / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        text = (f"{self.rows_read} rows read in {self.elapsed:.1f}s ({self.rows_per_second:,.0f} rows/s): "
+                f"{self.inserted} added, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{self.duplicates} duplicates, {self.rejected} rejected")
+        if self.quarantine_path:
+            text += f"\nRejected rows were written to {self.quarantine_path}"
+        return text
+
+
+class _Quarantine:
+    # Rejected rows go to a side file, created only if something is rejected
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.writer = None
+
+    def add(self, line_number, reason, fields):
+        if self.writer is None:
+            self.file = open(self.path, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["line", "reason"] + [column.replace("_", " ").title() for column in inventory_db.COLUMNS])
+        self.writer.writerow([line_number, reason] + list(fields))
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def default_quarantine_path(file_path):
+    root, _ = os.path.splitext(file_path)
+    return root + ".rejected.csv"
+
+
+def column_positions(header):
+    # Returns the index of each table column in the file, or None when the
+    # header is not recognised and columns are taken positionally.
+    names = [HEADER_ALIASES.get(name.strip().lower()) for name in header]
+    if not {"building", "type"} <= set(names):
+        return None
+    return [names.index(column) if column in names else None for column in inventory_db.COLUMNS]
+
+
+def validate_row(fields, positions=None, min_length=len(inventory_db.COLUMNS)):
+    # Returns the row as normalized column values or raises ValueError with
+    # the reason it was rejected
+    if len(fields) < min_length or (positions is None and len(fields) != min_length):
+        raise ValueError(f"expected {min_length} columns, got {len(fields)}")
+    if positions is None:
+        values = [field.strip() for field in fields]
+    else:
+        values = [fields[p].strip() if p is not None else "" for p in positions]
+
+    if not values[0]:
+        raise ValueError("building is required")
+    if not values[2]:
+        raise ValueError("type is required")
+    try:
+        weight = inventory_db.normalize_weight(values[3])
+    except ValueError:
+        raise ValueError(f"invalid weight {values[3]!r}")
+    values[3] = weight
+    values[4] = inventory_db.normalize_date(values[4])
+    values[5] = inventory_db.normalize_date(values[5])
+    return values
+
+
+def _apply_batch(cursor, batch, stats):
+    cursor.execute("DELETE FROM import_staging")
+    cursor.executemany('''
+        INSERT INTO import_staging (line, building, room, type, weight, date_refilled, date_expiration, supplier, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+    # Within a batch the last occurrence of a natural key wins
+    cursor.execute('''
+        DELETE FROM import_staging WHERE line NOT IN (
+            SELECT MAX(line) FROM import_staging GROUP BY building, room, type
+        )
+    ''')
+    stats.duplicates += cursor.rowcount
+
+    # Match the rest against existing units on building + room + type,
+    # encoding building, type and supplier in the same pass (any new names
+    # are added to the lookup tables first)
+    inventory_db.add_staged_lookup_values(cursor, "import_staging")
+    encoded = {column: inventory_db.lookup_id(column, "import_staging." + column) for column in inventory_db.LOOKUP_TABLES}
+    cursor.execute(f'''
+        UPDATE import_staging SET {", ".join(f"{column}_id = {value}" for column, value in encoded.items())}, target_id = (
+            SELECT r.id FROM {inventory_db.RECORDS} r
+            WHERE r.building_id IS {encoded["building"]} AND r.room IS import_staging.room
+              AND r.type_id IS {encoded["type"]}
+            ORDER BY r.id LIMIT 1
+        )
+    ''')
+    matched = cursor.execute("SELECT COUNT(*) FROM import_staging WHERE target_id IS NOT NULL").fetchone()[0]
+
+    cursor.execute(f'''
+        UPDATE {inventory_db.RECORDS} AS r
+        SET weight = s.weight, date_refilled = s.date_refilled, date_expiration = s.date_expiration,
+            supplier_id = s.supplier_id, notes = s.notes
+        FROM import_staging s
+        WHERE s.target_id = r.id
+          AND (r.weight IS NOT s.weight OR r.date_refilled IS NOT s.date_refilled
+               OR r.date_expiration IS NOT s.date_expiration
+               OR r.supplier_id IS NOT s.supplier_id OR r.notes IS NOT s.notes)
+    ''')
+    stats.updated += cursor.rowcount
+    stats.unchanged += matched - cursor.rowcount
+
+    cursor.execute(f'''
+        INSERT INTO {inventory_db.RECORDS} ({inventory_db.RECORD_COLUMNS})
+        SELECT {inventory_db.RECORD_COLUMNS}
+        FROM import_staging WHERE target_id IS NULL ORDER BY line
+    ''')
+    stats.inserted += cursor.rowcount
+
+
+def _defer_indexes(cursor):
+    # Loading into an empty table is much faster if secondary indexes are built
+    # once at the end by a sort instead of row by row, and the tally cube,
+    # search index and change journal are filled once instead of by their
+    # triggers. The natural key index stays because later batches are matched
+    # against earlier ones.
+    cursor.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL AND name != ?
+    ''', (inventory_db.RECORDS, f"idx_{inventory_db.RECORDS}_natural_key"))
+    deferred = cursor.fetchall()
+    for kind, name, _ in deferred:
+        cursor.execute(f"DROP {kind.upper()} {name}")
+    return deferred
+
+
+def import_csv(conn, file_path, batch_size=DEFAULT_BATCH_SIZE, quarantine_path=None, progress=None):
+    # Streams the file in batches, each validated, de-duplicated and upserted
+    # on the natural key, so a bad row only lands in the quarantine file and a
+    # large file never sits in memory. Each batch is committed on its own,
+    # except in a load into an empty table (below), which commits once at the
+    # end and holds the write lock until then. progress(stats) is called after
+    # every batch; returning False from it stops the import after the current
+    # batch.
+    stats = ImportStats(os.path.getsize(file_path))
+    quarantine = _Quarantine(quarantine_path or default_quarantine_path(file_path))
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            line INTEGER PRIMARY KEY,
+            building TEXT, room TEXT, type TEXT, weight REAL,
+            date_refilled TEXT, date_expiration TEXT, supplier TEXT, notes TEXT,
+            building_id INTEGER, type_id INTEGER, supplier_id INTEGER,
+            target_id INTEGER
+        )
+    ''')
+
+    # A load into an empty table is one transaction from dropping the indexes
+    # and triggers to rebuilding them, so a crash part way through leaves the
+    # table as it was. Its batches are savepoints that commit with it, and
+    # other writers wait (or time out) until it is done.
+    cursor.execute("BEGIN IMMEDIATE")
+    deferred = cursor.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {inventory_db.RECORDS})").fetchone()[0]
+    if deferred:
+        deferred_indexes = _defer_indexes(cursor)
+        cursor.execute("SAVEPOINT import_batch")
+    else:
+        conn.commit()
+
+    def commit():
+        if deferred:
+            cursor.execute("RELEASE import_batch")
+            cursor.execute("SAVEPOINT import_batch")
+        else:
+            conn.commit()
+
+    try:
+        with open(file_path, "r", newline="", encoding="utf-8-sig") as csv_file:
+            csv_reader = csv.reader(csv_file)
+            header = next(csv_reader, None)
+            positions = column_positions(header) if header else None
+            min_length = max(p for p in positions if p is not None) + 1 if positions else len(inventory_db.COLUMNS)
+
+            batch = []
+            for fields in csv_reader:
+                if not fields:
+                    continue
+                stats.rows_read += 1
+                try:
+                    batch.append([csv_reader.line_num] + validate_row(fields, positions, min_length))
+                except ValueError as e:
+                    stats.rejected += 1
+                    quarantine.add(csv_reader.line_num, str(e), fields)
+
+                if len(batch) >= batch_size:
+                    _apply_batch(cursor, batch, stats)
+                    commit()
+                    batch = []
+                    # Position of the underlying byte stream; a read-ahead
+                    # buffer ahead of the parser, which is close enough for progress
+                    stats.bytes_read = csv_file.buffer.tell()
+                    stats.elapsed = time.perf_counter() - stats.started
+                    if progress and progress(stats) is False:
+                        stats.stopped = True
+                        break
+            else:
+                if batch:
+                    _apply_batch(cursor, batch, stats)
+                    commit()
+    except BaseException:
+        # Only the failed batch; the ones before it stay imported
+        if not deferred:
+            conn.rollback()
+        elif conn.in_transaction:
+            cursor.execute("ROLLBACK TO import_batch")
+        raise
+    finally:
+        quarantine.close()
+        # SQLite rolls the whole transaction back on some errors, dropped
+        # indexes and triggers included, which leaves nothing to rebuild
+        if deferred and conn.in_transaction:
+            try:
+                # The rebuild must finish even when the load was interrupted
+                # (e.g. cancelled through a progress handler), or the batches
+                # loaded so far would be lost with it
+                conn.set_progress_handler(None, 0)
+                for _, _, sql in deferred_indexes:
+                    cursor.execute(sql)
+                inventory_db.rebuild_tally_cube(cursor)
+                inventory_db.rebuild_forecast_cube(cursor)
+                inventory_db.rebuild_search_index(cursor)
+                # The table was empty, so everything in it now was inserted by this load
+                inventory_db.journal_inserts(cursor)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        cursor.execute("DROP TABLE IF EXISTS temp.import_staging")
+
+    if quarantine.writer is not None:
+        stats.quarantine_path = quarantine.path
+    stats.bytes_read = stats.total_bytes
+    stats.elapsed = time.perf_counter() - stats.started
+    if progress:
+        progress(stats)
+    return stats
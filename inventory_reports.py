@@ -0,0 +1,355 @@
+import argparse
+import csv
+import html
+import os
+import sys
+from operator import itemgetter
+
+import inventory_db
+import inventory_forecast
+
+# Rows are pulled from the cursor this many at a time, so a report never
+# holds more than one batch of rows in memory
+FETCH_SIZE = 5000
+# Rendered text is handed out in pieces of about this many characters
+CHUNK_SIZE = 256 * 1024
+
+REPORT_TYPES = ("full", "expiring", "tally", "forecast")
+TALLY_CATEGORIES = ("Building", "Weight", "Type", "Supplier")
+
+# (heading, column index in SELECT * rows, unit suffix)
+FULL_FIELDS = (
+    ("Building", 1, ""),
+    ("Room", 2, ""),
+    ("Type", 3, ""),
+    ("Weight", 4, " lbs"),
+    ("Date Refilled", 5, ""),
+    ("Expiration Date", 6, ""),
+    ("Supplier", 7, ""),
+    ("Notes", 8, ""),
+)
+EXPIRING_FIELDS = (
+    ("Building", 1, ""),
+    ("Room", 2, ""),
+    ("Type", 3, ""),
+    ("Expiration Date", 6, ""),
+)
+
+
+def iter_rows(cursor, size=FETCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+class Section:
+    # One titled block of a report. rows is a one-shot iterator; "record"
+    # sections print each row as a block of "Heading: value" lines, "tally"
+    # sections print "value: count" lines and "table" sections print aligned
+    # columns under their headings.
+
+    def __init__(self, title, fields, rows, style="record", count=None, rule=None):
+        self.title = title
+        self.fields = fields
+        self.rows = rows
+        self.style = style
+        self.count = count
+        self.rule = rule or "-" * (len(title or "") + 2)
+        self._getter = itemgetter(*[index for _, index, _ in fields])
+
+    @property
+    def headings(self):
+        return [heading for heading, _, _ in self.fields]
+
+    def values(self, row):
+        # itemgetter with a single index returns the bare value
+        values = self._getter(row)
+        return list(values) if len(self.fields) > 1 else [values]
+
+
+class Report:
+    # chart, when set, is (title, labels, values) for the UIs to draw
+    def __init__(self, title, sections, subtitle=None, rule=None, chart=None):
+        self.title = title
+        self.sections = sections
+        self.subtitle = subtitle
+        self.rule = rule or "=" * len(title)
+        self.chart = chart
+
+
+def _rows_by_building(conn):
+    # Every row ordered by building name, then room. Read one building at a
+    # time (no building first, where SQLite sorts NULL) so that each comes in
+    # room order straight from the natural key index; ordering the whole
+    # table by the joined names would need a sort of every row first.
+    building_ids = [None] + [row[0] for row in conn.execute("SELECT id FROM buildings ORDER BY name")]
+    for building_id in building_ids:
+        yield from iter_rows(conn.execute(f"""
+            SELECT {inventory_db.ROW_COLUMNS} FROM {inventory_db.ROW_SOURCE}
+            WHERE r.building_id IS ? ORDER BY r.room
+        """, (building_id,)))
+
+
+def full_report(conn):
+    return Report("Full Inventory Report", [Section(None, FULL_FIELDS, _rows_by_building(conn))], rule="=" * 22)
+
+
+def expiring_report(conn, horizon_days=30, building=None, include_overdue=True):
+    titles = {"overdue": "Already Expired", "upcoming": f"Expiring Within {horizon_days} Days"}
+    buckets = inventory_db.EXPIRY_BUCKETS if include_overdue else ("upcoming",)
+    sections = []
+    for bucket in buckets:
+        sql, params = inventory_db.expiring_query(bucket, horizon_days, building, columns="COUNT(*)")
+        count = conn.execute(sql, params).fetchone()[0]
+        cursor = conn.execute(*inventory_db.expiring_query(bucket, horizon_days, building))
+        sections.append(Section(titles[bucket], EXPIRING_FIELDS, iter_rows(cursor), count=count))
+    return Report("Extinguishers Expiring Soon Report", sections,
+                  subtitle=f"Next {horizon_days} days, building: {building or 'All'}", rule="=" * 36)
+
+
+def tally_report(conn, categories):
+    # All grouping levels come from the materialized tally cube in one pass
+    categories = list(categories)
+    return Report("Tally Report", tally_sections(categories, inventory_db.tally(conn, categories)))
+
+
+def tally_sections(categories, levels):
+    # The tally report's sections from inventory_db.tally() levels
+    sections = []
+    for category in categories:
+        sections.append(Section(f"{category} Tally", ((category, 0, ""), ("Count", 1, "")), iter(levels[(category,)]),
+                                "tally", rule="-" * 14))
+
+    if len(categories) > 1:
+        # Intermediate subtotal levels, e.g. Building + Type out of three categories
+        for level, rows in levels.items():
+            if 1 < len(level) < len(categories):
+                fields = tuple((cat, i, "") for i, cat in enumerate(level)) + (("Count", len(level), ""),)
+                sections.append(Section(" + ".join(level) + " Tally", fields, iter(_not_applicable(rows)), "tally"))
+
+        fields = tuple((cat, i, "") for i, cat in enumerate(categories)) + (("Count", len(categories), ""),)
+        sections.append(Section("Combined Tally", fields, iter(_not_applicable(levels[tuple(categories)])), "tally",
+                                rule="-" * 16))
+
+    sections.append(Section("Total", (("Total", 0, ""),), iter(levels[()]), "total", rule="-" * 7))
+    return sections
+
+
+def _not_applicable(rows):
+    # Combined tallies have always shown missing values as N/A
+    return [tuple("N/A" if value is None else value for value in row[:-1]) + row[-1:] for row in rows]
+
+
+def table_section(title, headings, rows):
+    rows = list(rows)
+    return Section(title, tuple((heading, i, "") for i, heading in enumerate(headings)), iter(rows), "table",
+                   count=len(rows))
+
+
+def _frame_section(title, frame, index_headings, total=False):
+    # A "table" section from a forecast frame, its index as leading columns
+    headings = list(index_headings) + list(frame.columns) + (["Total"] if total else [])
+    rows = []
+    for key, values in zip(frame.index, frame.itertuples(index=False)):
+        key = key if isinstance(key, tuple) else (key,)
+        rows.append(key + tuple(_number(value) for value in values) + ((_number(sum(values)),) if total else ()))
+    return table_section(title, headings, rows)
+
+
+def _number(value):
+    # Whole numbers print without a trailing .0
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 1)
+
+
+def forecast_report(conn, months=inventory_forecast.DEFAULT_MONTHS):
+    result = inventory_forecast.forecast_inventory(conn, months)
+    return Report("Refill and Expiration Forecast", forecast_sections(result), subtitle=forecast_summary(result),
+                  chart=forecast_chart(result))
+
+
+def forecast_summary(result):
+    summary = (f"Next {len(result.months)} months from {result.start}; {result.overdue} already expired units are "
+               f"due in the first month")
+    if result.undated:
+        summary += f"; {result.undated} units with no expiration date are left out"
+    return summary
+
+
+def forecast_sections(result):
+    return [
+        _frame_section("Refill Workload", result.workload, ["Month"]),
+        _frame_section("Units Expiring by Building and Type", result.expiring, ["Building", "Type"], total=True),
+        _frame_section("Agent Due by Supplier (lbs)", result.agent, ["Supplier"], total=True),
+    ]
+
+
+def forecast_chart(result):
+    return ("Refills due per month", result.months, [int(units) for units in result.workload["Units"]])
+
+
+def build_report(conn, report_type, categories=None, horizon_days=30, building=None, include_overdue=True,
+                 months=inventory_forecast.DEFAULT_MONTHS):
+    if report_type == "full":
+        return full_report(conn)
+    if report_type == "expiring":
+        return expiring_report(conn, horizon_days, building, include_overdue)
+    if report_type == "tally":
+        return tally_report(conn, categories or TALLY_CATEGORIES)
+    if report_type == "forecast":
+        return forecast_report(conn, months)
+    raise ValueError(f"Unknown report type: {report_type!r}")
+
+
+def _text_lines(report):
+    # Same layout the Reports tab has always shown, one string per row
+    yield f"{report.title}\n{report.rule}\n"
+    yield f"{report.subtitle}\n\n" if report.subtitle else "\n"
+
+    for section in report.sections:
+        if section.style == "total":
+            for row in section.rows:
+                yield f"Total units: {row[0]}\n"
+            continue
+        if section.style == "tally":
+            yield f"{section.title}:\n{section.rule}\n"
+            labels = section.headings[:-1]
+            for row in section.rows:
+                if len(labels) == 1:
+                    yield f"{row[0]}: {row[1]}\n"
+                else:
+                    yield ", ".join(f"{label}: {row[i]}" for i, label in enumerate(labels)) + f": {row[-1]}\n"
+            yield "\n"
+            continue
+        if section.style == "table":
+            # Small enough to size every column before printing
+            rows = [["" if value is None else str(value) for value in section.values(row)] for row in section.rows]
+            headings = section.headings
+            widths = [max([len(heading)] + [len(row[i]) for row in rows]) for i, heading in enumerate(headings)]
+            yield f"{section.title}:\n{'-' * (len(section.title) + 1)}\n"
+            yield "  ".join(heading.ljust(width) for heading, width in zip(headings, widths)).rstrip() + "\n"
+            for row in rows:
+                yield "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() + "\n"
+            yield "\n"
+            continue
+
+        if section.title:
+            yield f"{section.title} ({section.count})\n\n"
+        # One format string per record instead of one write per field
+        template = "".join(f"{heading}: {{{i}}}{suffix}\n" for i, (heading, _, suffix) in enumerate(section.fields))
+        template += "--------------------\n"
+        for row in section.rows:
+            yield template.format(*section.values(row))
+        if section.title:
+            yield "\n"
+
+
+def render_text(report, chunk_size=CHUNK_SIZE):
+    # Yields the text report in chunks of roughly chunk_size characters, each
+    # ending on a line boundary
+    buffer, size = [], 0
+    for line in _text_lines(report):
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def write_text(report, file):
+    for chunk in render_text(report):
+        file.write(chunk)
+
+
+def write_csv(report, file):
+    # One table per report; multi-section reports get a leading Section column
+    writer = csv.writer(file)
+    multi = len(report.sections) > 1
+    for index, section in enumerate(report.sections):
+        if index == 0 or section.style != "record":
+            if index:
+                writer.writerow([])
+            writer.writerow((["Section"] if multi else []) + section.headings)
+        prefix = [section.title] if multi else []
+        batch = []
+        for row in section.rows:
+            batch.append(prefix + section.values(row))
+            if len(batch) >= FETCH_SIZE:
+                writer.writerows(batch)
+                batch = []
+        writer.writerows(batch)
+
+
+def write_html(report, file):
+    escape = html.escape
+    file.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{escape(report.title)}</title>\n"
+               "<style>body{font-family:sans-serif}table{border-collapse:collapse}"
+               "td,th{border:1px solid #ccc;padding:2px 6px}</style></head><body>\n")
+    file.write(f"<h1>{escape(report.title)}</h1>\n")
+    if report.subtitle:
+        file.write(f"<p>{escape(report.subtitle)}</p>\n")
+
+    for section in report.sections:
+        if section.title:
+            count = f" ({section.count})" if section.count is not None else ""
+            file.write(f"<h2>{escape(section.title)}{count}</h2>\n")
+        file.write("<table>\n<tr>" + "".join(f"<th>{escape(h)}</th>" for h in section.headings) + "</tr>\n")
+        buffer = []
+        for row in section.rows:
+            buffer.append("<tr>" + "".join(f"<td>{escape('' if v is None else str(v))}</td>" for v in section.values(row)) + "</tr>\n")
+            if len(buffer) >= FETCH_SIZE:
+                file.write("".join(buffer))
+                buffer = []
+        file.write("".join(buffer) + "</table>\n")
+    file.write("</body></html>\n")
+
+
+WRITERS = {"txt": write_text, "csv": write_csv, "html": write_html}
+
+
+def report_format(path, fmt=None):
+    # The format defaults to the file extension (.txt, .csv or .html)
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower() or "txt"
+    if fmt == "htm":
+        fmt = "html"
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown report format: {fmt!r}")
+    return fmt
+
+
+def write_report(conn, path, report_type, fmt=None, **options):
+    # Writes a report straight to a file without the GUI, in constant memory
+    fmt = report_format(path, fmt)
+    report = build_report(conn, report_type, **options)
+    with open(path, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as file:
+        WRITERS[fmt](report, file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write an inventory report to a file")
+    parser.add_argument("report_type", choices=REPORT_TYPES)
+    parser.add_argument("output", help="output file; .txt, .csv or .html")
+    parser.add_argument("--db", default=inventory_db.DEFAULT_DB_PATH, help="inventory database file")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="override the format implied by the extension")
+    parser.add_argument("--days", type=int, default=30, help="expiring report horizon")
+    parser.add_argument("--building", help="expiring report building filter")
+    parser.add_argument("--no-overdue", action="store_true", help="leave already expired units out of the expiring report")
+    parser.add_argument("--categories", nargs="+", choices=TALLY_CATEGORIES, help="tally report categories")
+    parser.add_argument("--months", type=int, default=inventory_forecast.DEFAULT_MONTHS, help="forecast report horizon")
+    args = parser.parse_args(argv)
+
+    conn = inventory_db.connect(args.db)
+    try:
+        write_report(conn, args.output, args.report_type, args.format, categories=args.categories,
+                     horizon_days=args.days, building=args.building, include_overdue=not args.no_overdue,
+                     months=args.months)
+    finally:
+        inventory_db.close(conn)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
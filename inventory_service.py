@@ -0,0 +1,703 @@
+import argparse
+import codecs
+import concurrent.futures
+import contextlib
+import http.client
+import json
+import queue
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import inventory_db
+import inventory_diagnostics
+import inventory_forecast
+import inventory_reports
+import inventory_sync
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Read connections shared by all client threads
+DEFAULT_READERS = 4
+# Queued writes applied per transaction by the writer
+MAX_WRITE_BATCH = 500
+# Rows per page of the inventory, and per batch of GET /rows
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+# Idle keep-alive connections are closed after this many seconds
+IDLE_TIMEOUT = 60
+# Streamed responses (reports) are sent in chunks of about this many bytes
+STREAM_CHUNK = 64 * 1024
+# Client side: used by both apps when set, e.g. http://127.0.0.1:8765
+SERVER_ENV = "FIRE_INVENTORY_SERVER"
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ReadPool:
+    # A fixed set of read connections handed out one request at a time. In
+    # WAL mode readers never wait for the writer, and capping their number
+    # keeps dozens of client threads from each opening a connection.
+
+    def __init__(self, connect, size=DEFAULT_READERS):
+        self.connections = queue.Queue()
+        self.lookups = {}
+        for _ in range(size):
+            conn = connect()
+            self.lookups[conn] = inventory_db.LookupCache(conn)
+            self.connections.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.connections.put(conn)
+
+    def close(self):
+        for conn in self.lookups:
+            inventory_db.close(conn)
+
+
+class BatchingWriter:
+    # The service's only writing connection, so clients never compete for the
+    # database lock. Writes from every client thread queue up here; whatever
+    # is waiting when the writer comes round is applied in one transaction
+    # with one commit, each write in its own savepoint so a failing one does
+    # not undo the rest. Callers block until their batch has committed.
+
+    def __init__(self, connect, max_batch=MAX_WRITE_BATCH):
+        # Connected here rather than on the thread, so any schema migration
+        # is done before the caller opens other connections
+        self.conn = connect()
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="inventory-service-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args):
+        # Runs func(conn, *args) on the writer and returns its result
+        future = concurrent.futures.Future()
+        self.queue.put((func, args, future))
+        return future.result()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        conn = self.conn
+        running = True
+        while running:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._apply(conn, batch)
+        inventory_db.close(conn)
+
+    def _apply(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, future in batch:
+                conn.execute("SAVEPOINT service_write")
+                try:
+                    outcomes.append((future, func(conn, *args), None))
+                    conn.execute("RELEASE service_write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO service_write")
+                    conn.execute("RELEASE service_write")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        # Results go back only once the whole batch is durable
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def _record(body):
+    # A record from a JSON body: {"building": ..., "room": ...}
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object of column values")
+    unknown = set(body) - set(inventory_db.COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    return tuple(body.get(column) for column in inventory_db.COLUMNS)
+
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+
+class InventoryService:
+    # The inventory operations the HTTP handler exposes: reads run on a pooled
+    # connection, writes go through the batching writer. Every statement is
+    # timed into diagnostics, shown by GET /diagnostics.
+
+    def __init__(self, db_path, readers=DEFAULT_READERS, max_batch=MAX_WRITE_BATCH):
+        if db_path == inventory_db.MEMORY or "mode=memory" in db_path:
+            raise ValueError("The inventory service needs a database file, not an in-memory database")
+        self.db_path = db_path
+        self.diagnostics = inventory_diagnostics.Diagnostics()
+        connect = lambda: inventory_diagnostics.connect(db_path, self.diagnostics, check_same_thread=False)
+        self.writer = BatchingWriter(connect, max_batch)
+        self.pool = ReadPool(connect, readers)
+
+    def close(self):
+        self.writer.stop()
+        self.pool.close()
+
+    # Reads
+
+    def version(self):
+        # Moves on with every change to the inventory, from this service or
+        # any other connection to the file, so clients can key caches on it
+        with self.pool.connection() as conn:
+            return {"version": inventory_sync.last_seq(conn), "schema": inventory_db.schema_version(conn)}
+
+    def _pager(self, conn, query):
+        pager = inventory_db.InventoryPager(conn)
+        pager.set_filters(**{column: query[column] for column in inventory_db.COLUMNS if column in query})
+        pager.set_search(query.get("search"))
+        pager.set_sort(query.get("sort", "id"), _flag(query.get("descending", "")))
+        return pager
+
+    def page(self, query):
+        # Rows at an offset, or by keyset from a JSON key (before=1 for the
+        # rows above it), or the given ids; total unless count=0
+        limit = min(int(query.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        with self.pool.connection() as conn:
+            pager = self._pager(conn, query)
+            if "ids" in query:
+                rows = pager.fetch_ids(int(row_id) for row_id in query["ids"].split(",") if row_id)
+            elif "key" in query:
+                key = json.loads(query["key"])
+                key = tuple(key) if key is not None else None
+                if _flag(query.get("before", "")):
+                    rows = pager.fetch_before(key, limit)
+                else:
+                    rows = pager.fetch_after(key, limit, _flag(query.get("inclusive", "")))
+            else:
+                rows = pager.fetch_at(int(query.get("offset", 0)), limit)
+            result = {"rows": rows}
+            if _flag(query.get("count", "1")):
+                result["total"] = pager.count()
+            return result
+
+    def ids(self, query):
+        # Every id the filters and search select, in the pager's order when
+        # ranked by relevance
+        with self.pool.connection() as conn:
+            return {"ids": self._pager(conn, query).ids()}
+
+    def rows(self, query):
+        # Every row in id order, a batch at a time: pass the last id seen
+        after = int(query.get("after", 0))
+        limit = min(int(query.get("limit", MAX_LIMIT)), MAX_LIMIT)
+        with self.pool.connection() as conn:
+            return {"rows": conn.execute("SELECT * FROM extinguishers WHERE id > ? ORDER BY id LIMIT ?",
+                                         (after, limit)).fetchall()}
+
+    def row(self, row_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM extinguishers WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            raise KeyError(row_id)
+        return {"row": row}
+
+    def lookups(self, column):
+        if column not in inventory_db.LOOKUP_TABLES and column != "weight":
+            raise ValueError(f"No lookup values for {column!r}")
+        with self.pool.connection() as conn:
+            return {"values": list(self.pool.lookups[conn].values(column))}
+
+    def expiring(self, query):
+        with self.pool.connection() as conn:
+            return inventory_db.expiring_extinguishers(conn, int(query.get("days", 30)), query.get("building"),
+                                                       include_overdue=_flag(query.get("include_overdue", "1")))
+
+    def tally(self, query):
+        categories = query.get("categories", ",".join(inventory_reports.TALLY_CATEGORIES)).split(",")
+        for category in categories:
+            if category not in inventory_reports.TALLY_CATEGORIES:
+                raise ValueError(f"Unknown tally category: {category!r}")
+        with self.pool.connection() as conn:
+            levels = inventory_db.tally(conn, categories)
+        return {"levels": [{"categories": list(level), "rows": rows} for level, rows in levels.items()]}
+
+    def forecast_cube(self):
+        with self.pool.connection() as conn:
+            return {"rows": inventory_forecast.cube_rows(conn)}
+
+    def report_options(self, query):
+        options = {
+            "horizon_days": int(query.get("days", 30)),
+            "building": query.get("building"),
+            "include_overdue": _flag(query.get("include_overdue", "1")),
+            "months": int(query.get("months", inventory_forecast.DEFAULT_MONTHS)),
+        }
+        if query.get("categories"):
+            options["categories"] = query["categories"].split(",")
+        return options
+
+    def write_report(self, report_type, fmt, options, file):
+        # Renders straight into file, holding a read connection meanwhile
+        with self.pool.connection() as conn:
+            inventory_reports.WRITERS[fmt](inventory_reports.build_report(conn, report_type, **options), file)
+
+    def diagnostics_snapshot(self):
+        with self.pool.connection() as conn:
+            summary = inventory_diagnostics.database_summary(conn, self.db_path)
+        data = self.diagnostics.snapshot()
+        data.update(summary)
+        return data
+
+    # Writes
+
+    def add(self, body):
+        record = _record(body)
+        return {"id": self.writer.submit(inventory_db.insert_extinguisher, record, False)}
+
+    def update(self, row_id, body):
+        record = _record(body)
+        if not self.writer.submit(inventory_db.update_extinguisher, row_id, record, False):
+            raise KeyError(row_id)
+        return {"id": row_id}
+
+    def delete(self, row_id):
+        if not self.writer.submit(inventory_db.delete_extinguisher, row_id, False):
+            raise KeyError(row_id)
+        return {"id": row_id}
+
+
+class _ChunkedWriter:
+    # File-like object that sends what is written as HTTP/1.1 chunks
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer, self.size = [], 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= STREAM_CHUNK:
+            self.flush()
+
+    def flush(self):
+        data = "".join(self.buffer).encode("utf-8")
+        self.buffer, self.size = [], 0
+        if data:
+            self.stream.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def close(self):
+        self.flush()
+        self.stream.write(b"0\r\n\r\n")
+
+
+REPORT_CONTENT_TYPES = {"txt": "text/plain", "csv": "text/csv", "html": "text/html"}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # JSON over HTTP/1.1 with keep-alive:
+    #   GET    /version                   {"version", "schema"}
+    #   GET    /extinguishers             a page: offset, limit, sort, descending,
+    #                                     search and column filters; {"total", "rows"}
+    #                                     key, before, inclusive: by keyset instead
+    #                                     ids: those rows; count=0: no total
+    #   GET    /extinguishers/ids         every id selected: sort, search, filters
+    #   GET    /extinguishers/<id>        {"row"}
+    #   POST   /extinguishers             body {column: value}; {"id"}
+    #   PUT    /extinguishers/<id>        body {column: value}
+    #   DELETE /extinguishers/<id>
+    #   GET    /rows                      all rows by id: after, limit; {"rows"}
+    #   GET    /lookups/<column>          {"values"}
+    #   GET    /expiring                  days, building, include_overdue
+    #   GET    /tally                     categories=Building,Type
+    #   GET    /forecast/cube             {"rows"} for inventory_forecast
+    #   GET    /reports/<type>            format=txt|csv|html plus report options
+    #   GET    /diagnostics
+    # Errors come back as {"error": message} with status 400, 404 or 500.
+
+    protocol_version = "HTTP/1.1"
+    server_version = "FireInventory/1"
+    timeout = IDLE_TIMEOUT
+    # Headers and body go out in separate writes; with Nagle on, each small
+    # response waits ~40ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_request(self, code="-", size="-"):
+        # Errors are always logged; every request only with --verbose
+        if self.server.verbose:
+            super().log_request(code, size)
+
+    def _dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.split("/") if part]
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        route = f"{method} /{parts[0] if parts else ''}"
+        with self.server.service.diagnostics.operation(f"HTTP {route}"):
+            try:
+                body = json.loads(self.rfile.read(length)) if length else None
+                if method == "GET" and parts[:1] == ["reports"] and len(parts) == 2:
+                    return self._send_report(parts[1], query)
+                result = self._route(method, parts, query, body)
+            except KeyError as e:
+                return self._send_json(404, {"error": f"Not found: {e.args[0] if e.args else self.path}"})
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                return self._send_json(500, {"error": str(e)})
+            if result is None:
+                return self._send_json(404, {"error": f"No such resource: {method} {url.path}"})
+            self._send_json(200, result)
+
+    def _route(self, method, parts, query, body):
+        service = self.server.service
+        name, rest = (parts[0], parts[1:]) if parts else ("", [])
+        if name == "extinguishers":
+            if not rest:
+                if method == "GET":
+                    return service.page(query)
+                if method == "POST":
+                    return service.add(body)
+            elif rest == ["ids"]:
+                if method == "GET":
+                    return service.ids(query)
+            elif len(rest) == 1:
+                row_id = int(rest[0])
+                if method == "GET":
+                    return service.row(row_id)
+                if method == "PUT":
+                    return service.update(row_id, body)
+                if method == "DELETE":
+                    return service.delete(row_id)
+            return None
+        if method != "GET":
+            return None
+        if name == "version" and not rest:
+            return service.version()
+        if name == "rows" and not rest:
+            return service.rows(query)
+        if name == "lookups" and len(rest) == 1:
+            return service.lookups(rest[0])
+        if name == "expiring" and not rest:
+            return service.expiring(query)
+        if name == "tally" and not rest:
+            return service.tally(query)
+        if name == "forecast" and rest == ["cube"]:
+            return service.forecast_cube()
+        if name == "diagnostics" and not rest:
+            return service.diagnostics_snapshot()
+        return None
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_report(self, report_type, query):
+        # Reports can be as large as the inventory, so they are streamed
+        fmt = query.get("format", "txt")
+        service = self.server.service
+        options = service.report_options(query)
+        if report_type not in inventory_reports.REPORT_TYPES:
+            raise KeyError(report_type)
+        if fmt not in inventory_reports.WRITERS:
+            raise ValueError(f"Unknown report format: {fmt!r}")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{REPORT_CONTENT_TYPES[fmt]}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        writer = _ChunkedWriter(self.wfile)
+        try:
+            service.write_report(report_type, fmt, options, writer)
+        except Exception as e:
+            # Too late for an error status; dropping the connection without
+            # the final chunk tells the client the report is incomplete
+            self.log_error("Report %s failed: %s", report_type, e)
+            self.close_connection = True
+            return
+        writer.close()
+
+
+class InventoryServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Listen backlog; the default of 5 resets connections when dozens of
+    # clients connect at once
+    request_queue_size = 128
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def serve(db_path, host=DEFAULT_HOST, port=DEFAULT_PORT, readers=DEFAULT_READERS, verbose=False):
+    # Returns a bound server; call serve_forever() on it, then server_close()
+    # and server.service.close()
+    return InventoryServer((host, port), InventoryService(db_path, readers), verbose)
+
+
+class InventoryClient:
+    # Talks to an inventory service. Each thread keeps its own keep-alive
+    # connection, so a client can be shared by Streamlit's script threads.
+    # 400 responses raise ValueError and 404s KeyError, as the local
+    # operations would; anything else raises ServiceError.
+
+    def __init__(self, url, timeout=30):
+        parts = urllib.parse.urlsplit(url if "://" in url else "http://" + url)
+        self.host = parts.hostname or DEFAULT_HOST
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self, fresh=False):
+        conn = getattr(self.local, "conn", None)
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _response(self, method, path, params=None, body=None):
+        if params:
+            path += "?" + urllib.parse.urlencode({name: value for name, value in params.items() if value is not None})
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        # A kept-alive connection the server has since closed fails on first
+        # use; requests that are safe to repeat get one retry on a new one.
+        # response.retried tells the caller the first may have gone through.
+        for attempt in range(2):
+            conn = self._connection(fresh=attempt > 0)
+            try:
+                conn.request(method, path, payload, headers)
+                response = conn.getresponse()
+                response.retried = attempt > 0
+                return response
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if attempt or method == "POST":
+                    raise
+
+    def _drop_connection(self):
+        # After a response was left part read; the next request starts afresh
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def _check(self, response):
+        if response.status == 200:
+            return
+        error = json.loads(response.read() or b"{}").get("error") or response.reason
+        if response.status == 400:
+            raise ValueError(error)
+        if response.status == 404:
+            raise KeyError(error)
+        raise ServiceError(response.status, error)
+
+    def _request(self, method, path, params=None, body=None):
+        response = self._response(method, path, params, body)
+        self._check(response)
+        return json.loads(response.read() or b"{}")
+
+    def version(self):
+        return self._request("GET", "/version")["version"]
+
+    def page(self, filters=None, sort_column="id", descending=False, offset=0, limit=DEFAULT_LIMIT, search=None):
+        # (rows, total) for one page of the filtered, searched and sorted view
+        params = {column: value for column, value in (filters or {}).items() if value not in (None, "")}
+        params.update(sort=sort_column, descending=int(descending), offset=offset, limit=limit, search=search or None)
+        data = self._request("GET", "/extinguishers", params)
+        return [tuple(row) for row in data["rows"]], data["total"]
+
+    def all_rows(self, batch=MAX_LIMIT):
+        rows, after = [], 0
+        while True:
+            found = self._request("GET", "/rows", {"after": after, "limit": batch})["rows"]
+            rows += [tuple(row) for row in found]
+            if len(found) < batch:
+                return rows
+            after = found[-1][0]
+
+    def row(self, row_id):
+        return tuple(self._request("GET", f"/extinguishers/{row_id}")["row"])
+
+    def add(self, record):
+        return self._request("POST", "/extinguishers", body=dict(zip(inventory_db.COLUMNS, record)))["id"]
+
+    def update(self, row_id, record):
+        self._request("PUT", f"/extinguishers/{row_id}", body=dict(zip(inventory_db.COLUMNS, record)))
+
+    def delete(self, row_id):
+        response = self._response("DELETE", f"/extinguishers/{row_id}")
+        if response.status == 404 and response.retried:
+            # The first attempt deleted the row before the connection dropped
+            response.read()
+            return
+        self._check(response)
+        response.read()
+
+    def lookup_values(self, column):
+        return self._request("GET", f"/lookups/{column}")["values"]
+
+    def expiring(self, horizon_days=30, building=None, include_overdue=True):
+        data = self._request("GET", "/expiring", {"days": horizon_days, "building": building,
+                                                  "include_overdue": int(include_overdue)})
+        return {bucket: [tuple(row) for row in rows] for bucket, rows in data.items()}
+
+    def tally(self, categories):
+        data = self._request("GET", "/tally", {"categories": ",".join(categories)})
+        return {tuple(level["categories"]): [tuple(row) for row in level["rows"]] for level in data["levels"]}
+
+    def forecast_rows(self):
+        return self._request("GET", "/forecast/cube")["rows"]
+
+    def write_report(self, file, report_type, fmt="txt", categories=None, horizon_days=30, building=None,
+                     include_overdue=True, months=inventory_forecast.DEFAULT_MONTHS):
+        # Streams a rendered report into a text file object
+        params = {"format": fmt, "days": horizon_days, "building": building, "include_overdue": int(include_overdue),
+                  "months": months, "categories": ",".join(categories) if categories else None}
+        response = self._response("GET", f"/reports/{report_type}", params)
+        self._check(response)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            while True:
+                data = response.read(STREAM_CHUNK)
+                if not data:
+                    break
+                file.write(decoder.decode(data))
+        except BaseException:
+            # e.g. the caller cancelled from file.write(); the rest of the
+            # report is still on its way down this connection
+            self._drop_connection()
+            raise
+
+    def diagnostics(self):
+        return self._request("GET", "/diagnostics")
+
+
+class ServicePager(inventory_db.InventoryPager):
+    # InventoryPager's interface over a client, for the desktop app's
+    # inventory view in client mode. Sorting, filters, search and keys work
+    # as they do locally; the service runs the queries on its own pager.
+
+    def __init__(self, client, sort_column="id", descending=False):
+        super().__init__(None, sort_column, descending)
+        self.client = client
+
+    def _params(self, **params):
+        params.update(self.filters)
+        params.update(sort=self.sort_column, descending=int(self.descending), search=self.search)
+        return params
+
+    def _rows(self, **params):
+        data = self.client._request("GET", "/extinguishers", self._params(count=0, **params))
+        return [tuple(row) for row in data["rows"]]
+
+    def ranking(self):
+        if self._ranking is None:
+            ids = self.client._request("GET", "/extinguishers/ids", self._params())["ids"]
+            self._ranking = {row_id: position for position, row_id in enumerate(ids)}
+        return self._ranking
+
+    def count(self):
+        if self._count is None and self.ranked:
+            self._count = len(self.ranking())
+        if self._count is None:
+            self._count = self.client._request("GET", "/extinguishers", self._params(limit=0))["total"]
+        return self._count
+
+    def ids(self):
+        if self.ranked:
+            return list(self.ranking())
+        return self.client._request("GET", "/extinguishers/ids", self._params())["ids"]
+
+    def fetch_after(self, key, limit, inclusive=False):
+        return self._rows(key=json.dumps(key), limit=limit, inclusive=int(inclusive))
+
+    def fetch_before(self, key, limit):
+        return self._rows(key=json.dumps(key), limit=limit, before=1)
+
+    def fetch_at(self, offset, limit):
+        return self._rows(offset=offset, limit=limit)
+
+    def fetch_ids(self, ids):
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), 500):
+            rows += self._rows(ids=",".join(str(row_id) for row_id in ids[start:start + 500]), limit=MAX_LIMIT)
+        return rows
+
+
+class ServiceLookups:
+    # LookupCache's interface over a client, for the entry forms' dropdowns
+    def __init__(self, client):
+        self.client = client
+
+    def values(self, column):
+        return self.client.lookup_values(column)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one inventory database to many clients over HTTP/JSON")
+    parser.add_argument("--db", default=inventory_db.DEFAULT_DB_PATH, help="inventory database file")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default {DEFAULT_PORT})")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="pooled read connections")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = serve(args.db, args.host, args.port, args.readers, args.verbose)
+    print(f"Serving {args.db} on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import inventory_db
+import inventory_forecast
+import inventory_import
+import inventory_reports
+
+DEFAULT_HORIZON_DAYS = 30
+
+
+class SitePartial:
+    # What one site contributes to a consolidated report: aggregates only,
+    # a few thousand rows however large the site, so they are cheap to send
+    # back from a worker process and to merge.
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.units = 0
+        # inventory_db.tally_cube_rows()
+        self.tally_rows = []
+        # {bucket: [(building, count)]} for inventory_db.EXPIRY_BUCKETS
+        self.expiring = {}
+        # inventory_forecast.cube_rows()
+        self.forecast_rows = []
+        # Rows the CSV import rejected, for CSV sites, and where they were
+        # kept if a rejected_dir was given
+        self.rejected = 0
+        self.rejected_path = None
+        self.seconds = 0.0
+
+    def expiring_total(self, bucket):
+        return sum(count for _, count in self.expiring.get(bucket, ()))
+
+
+def parse_site(spec):
+    # "EDS=campus/eds.db" names a site; a bare path is named after the file
+    name, sep, path = spec.partition("=")
+    if not sep:
+        path = spec
+        name = os.path.basename(spec)
+        for suffix in (".csv", ".db", ".sqlite", ".sqlite3"):
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+    return name, path
+
+
+def _import_site(path, name, rejected_dir):
+    # A CSV site in a private in-memory database. Its rejected rows go to
+    # rejected_dir, never beside the site's file, and are dropped without one.
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    with tempfile.TemporaryDirectory() as scratch:
+        stats = inventory_import.import_csv(conn, path, quarantine_path=os.path.join(
+            rejected_dir or scratch, f"{name}.rejected.csv"))
+    return conn, stats
+
+
+def site_partial(name, path, horizon_days=DEFAULT_HORIZON_DAYS, today=None, forecast=True, rejected_dir=None):
+    # Runs in a worker process. Site databases are read in place, read-only;
+    # CSV files are imported into a private in-memory database first.
+    started = time.perf_counter()
+    partial = SitePartial(name, path)
+    if path.lower().endswith(".csv"):
+        conn, stats = _import_site(path, name, rejected_dir)
+        partial.rejected = stats.rejected
+        if rejected_dir:
+            partial.rejected_path = stats.quarantine_path
+    else:
+        conn = inventory_db.connect_read_only(path)
+    try:
+        partial.units = conn.execute(f"SELECT COUNT(*) FROM {inventory_db.RECORDS}").fetchone()[0]
+        partial.tally_rows = inventory_db.tally_cube_rows(conn)
+        partial.expiring = inventory_db.expiring_counts(conn, horizon_days, today)
+        if forecast:
+            partial.forecast_rows = inventory_forecast.cube_rows(conn)
+    finally:
+        inventory_db.close(conn)
+    partial.seconds = time.perf_counter() - started
+    return partial
+
+
+def collect(sites, horizon_days=DEFAULT_HORIZON_DAYS, today=None, forecast=True, workers=None, progress=None,
+            rejected_dir=None):
+    # Computes every site's partial, one site per task across a process pool
+    # (in this process when workers is 1). sites is [(name, path)]; results
+    # come back in the same order. progress(partial) is called as each site
+    # finishes.
+    today = today or date.today()
+    if workers == 1:
+        partials = []
+        for name, path in sites:
+            partials.append(site_partial(name, path, horizon_days, today, forecast, rejected_dir))
+            if progress:
+                progress(partials[-1])
+        return partials
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(site_partial, name, path, horizon_days, today, forecast, rejected_dir): index
+                   for index, (name, path) in enumerate(sites)}
+        partials = [None] * len(sites)
+        for future in as_completed(futures):
+            partials[futures[future]] = future.result()
+            if progress:
+                progress(partials[futures[future]])
+    return partials
+
+
+def consolidated_report(partials, categories=None, horizon_days=DEFAULT_HORIZON_DAYS,
+                        months=inventory_forecast.DEFAULT_MONTHS, today=None):
+    # Merges site partials into one report: per-site totals, expirations by
+    # building, the tally report's sections and, unless months is 0, the
+    # forecast's sections and chart over all sites
+    categories = list(categories or inventory_reports.TALLY_CATEGORIES)
+    within = f"Expiring Within {horizon_days} Days"
+    sections = [inventory_reports.table_section(
+        "Sites", ["Site", "Units", "Already Expired", within],
+        [(p.name, p.units, p.expiring_total("overdue"), p.expiring_total("upcoming")) for p in partials])]
+
+    by_building = {}
+    for partial in partials:
+        for column, bucket in enumerate(inventory_db.EXPIRY_BUCKETS):
+            for building, count in partial.expiring.get(bucket, ()):
+                counts = by_building.setdefault(building, [0] * len(inventory_db.EXPIRY_BUCKETS))
+                counts[column] += count
+    sections.append(inventory_reports.table_section(
+        "Expirations by Building", ["Building", "Already Expired", within],
+        [(building if building is not None else "N/A",) + tuple(counts)
+         for building, counts in sorted(by_building.items(), key=lambda item: str(item[0]))]))
+
+    levels = inventory_db.tally_rows([row for partial in partials for row in partial.tally_rows], categories)
+    sections += inventory_reports.tally_sections(categories, levels)
+
+    units = sum(partial.units for partial in partials)
+    subtitle = f"{len(partials)} sites, {units} units"
+    rejected = sum(partial.rejected for partial in partials)
+    if rejected:
+        subtitle += f" ({rejected} CSV rows rejected on import)"
+    chart = None
+    forecast_rows = [row for partial in partials for row in partial.forecast_rows]
+    if months:
+        result = inventory_forecast.forecast(inventory_forecast.frame_from_rows(forecast_rows), months, today)
+        sections += inventory_reports.forecast_sections(result)
+        subtitle += "; forecast: " + inventory_reports.forecast_summary(result)
+        chart = inventory_reports.forecast_chart(result)
+    return inventory_reports.Report("Consolidated Inventory Report", sections, subtitle=subtitle, chart=chart)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consolidated report over several site inventories, "
+                                                 "each aggregated in its own process")
+    parser.add_argument("output", help="output file; .txt, .csv or .html")
+    parser.add_argument("sites", nargs="+", metavar="SITE",
+                        help="site database or CSV file, optionally named: EDS=eds.db")
+    parser.add_argument("--format", choices=sorted(inventory_reports.WRITERS), help="override the format implied by the extension")
+    parser.add_argument("--days", type=int, default=DEFAULT_HORIZON_DAYS, help="expiring horizon")
+    parser.add_argument("--months", type=int, default=inventory_forecast.DEFAULT_MONTHS, help="forecast horizon")
+    parser.add_argument("--no-forecast", action="store_true", help="leave out the forecast (no pandas needed)")
+    parser.add_argument("--categories", nargs="+", choices=inventory_reports.TALLY_CATEGORIES, help="tally categories")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--rejected-dir", help="keep rows rejected from CSV sites here, as SITE.rejected.csv")
+    args = parser.parse_args(argv)
+
+    sites = [parse_site(spec) for spec in args.sites]
+    names = [name for name, _ in sites]
+    if len(set(names)) != len(names):
+        parser.error("site names must be unique; name them explicitly, e.g. EDS=eds.db")
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower() or "txt"
+    fmt = "html" if fmt == "htm" else fmt
+    if fmt not in inventory_reports.WRITERS:
+        parser.error(f"unknown report format: {fmt!r}")
+
+    if args.rejected_dir:
+        os.makedirs(args.rejected_dir, exist_ok=True)
+    started = time.perf_counter()
+    partials = collect(sites, args.days, forecast=not args.no_forecast, workers=args.workers,
+                       progress=lambda p: print(f"  {p.name}: {p.units} units in {p.seconds:.2f}s"),
+                       rejected_dir=args.rejected_dir)
+    for partial in partials:
+        if partial.rejected_path:
+            print(f"  {partial.name}: {partial.rejected} rejected rows in {partial.rejected_path}")
+    report = consolidated_report(partials, args.categories, args.days, 0 if args.no_forecast else args.months)
+    with open(args.output, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as file:
+        inventory_reports.WRITERS[fmt](report, file)
+    print(f"Consolidated {len(partials)} sites into {args.output} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
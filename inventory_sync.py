@@ -0,0 +1,257 @@
+import argparse
+import gzip
+import json
+import sys
+from datetime import datetime
+
+import inventory_db
+
+DELTA_FORMAT = "fire-inventory-delta"
+DELTA_VERSION = 1
+# Journal entries read per batch while exporting
+FETCH_SIZE = 5000
+
+
+def _open(path, mode):
+    # Deltas are JSON lines, gzip-compressed when the name ends in .gz
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _ensure_sync_tables(cursor):
+    # Replica side bookkeeping: the last journal sequence applied from each
+    # source database, and which local row each source row became. Rows from
+    # different sites keep their own ids here, so many sites can be merged
+    # into one central inventory without id clashes.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            source TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            synced_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_rows (
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            local_id INTEGER NOT NULL,
+            PRIMARY KEY (source, source_id)
+        )
+    ''')
+
+
+def last_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_journal").fetchone()[0]
+
+
+def changes_since(conn, since, until):
+    # The journal between two watermarks compacted to one change per row: its
+    # latest values, or a delete. Deletes are kept even for rows added within
+    # the range, since a replica may already hold them from an overlapping
+    # earlier delta; deleting a row a replica never had is a no-op.
+    cursor = conn.execute('''
+        SELECT j.seq, j.op, j.row_id, j.data
+        FROM (
+            SELECT MAX(seq) AS seq FROM change_journal
+            WHERE seq > ? AND seq <= ? GROUP BY row_id
+        ) latest
+        JOIN change_journal j ON j.seq = latest.seq
+        ORDER BY j.seq
+    ''', (since, until))
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        for seq, op, row_id, data in rows:
+            if op == "delete":
+                yield {"seq": seq, "op": "delete", "id": row_id}
+            else:
+                yield {"seq": seq, "op": "upsert", "id": row_id, "row": json.loads(data)}
+
+
+def export_delta(conn, path, since=0):
+    # Writes every change after watermark `since` to path and returns
+    # (changes written, new watermark). Pass the returned watermark as
+    # `since` next time; 0 exports the whole inventory.
+    until = last_seq(conn)
+    header = {
+        "format": DELTA_FORMAT,
+        "version": DELTA_VERSION,
+        "source": inventory_db.database_id(conn),
+        "since": since,
+        "until": until,
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    count = 0
+    with _open(path, "w") as file:
+        file.write(json.dumps(header) + "\n")
+        for change in changes_since(conn, since, until):
+            file.write(json.dumps(change, separators=(",", ":")) + "\n")
+            count += 1
+    return count, until
+
+
+class DeltaStats:
+    def __init__(self, source, since, until):
+        self.source = source
+        self.since = since
+        self.until = until
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.skipped = 0
+
+    def summary(self):
+        return (f"Changes {self.since}..{self.until} from {self.source}: {self.inserted} added, "
+                f"{self.updated} updated, {self.deleted} deleted, {self.skipped} already applied")
+
+
+def _apply_batch(cursor, source, batch, stats):
+    # Applies a batch of changes with a few set-based statements instead of
+    # several per change, the same way CSV imports apply their batches
+    columns = ", ".join(inventory_db.COLUMNS)
+    cursor.execute("DELETE FROM delta_staging")
+    cursor.executemany(f"""
+        INSERT INTO delta_staging (seq, op, source_id, {columns}) VALUES (?, ?, ?, {", ".join("?" * len(inventory_db.COLUMNS))})
+    """, batch)
+
+    # Local rows for changes seen before; rows deleted locally since count as new
+    cursor.execute(f'''
+        UPDATE delta_staging SET local_id = (
+            SELECT r.local_id FROM sync_rows r JOIN {inventory_db.RECORDS} e ON e.id = r.local_id
+            WHERE r.source = ? AND r.source_id = delta_staging.source_id
+        )
+    ''', (source,))
+
+    cursor.execute(f"DELETE FROM {inventory_db.RECORDS} WHERE id IN (SELECT local_id FROM delta_staging WHERE op = 'delete')")
+    stats.deleted += cursor.rowcount
+    cursor.execute("DELETE FROM sync_rows WHERE source = ? AND source_id IN (SELECT source_id FROM delta_staging WHERE op = 'delete')",
+                   (source,))
+
+    # Rows are written to the base table with building, type and supplier
+    # encoded, adding any names this database has not seen yet
+    inventory_db.add_staged_lookup_values(cursor, "delta_staging")
+    assignments = ", ".join(f"{inventory_db.stored_column(column)} = {inventory_db.lookup_id(column, 's.' + column)}"
+                            for column in inventory_db.COLUMNS)
+    cursor.execute(f"""
+        UPDATE {inventory_db.RECORDS} AS r SET {assignments}
+        FROM delta_staging s WHERE s.op = 'upsert' AND s.local_id = r.id
+    """)
+    stats.updated += cursor.rowcount
+
+    # New rows get ids after the current highest, in journal order, so their
+    # mapping can be written in the same pass
+    base = cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {inventory_db.RECORDS}").fetchone()[0]
+    values = ", ".join(inventory_db.lookup_id(column, "s." + column) for column in inventory_db.COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO {inventory_db.RECORDS} (id, {inventory_db.RECORD_COLUMNS})
+        SELECT ? + ROW_NUMBER() OVER (ORDER BY s.seq), {values}
+        FROM delta_staging s WHERE s.op = 'upsert' AND s.local_id IS NULL ORDER BY s.seq
+    """, (base,))
+    stats.inserted += cursor.rowcount
+    cursor.execute('''
+        INSERT OR REPLACE INTO sync_rows (source, source_id, local_id)
+        SELECT ?, source_id, ? + ROW_NUMBER() OVER (ORDER BY seq)
+        FROM delta_staging WHERE op = 'upsert' AND local_id IS NULL
+    ''', (source, base))
+
+
+def import_delta(conn, path):
+    # Replays a delta into this database in one transaction. Deltas from one
+    # source must be applied in order: one that starts after the last applied
+    # watermark would leave a gap and is refused, while changes already
+    # applied are skipped, so re-running an import is harmless.
+    cursor = conn.cursor()
+    with _open(path, "r") as file:
+        header = json.loads(file.readline() or "{}")
+        if header.get("format") != DELTA_FORMAT or header.get("version") != DELTA_VERSION:
+            raise ValueError(f"{path} is not an inventory delta file")
+        source = header["source"]
+        if source == inventory_db.database_id(conn):
+            raise ValueError("Cannot apply a delta to the database it came from")
+
+        try:
+            cursor.execute("BEGIN")
+            _ensure_sync_tables(cursor)
+            # Untyped columns, so values land exactly as they were exported
+            cursor.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS delta_staging (
+                    seq INTEGER PRIMARY KEY, op TEXT, source_id INTEGER, {", ".join(inventory_db.COLUMNS)}, local_id INTEGER
+                )
+            """)
+            cursor.execute("SELECT last_seq FROM sync_state WHERE source = ?", (source,))
+            found = cursor.fetchone()
+            applied = found[0] if found else 0
+            if header["since"] > applied:
+                raise ValueError(f"Delta starts after change {header['since']} but only changes up to {applied} "
+                                 f"from this source have been applied; export again with --since {applied}")
+
+            stats = DeltaStats(source, header["since"], header["until"])
+            batch = []
+            for line in file:
+                change = json.loads(line)
+                if change["seq"] <= applied:
+                    stats.skipped += 1
+                    continue
+                row = change.get("row") or {}
+                batch.append([change["seq"], change["op"], change["id"]] + [row.get(column) for column in inventory_db.COLUMNS])
+                if len(batch) >= FETCH_SIZE:
+                    _apply_batch(cursor, source, batch, stats)
+                    batch = []
+            if batch:
+                _apply_batch(cursor, source, batch, stats)
+
+            cursor.execute('''
+                INSERT INTO sync_state (source, last_seq, synced_at) VALUES (?, ?, ?)
+                ON CONFLICT (source) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq), synced_at = excluded.synced_at
+            ''', (source, header["until"], datetime.now().isoformat(timespec="seconds")))
+            cursor.execute("COMMIT")
+        except Exception:
+            # Nothing to roll back if BEGIN itself failed
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS temp.delta_staging")
+    return stats
+
+
+def sync_status(conn):
+    # [(source, last applied sequence, when)] for every source seen
+    cursor = conn.cursor()
+    _ensure_sync_tables(cursor)
+    conn.commit()
+    return cursor.execute("SELECT source, last_seq, synced_at FROM sync_state ORDER BY source").fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move inventory changes between databases as small delta files")
+    parser.add_argument("--db", default=inventory_db.DEFAULT_DB_PATH, help="inventory database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write the changes after a watermark to a delta file")
+    export_parser.add_argument("output", help="delta file; .jsonl, or .jsonl.gz to compress")
+    export_parser.add_argument("--since", type=int, default=0, help="watermark printed by the previous export (default 0: everything)")
+    import_parser = commands.add_parser("import", help="apply delta files from another inventory, oldest first")
+    import_parser.add_argument("deltas", nargs="+")
+    commands.add_parser("status", help="show this database's id, watermark and the sources applied to it")
+    args = parser.parse_args(argv)
+
+    conn = inventory_db.connect(args.db)
+    try:
+        if args.command == "export":
+            count, until = export_delta(conn, args.output, args.since)
+            print(f"Exported {count} changes to {args.output}; next watermark: {until}")
+        elif args.command == "import":
+            for path in args.deltas:
+                print(import_delta(conn, path).summary())
+        else:
+            print(f"Database {inventory_db.database_id(conn)}, journal at {last_seq(conn)}")
+            for source, seq, synced_at in sync_status(conn):
+                print(f"  from {source}: applied up to {seq} ({synced_at})")
+    finally:
+        inventory_db.close(conn)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
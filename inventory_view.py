@@ -0,0 +1,310 @@
+import contextlib
+import tkinter as tk
+from tkinter import ttk
+
+import inventory_db
+
+# Event.state bits for extending a selection
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+HEADINGS = ("ID", "Building", "Room", "Type", "Weight", "Date Refilled", "Expiration Date", "Supplier", "Notes")
+
+
+class VirtualInventoryView:
+    # A Treeview that only ever holds the rows on screen. Rows are read from an
+    # InventoryPager into a small cache (the visible window plus `prefetch` rows
+    # either side) and the scrollbar is driven by row offsets, so scrolling and
+    # redraw cost the same whether the table has a hundred rows or a million.
+
+    def __init__(self, parent, pager, prefetch=100, diagnostics=None):
+        self.pager = pager
+        self.prefetch = prefetch
+        # Optional inventory_diagnostics.Diagnostics; reading rows and drawing
+        # them are timed separately so slow SQL and slow Treeview updates can
+        # be told apart
+        self.diagnostics = diagnostics
+        self.visible = 20
+        self.top = 0
+        self.total = 0
+        self.cache = []
+        self.cache_start = 0
+        # Ids of the selected rows, including ones scrolled out of the tree
+        self.selection = set()
+
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(frame, columns=HEADINGS, show="headings", selectmode="extended")
+        for col in HEADINGS:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=100)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units", 3))
+        self.tree.bind("<Up>", lambda e: self.on_arrow(-1, e.state & SHIFT_MASK))
+        self.tree.bind("<Down>", lambda e: self.on_arrow(1, e.state & SHIFT_MASK))
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<<TreeviewSelect>>", lambda e: self.on_select())
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+
+    def column_name(self, heading):
+        return inventory_db.InventoryPager.SORTABLE[HEADINGS.index(heading)]
+
+    def sort_by(self, heading):
+        column = self.column_name(heading)
+        descending = column == self.pager.sort_column and not self.pager.descending
+        self.pager.set_sort(column, descending)
+        self.show_sort()
+        self.top = 0
+        self.refresh()
+
+    def show_sort(self):
+        # Arrow on the sorted column; none while ordered by search relevance
+        for col in HEADINGS:
+            arrow = ""
+            if not self.pager.ranked and self.column_name(col) == self.pager.sort_column:
+                arrow = " ▼" if self.pager.descending else " ▲"
+            self.tree.heading(col, text=col + arrow)
+
+    def set_filters(self, **filters):
+        self.pager.set_filters(**filters)
+        self.clear_selection()
+        self.top = 0
+        self.refresh()
+
+    def search(self, text):
+        # Narrows the view to full-text matches, best match first; clicking a
+        # heading still sorts the matches by that column
+        self.pager.set_search(text)
+        if self.pager.search:
+            self.pager.set_sort(self.pager.RANK)
+        self.clear_selection()
+        self.show_sort()
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        # Drop cached rows and re-read the current window, e.g. after the
+        # sort, filters or underlying data changed
+        self.pager.invalidate()
+        self.total = self.pager.count()
+        self.cache = []
+        self.cache_start = 0
+        self.show(self.top)
+
+    def window_rows(self):
+        start = self.top - self.cache_start
+        return self.cache[start:start + self.visible]
+
+    def reload(self):
+        # Re-read the window around the rows on screen, keeping them where they
+        # are; render() then only touches items whose values changed. Used to
+        # apply large batches of changes (e.g. an import) as a diff.
+        rows = self.window_rows()
+        self.pager.invalidate()
+        self.total = self.pager.count()
+        if not rows:
+            self.refresh()
+            return
+
+        anchor = self.pager.key(rows[0])
+        before = self.pager.fetch_before(anchor, self.prefetch)
+        after = self.pager.fetch_after(anchor, self.visible + self.prefetch, inclusive=True)
+        self.cache = before + after
+        self.cache_start = max(0, self.top - len(before))
+        self.show(self.cache_start + len(before))
+
+    def apply_changes(self, upserted=(), deleted=()):
+        # Patch individual rows into the cached window instead of re-reading
+        # it: changed rows are re-fetched by id and slotted in by sort key,
+        # and the first unchanged row on screen stays put.
+        if not self.cache:
+            self.refresh()
+            return
+
+        changed = set(upserted) | set(deleted)
+        anchor = next((row[0] for row in self.window_rows() if row[0] not in changed), None)
+        at_start = self.cache_start == 0
+        at_end = self.cache_start + len(self.cache) >= self.total
+        self.cache = [row for row in self.cache if row[0] not in changed]
+
+        for row in self.pager.fetch_ids(upserted):
+            index = self.position(row)
+            if index == 0 and not at_start:
+                # Sorts somewhere above the cached window
+                self.cache_start += 1
+            elif index == len(self.cache) and not at_end:
+                # Sorts somewhere below it
+                continue
+            else:
+                self.cache.insert(index, row)
+
+        self.pager.invalidate()
+        self.total = self.pager.count()
+        top = self.top
+        if anchor is not None:
+            top = self.cache_start + next(i for i, row in enumerate(self.cache) if row[0] == anchor)
+        self.show(top)
+
+    def position(self, row):
+        # Index in the cache where row belongs in the current sort order
+        key = self.pager.sort_key(row)
+        for index, cached in enumerate(self.cache):
+            cached_key = self.pager.sort_key(cached)
+            if (cached_key < key) if self.pager.descending else (cached_key > key):
+                return index
+        return len(self.cache)
+
+    def item_for(self, row_id):
+        # Tree items are keyed by row id, so the tree itself is the row-to-item
+        # map; None if the row is not on screen
+        iid = str(row_id)
+        return iid if self.tree.exists(iid) else None
+
+    def select(self, row_id):
+        self.selection = {row_id}
+        iid = self.item_for(row_id)
+        if iid:
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+            self.tree.see(iid)
+
+    def on_resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        visible = max(1, (event.height - rowheight - 5) // rowheight)
+        if visible != self.visible:
+            self.visible = visible
+            self.show(self.top)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.show(int(float(amount) * self.total))
+        else:
+            self.scroll(int(amount), unit)
+
+    def scroll(self, amount, unit, lines=1):
+        step = self.visible if unit == "pages" else lines
+        self.show(self.top + amount * step)
+        return "break"
+
+    def on_click(self, event):
+        # A plain click starts a new selection; Ctrl and Shift extend it, so
+        # rows selected further up or down stay selected
+        if not event.state & (SHIFT_MASK | CONTROL_MASK) and self.tree.identify_region(event.x, event.y) in ("cell", "tree"):
+            self.selection.clear()
+
+    def on_select(self):
+        # Rows in the tree follow its selection; scrolled-out rows are kept
+        on_screen = set(self.tree.get_children())
+        self.selection = {row_id for row_id in self.selection if str(row_id) not in on_screen}
+        self.selection.update(int(iid) for iid in self.tree.selection())
+
+    def clear_selection(self):
+        self.selection.clear()
+        self.tree.selection_set(())
+
+    def on_arrow(self, direction, extend=False):
+        # Moving the selection off the top or bottom row scrolls by one
+        if not extend:
+            self.selection.clear()
+        items = self.tree.get_children()
+        focus = self.tree.focus()
+        if not items or focus not in items:
+            return None
+        index = items.index(focus) + direction
+        if 0 <= index < len(items):
+            return None
+        self.show(self.top + direction)
+        items = self.tree.get_children()
+        if items:
+            target = items[0] if direction < 0 else items[-1]
+            self.tree.focus(target)
+            if extend:
+                self.tree.selection_add(target)
+            else:
+                self.tree.selection_set(target)
+        return "break"
+
+    def measure(self, name):
+        if self.diagnostics is None:
+            return contextlib.nullcontext({"rows": None})
+        return self.diagnostics.operation(name)
+
+    def show(self, top):
+        self.top = max(0, min(top, self.total - self.visible))
+        with self.measure("View: read rows") as op:
+            self.load_window()
+            op["rows"] = len(self.cache)
+        start = self.top - self.cache_start
+        with self.measure("View: draw rows") as op:
+            rows = self.cache[start:start + self.visible]
+            self.render(rows)
+            op["rows"] = len(rows)
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min(1.0, (self.top + self.visible) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def load_window(self):
+        # Make sure cache covers [top, top + visible), extending it by key from
+        # whichever end is nearest, or re-anchoring it for long jumps
+        want_start, want_end = self.top, min(self.top + self.visible, self.total)
+        cache_end = self.cache_start + len(self.cache)
+        if self.cache and self.cache_start <= want_start and want_end <= cache_end:
+            return
+
+        limit = self.visible + self.prefetch
+        if self.cache and cache_end <= want_end < cache_end + limit:
+            rows = self.pager.fetch_after(self.pager.key(self.cache[-1]), want_end - cache_end + self.prefetch)
+            self.cache.extend(rows)
+        elif self.cache and self.cache_start - limit < want_start < self.cache_start:
+            rows = self.pager.fetch_before(self.pager.key(self.cache[0]), self.cache_start - want_start + self.prefetch)
+            self.cache[:0] = rows
+            self.cache_start -= len(rows)
+        else:
+            self.cache_start = max(0, want_start - self.prefetch)
+            self.cache = self.pager.fetch_at(self.cache_start, want_end - self.cache_start + self.prefetch)
+
+        # Keep at most a couple of prefetch margins around the window
+        excess = (want_start - self.cache_start) - 2 * self.prefetch
+        if excess > 0:
+            del self.cache[:excess]
+            self.cache_start += excess
+        keep = (want_end - self.cache_start) + 2 * self.prefetch
+        del self.cache[keep:]
+
+    def render(self, rows):
+        # Reconcile the tree with the window by row id, so an unchanged row is
+        # never recreated and its selection survives scrolling
+        wanted = [str(row[0]) for row in rows]
+        wanted_set = set(wanted)
+        existing = self.tree.get_children()
+        stale = [iid for iid in existing if iid not in wanted_set]
+        if stale:
+            self.tree.delete(*stale)
+        existing_set = set(existing)
+        for index, (iid, row) in enumerate(zip(wanted, rows)):
+            values = ["" if value is None else value for value in row]
+            if iid in existing_set:
+                if list(self.tree.item(iid, "values")) != [str(value) for value in values]:
+                    self.tree.item(iid, values=values)
+                self.tree.move(iid, "", index)
+            else:
+                self.tree.insert("", index, iid=iid, values=values)
+        # Rows selected before they were scrolled away are selected again
+        reselect = [iid for iid in wanted if int(iid) in self.selection]
+        if reselect:
+            self.tree.selection_add(*reselect)
+
+    def selected_ids(self):
+        self.on_select()
+        return sorted(self.selection)
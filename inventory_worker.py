@@ -0,0 +1,168 @@
+import queue
+import sqlite3
+import sys
+import threading
+
+import inventory_db
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # A unit of work for the DatabaseWorker. func(conn, job, *args) runs on the
+    # worker thread with the worker's own connection; the callbacks run on the
+    # Tk thread.
+
+    def __init__(self, worker, func, args, description, on_done, on_error, on_progress):
+        self.worker = worker
+        self.func = func
+        self.args = args
+        self.description = description
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        # Rows the job read or wrote, if it knows; shown in diagnostics
+        self.rows = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        # Called by job functions between steps
+        if self.cancelled:
+            raise JobCancelled(self.description)
+
+    def report(self, fraction=None, message=None, data=None):
+        # Progress for the UI: a fraction in 0..1 and/or a status message,
+        # plus optional partial results (e.g. report text) for on_progress
+        self.worker.results.put(("progress", self, (fraction, message, data)))
+
+
+class DatabaseWorker:
+    # A dedicated thread with its own SQLite connection that runs long
+    # operations (reports, imports, exports) off the Tk main loop. Jobs are
+    # taken from a queue one at a time; their progress and results come back
+    # through a second queue that the Tk thread drains with master.after.
+
+    def __init__(self, master, db_path, poll_interval=50, connect=inventory_db.connect):
+        self.master = master
+        self.db_path = db_path
+        # Opens the worker's connection, e.g. an instrumented one
+        self.connect = connect
+        self.poll_interval = poll_interval
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.current = None
+        # Submitted and not yet finished, in submission order
+        self.active = []
+        self.on_idle = None
+
+        self.thread = threading.Thread(target=self._run, name="inventory-db-worker", daemon=True)
+        self.thread.start()
+        self._poll_id = self.master.after(self.poll_interval, self._poll)
+
+    def submit(self, func, *args, description="", on_done=None, on_error=None, on_progress=None):
+        job = Job(self, func, args, description, on_done, on_error, on_progress)
+        self.active.append(job)
+        self.jobs.put(job)
+        return job
+
+    def cancel_all(self):
+        # Jobs still waiting in the queue are cancelled before they start
+        for job in self.active:
+            job.cancel()
+
+    @property
+    def busy(self):
+        return bool(self.active)
+
+    def stop(self):
+        self.cancel_all()
+        self.jobs.put(None)
+        self.master.after_cancel(self._poll_id)
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        try:
+            conn = self.connect(self.db_path)
+        except Exception as e:
+            # Every job fails with the reason instead of waiting forever
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                self.results.put(("error", job, e))
+        # connect may return something other than a connection, e.g. the
+        # desktop app's InventoryClient in client mode; jobs get it as their
+        # conn and are then cancelled only between their own steps
+        database = isinstance(conn, sqlite3.Connection)
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self.results.put(("start", job, None))
+            # Lets a cancel interrupt a long-running statement, not just the
+            # gaps between statements
+            if database:
+                conn.set_progress_handler(lambda: 1 if job.cancelled else 0, 10000)
+            try:
+                job.check()
+                result = job.func(conn, job, *job.args)
+                self.results.put(("done", job, result))
+            except sqlite3.OperationalError as e:
+                if database and conn.in_transaction:
+                    conn.rollback()
+                if job.cancelled:
+                    self.results.put(("error", job, JobCancelled(job.description)))
+                else:
+                    self.results.put(("error", job, e))
+            except Exception as e:
+                if database and conn.in_transaction:
+                    conn.rollback()
+                self.results.put(("error", job, e))
+            finally:
+                if database:
+                    conn.set_progress_handler(None, 0)
+        if database:
+            inventory_db.close(conn)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    kind, job, payload = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._deliver(kind, job, payload)
+                except Exception:
+                    # A failing UI callback is reported like any other Tk
+                    # callback error; the results after it are still delivered
+                    self.master.report_callback_exception(*sys.exc_info())
+        finally:
+            self._poll_id = self.master.after(self.poll_interval, self._poll)
+
+    def _deliver(self, kind, job, payload):
+        if kind == "start":
+            self.current = job
+        elif kind == "progress":
+            if job.on_progress:
+                job.on_progress(job, *payload)
+        else:
+            # The job is finished whatever its callbacks do
+            self.current = None
+            self.active.remove(job)
+            try:
+                callback = job.on_done if kind == "done" else job.on_error
+                if callback:
+                    callback(payload)
+            finally:
+                if not self.busy and self.on_idle:
+                    self.on_idle()
@@ -0,0 +1,199 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+import inventory_db
+
+
+def make_inventory(count=10):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    for n in range(count):
+        inventory_db.insert_extinguisher(conn, ("EDS", f"10{n}", "ABC", 5, "2025-01-15", "2026-01-15", "Acme", ""))
+    return conn
+
+
+def all_rows(conn):
+    return conn.execute("SELECT * FROM extinguishers ORDER BY id").fetchall()
+
+
+def undo(conn, stack):
+    # As the app does: undo the latest change, then let the earlier ones
+    # skip the journal entries it and its undo wrote
+    undone = inventory_db.undo_bulk_change(conn, stack.pop())
+    for earlier in stack:
+        earlier.undone.extend(undone)
+
+
+def test_undo_overlapping_bulk_changes_in_turn():
+    conn = make_inventory()
+    original = all_rows(conn)
+    ids = [row[0] for row in original]
+    stack = [inventory_db.bulk_update(conn, ids, {"supplier": "Brooks"}),
+             inventory_db.bulk_update(conn, ids[4:], {"supplier": "Cole", "weight": 10})]
+    after_edits = all_rows(conn)
+    stack.append(inventory_db.bulk_delete(conn, ids[7:]))
+    stack.append(inventory_db.bulk_update(conn, ids[:8], {"room": "200"}))
+
+    undo(conn, stack)
+    undo(conn, stack)
+    assert all_rows(conn) == after_edits
+    undo(conn, stack)
+    undo(conn, stack)
+    assert all_rows(conn) == original
+
+
+def test_undo_refused_after_a_later_edit():
+    conn = make_inventory()
+    ids = [row[0] for row in all_rows(conn)]
+    stack = [inventory_db.bulk_update(conn, ids, {"supplier": "Brooks"}),
+             inventory_db.bulk_update(conn, ids[:5], {"supplier": "Cole"})]
+    # Outside the second change's rows, so only the first is refused
+    inventory_db.update_extinguisher(conn, ids[7], ("EDS", "300", "ABC", 5, "2025-01-15", "2026-01-15", "Brooks", ""))
+    undo(conn, stack)
+    with pytest.raises(ValueError, match="1 of its rows have changed since"):
+        undo(conn, stack)
+
+
+def test_dates_are_stored_normalized():
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    row_id = inventory_db.insert_extinguisher(conn, ("EDS", "101", "Red", "5", "03/15/2025", "Mar 15, 2026", "", ""))
+    assert conn.execute("SELECT weight, date_refilled, date_expiration FROM extinguishers WHERE id = ?",
+                        (row_id,)).fetchone() == (5.0, "2025-03-15", "2026-03-15")
+    with pytest.raises(ValueError, match="Unrecognized date"):
+        inventory_db.insert_extinguisher(conn, ("EDS", "102", "Red", 5, "someday", "", "", ""))
+
+
+def test_expiring_buckets_are_date_ranges():
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    for room, building, expiration in (("1", "EDS", "2025-12-31"), ("2", "EDS", "2026-01-01"), ("3", "BRS", "2026-01-31"),
+                                       ("4", "EDS", "2026-02-01"), ("5", "EDS", "")):
+        inventory_db.insert_extinguisher(conn, (building, room, "Red", 5, "", expiration, "", ""))
+    today = date(2026, 1, 1)
+
+    found = inventory_db.expiring_extinguishers(conn, 30, today=today)
+    assert {bucket: [row[2] for row in rows] for bucket, rows in found.items()} == {"overdue": ["1"], "upcoming": ["2", "3"]}
+    found = inventory_db.expiring_extinguishers(conn, 30, "EDS", today, include_overdue=False)
+    assert [row[2] for row in found["upcoming"]] == ["2"]
+    counts = inventory_db.expiring_counts(conn, 30, today)
+    assert {bucket: sorted(rows) for bucket, rows in counts.items()} == {"overdue": [("EDS", 1)], "upcoming": [("BRS", 1), ("EDS", 1)]}
+
+
+def test_legacy_dates_are_normalized_by_the_migration(tmp_path):
+    # A database from before schema versions: free-form dates, no indexes
+    path = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(path)
+    legacy.execute('''
+        CREATE TABLE extinguishers (id INTEGER PRIMARY KEY, building TEXT, room TEXT, type TEXT, weight REAL,
+                                    date_refilled TEXT, date_expiration TEXT, supplier TEXT, notes TEXT)
+    ''')
+    legacy.executemany("INSERT INTO extinguishers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (1, "EDS", "101", "Red", 5, "03/15/2025", "03/15/2026", "Acme", "near stairwell"),
+        (2, "Annex", "102", "Gray", 10, "someday", "", "", ""),
+    ])
+    legacy.commit()
+    legacy.close()
+
+    conn = inventory_db.connect(path)
+    assert inventory_db.schema_version(conn) == inventory_db.SCHEMA_VERSION
+    # Unparseable dates are kept rather than lost; blank ones become NULL
+    assert conn.execute("SELECT id, date_refilled, date_expiration FROM extinguishers ORDER BY id").fetchall() == [
+        (1, "2025-03-15", "2026-03-15"), (2, "someday", None)]
+    assert [row[0] for row in inventory_db.expiring_extinguishers(conn, 30, today=date(2026, 3, 1))["upcoming"]] == [1]
+    inventory_db.close(conn)
+
+
+def cube_rows(conn, table):
+    return sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+
+
+def assert_cubes_current(conn):
+    # Each trigger-maintained cube matches a rebuild from the records
+    for table in ("tally_cube", "forecast_cube"):
+        kept = cube_rows(conn, table)
+        conn.execute("SAVEPOINT rebuild")
+        getattr(inventory_db, f"rebuild_{table}")(conn.cursor())
+        rebuilt = cube_rows(conn, table)
+        conn.execute("ROLLBACK TO rebuild")
+        conn.execute("RELEASE rebuild")
+        assert kept == rebuilt, table
+
+
+def test_cubes_follow_every_kind_of_write():
+    conn = make_inventory()
+    inventory_db.insert_extinguisher(conn, ("BRS", "201", "Gray", 10, "2025-06-01", "2025-12-01", "Brooks", ""))
+    inventory_db.insert_extinguisher(conn, ("Annex", "1", "Halon", "", "", "", "", ""))
+    assert_cubes_current(conn)
+
+    ids = [row[0] for row in all_rows(conn)]
+    inventory_db.update_extinguisher(conn, ids[0], ("MB", "300", "Green", 20, "2025-02-01", "2027-02-01", "Cole", ""))
+    inventory_db.delete_extinguisher(conn, ids[1])
+    assert_cubes_current(conn)
+
+    stack = [inventory_db.bulk_update(conn, ids[2:], {"building": "SB", "date_expiration": "2026-06-30"}),
+             inventory_db.bulk_delete(conn, ids[5:8])]
+    assert_cubes_current(conn)
+    undo(conn, stack)
+    undo(conn, stack)
+    assert_cubes_current(conn)
+
+    # Writes through the view's INSTEAD OF triggers
+    conn.execute("INSERT INTO extinguishers (building, room, type, weight) VALUES ('PE', '9', 'Red', 5)")
+    conn.execute("UPDATE extinguishers SET supplier = 'Acme', weight = 50 WHERE building = 'SB'")
+    conn.execute("DELETE FROM extinguishers WHERE building = 'Annex'")
+    conn.commit()
+    assert_cubes_current(conn)
+
+    # And the tally read from the cube matches counting the view
+    counted = conn.execute("SELECT building, type, COUNT(*) FROM extinguishers GROUP BY 1, 2").fetchall()
+    assert sorted(inventory_db.tally(conn, ["Building", "Type"])[("Building", "Type")]) == sorted(counted)
+
+
+def found(conn, text):
+    return [row[0] for row in inventory_db.search_extinguishers(conn, text)]
+
+
+def test_search_index_follows_writes():
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    first = inventory_db.insert_extinguisher(conn, ("EDS", "101", "Red", 5, "", "", "Acme", "near the stairwell"))
+    second = inventory_db.insert_extinguisher(conn, ("BRS", "202", "Gray", 10, "", "", "Brooks", "Café kitchen"))
+    assert found(conn, "stair") == [first]
+    assert found(conn, "cafe") == [second]
+    assert found(conn, "acme 101") == [first]
+    assert found(conn, "  ") == []
+
+    inventory_db.update_extinguisher(conn, first, ("EDS", "101", "Red", 5, "", "", "Acme", "by the lift"))
+    assert found(conn, "stair") == []
+    assert found(conn, "lift") == [first]
+    inventory_db.delete_extinguisher(conn, second)
+    assert found(conn, "kitchen") == []
+
+    # Writes through the view reach the index too
+    conn.execute("INSERT INTO extinguishers (building, room, supplier) VALUES ('MB', '303', 'Cole')")
+    conn.execute("UPDATE extinguishers SET building = 'SB' WHERE room = '303'")
+    conn.commit()
+    assert [row[1] for row in inventory_db.search_extinguishers(conn, "SB 303")] == ["SB"]
+    assert found(conn, "MB") == []
+    # Raises if the index disagrees with the rows it was built from
+    conn.execute("INSERT INTO extinguishers_fts (extinguishers_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_names_are_stored_once_and_offered_while_in_use():
+    conn = make_inventory(3)
+    custom = inventory_db.insert_extinguisher(conn, ("Annex", "1", "Halon", 7.5, "", "", "Acme", ""))
+    assert conn.execute("SELECT COUNT(*) FROM suppliers WHERE name = 'Acme'").fetchone()[0] == 1
+    assert len(set(conn.execute(f"SELECT supplier_id FROM {inventory_db.RECORDS}"))) == 1
+
+    lookups = inventory_db.LookupCache(conn)
+    assert lookups.values("building") == inventory_db.BUILDINGS + ["Annex"]
+    assert lookups.values("type")[-1] == "Halon"
+    assert lookups.values("weight") == inventory_db.WEIGHTS + [7.5]
+    assert lookups.values("supplier") == ["Acme"]
+
+    # The cache notices the write; the name stays in the table but is not offered
+    inventory_db.delete_extinguisher(conn, custom)
+    assert lookups.values("building") == inventory_db.BUILDINGS
+    assert "Halon" not in lookups.values("type")
+    assert conn.execute("SELECT COUNT(*) FROM buildings WHERE name = 'Annex'").fetchone()[0] == 1
+    # Views decode the stored ids back to the names
+    assert {row[0] for row in conn.execute("SELECT building FROM extinguishers")} == {"EDS"}
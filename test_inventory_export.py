@@ -0,0 +1,81 @@
+import csv
+import gzip
+import os
+from datetime import date
+
+import pytest
+
+import inventory_db
+import inventory_export
+import inventory_import
+
+
+def make_inventory():
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    for n, expiration in enumerate(("2025-12-01", "2026-01-10", "2026-03-01", None)):
+        inventory_db.insert_extinguisher(conn, ("EDS" if n % 2 else "BRS", f"{n}", "Red", 5 * (n + 1), "2025-01-15",
+                                                expiration, "Acme", f"note, \"{n}\""))
+    return conn
+
+
+def all_rows(conn):
+    return conn.execute("SELECT * FROM extinguishers ORDER BY id").fetchall()
+
+
+@pytest.mark.parametrize("name", ["units.csv", "units.csv.gz"])
+def test_csv_export_round_trips_through_the_import(tmp_path, name):
+    conn, path = make_inventory(), str(tmp_path / name)
+    progress = []
+    assert inventory_export.export(conn, path, progress=lambda written, total: progress.append((written, total))) == 4
+    assert progress == [(4, 4)]
+
+    # The importer reads plain CSV, so a compressed export is unpacked first
+    if name.endswith(".gz"):
+        with gzip.open(path, "rb") as packed, open(str(tmp_path / "units.csv"), "wb") as plain:
+            plain.write(packed.read())
+        path = str(tmp_path / "units.csv")
+    copy = inventory_db.connect(inventory_db.MEMORY)
+    assert inventory_import.import_csv(copy, path).inserted == 4
+    assert all_rows(copy) == all_rows(conn)
+
+
+def test_expiring_export_uses_the_report_ranges(tmp_path):
+    conn, path = make_inventory(), str(tmp_path / "expiring.csv")
+    today = date(2026, 1, 1)
+    assert inventory_export.export(conn, path, columns=["room", "date_expiration"], expiring_within=30, today=today) == 1
+    assert inventory_export.export(conn, path, columns=["room", "date_expiration"], expiring_within=30,
+                                   include_overdue=True, today=today) == 2
+    with open(path, newline="", encoding="utf-8") as file:
+        assert list(csv.reader(file)) == [["Room", "Expiration Date"], ["0", "2025-12-01"], ["1", "2026-01-10"]]
+
+
+@pytest.mark.parametrize("name", ["units.parquet", "units.arrow"])
+def test_columnar_export_keeps_the_column_types(tmp_path, name):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    conn, path = make_inventory(), str(tmp_path / name)
+    assert inventory_export.export(conn, path, building="EDS") == 2
+    if name.endswith(".parquet"):
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pyarrow.ipc.open_file(path).read_all()
+    assert table.schema == inventory_export.arrow_schema(inventory_export.EXPORT_COLUMNS)
+    assert table.column("date_expiration").to_pylist() == [date(2026, 1, 10), None]
+    assert table.column("weight").to_pylist() == [10.0, 20.0]
+
+
+def test_failed_export_leaves_no_file(tmp_path):
+    conn, path = make_inventory(), str(tmp_path / "units.csv")
+
+    def cancel(written, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        inventory_export.export(conn, path, progress=cancel)
+    assert not os.path.exists(path)
+    with pytest.raises(ValueError, match="Cannot export column"):
+        inventory_export.export(conn, path, columns=["room", "password"])
+    with pytest.raises(ValueError, match="Unknown export format"):
+        inventory_export.export(conn, path, fmt="xlsx")
@@ -0,0 +1,24 @@
+from datetime import date
+
+import pytest
+
+import inventory_db
+import inventory_forecast
+
+pytest.importorskip("pandas")
+
+
+def test_unparseable_refill_date_gets_the_default_cycle():
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    for refilled in ("2025-07-15", "2025-01-15"):
+        inventory_db.insert_extinguisher(conn, ("EDS", "101", "Red", 5, refilled, "2026-01-15", "Acme", ""))
+    # As a migrated row can still hold it, bypassing normalize_date()
+    conn.execute(f"UPDATE {inventory_db.RECORDS} SET date_refilled = 'unknown' WHERE id = 2")
+    conn.commit()
+
+    frame = inventory_forecast.load_frame(conn).sort_values("cycle")
+    assert frame["cycle"].tolist() == [6, inventory_forecast.DEFAULT_CYCLE_MONTHS]
+
+    result = inventory_forecast.forecast(inventory_forecast.load_frame(conn), 24, date(2026, 1, 1))
+    # Six-monthly: Jan, Jul, Jan, Jul; yearly: Jan, Jan
+    assert result.workload["Units"].sum() == 6
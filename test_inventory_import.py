@@ -0,0 +1,84 @@
+import csv
+
+import pytest
+
+import inventory_db
+import inventory_import
+from test_inventory_db import assert_cubes_current
+
+
+def write_csv(path, rows, header=inventory_db.COLUMNS):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def units(count, start=0, supplier="Acme"):
+    return [("EDS", f"{n}", "Red", 5, "2025-01-15", "2026-01-15", supplier, "") for n in range(start, start + count)]
+
+
+def schema_objects(conn):
+    return conn.execute('''
+        SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? ORDER BY name
+    ''', (inventory_db.RECORDS,)).fetchall()
+
+
+def test_first_import_restores_what_it_deferred(tmp_path):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    objects = schema_objects(conn)
+    stats = inventory_import.import_csv(conn, write_csv(tmp_path / "units.csv", units(35)), batch_size=10)
+
+    assert (stats.inserted, stats.rejected) == (35, 0)
+    assert not conn.in_transaction
+    assert schema_objects(conn) == objects
+    assert_cubes_current(conn)
+    conn.execute("INSERT INTO extinguishers_fts (extinguishers_fts, rank) VALUES ('integrity-check', 1)")
+    assert conn.execute("SELECT op, COUNT(*) FROM change_journal GROUP BY op").fetchall() == [("insert", 35)]
+
+
+def test_import_upserts_on_the_natural_key(tmp_path):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    inventory_import.import_csv(conn, write_csv(tmp_path / "first.csv", units(4)))
+
+    # Our own export's headings, in another order, with an ID column to ignore
+    header = ["ID", "Room", "Building", "Type", "Weight", "Date Refilled", "Expiration Date", "Supplier", "Notes"]
+    rows = [[0, room, building, kind, weight, refilled, "01/15/2026", supplier, notes]
+            for building, room, kind, weight, refilled, _, supplier, notes in units(4, supplier="Brooks")[:2] + units(5)[2:]]
+    rows += [[0, "2", "EDS", "Red", 5, "", "", "Cole", "last one wins"],
+             [0, "9", "EDS", "", 5, "", "", "", ""],
+             [0, "10", "EDS", "Red", "heavy", "", "", "", ""]]
+    path = write_csv(tmp_path / "second.csv", rows, header)
+    stats = inventory_import.import_csv(conn, path, quarantine_path=str(tmp_path / "bad.csv"))
+
+    assert (stats.inserted, stats.updated, stats.unchanged, stats.duplicates, stats.rejected) == (1, 3, 1, 1, 2)
+    assert conn.execute("SELECT supplier, notes FROM extinguishers WHERE room = '2'").fetchone() == ("Cole", "last one wins")
+    with open(stats.quarantine_path, newline="", encoding="utf-8") as file:
+        assert [(row[0], row[1]) for row in csv.reader(file)][1:] == [("8", "type is required"),
+                                                                    ("9", "invalid weight 'heavy'")]
+    assert_cubes_current(conn)
+
+
+def test_interrupted_first_import_keeps_the_finished_batches(tmp_path):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    objects = schema_objects(conn)
+
+    def progress(stats):
+        if stats.rows_read >= 30:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        inventory_import.import_csv(conn, write_csv(tmp_path / "units.csv", units(55)), batch_size=10, progress=progress)
+    assert conn.execute("SELECT COUNT(*) FROM extinguishers").fetchone()[0] == 30
+    assert schema_objects(conn) == objects
+    assert_cubes_current(conn)
+    assert not conn.in_transaction
+
+
+def test_progress_can_stop_an_import(tmp_path):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    stats = inventory_import.import_csv(conn, write_csv(tmp_path / "units.csv", units(25)), batch_size=10,
+                                        progress=lambda stats: False)
+    assert stats.stopped
+    assert conn.execute("SELECT COUNT(*) FROM extinguishers").fetchone()[0] == 10
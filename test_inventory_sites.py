@@ -0,0 +1,65 @@
+import csv
+import os
+from datetime import date
+
+import inventory_db
+import inventory_sites
+
+TODAY = date(2026, 1, 1)
+CATEGORIES = list(inventory_db.TALLY_COLUMNS)
+
+
+def records(building, count):
+    return [(building, f"{n}", ("Red", "Green", "Gray")[n % 3], (5, 10, 20)[n % 3 == 0], "2025-01-15",
+             f"2026-0{1 + n % 3}-10", ("Acme", "Brooks")[n % 2], "") for n in range(count)]
+
+
+def make_database(path, rows):
+    conn = inventory_db.connect(path)
+    for record in rows:
+        inventory_db.insert_extinguisher(conn, record)
+    inventory_db.close(conn)
+
+
+def make_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(inventory_db.COLUMNS)
+        writer.writerows(rows)
+        # No type, so rejected on import
+        writer.writerow(["BRS", "9", "", "5", "", "", "", ""])
+
+
+def test_collect_merges_database_and_csv_sites(tmp_path):
+    eds, brs = records("EDS", 30), records("BRS", 20)
+    make_database(str(tmp_path / "eds.db"), eds)
+    make_csv(str(tmp_path / "brs.csv"), brs)
+    reference = inventory_db.connect(inventory_db.MEMORY)
+    for record in eds + brs:
+        inventory_db.insert_extinguisher(reference, record)
+
+    sites = [inventory_sites.parse_site(str(tmp_path / name)) for name in ("eds.db", "brs.csv")]
+    partials = inventory_sites.collect(sites, today=TODAY, workers=1)
+
+    assert [(p.name, p.units, p.rejected) for p in partials] == [("eds", 30, 0), ("brs", 20, 1)]
+    merged = inventory_db.tally_rows([row for p in partials for row in p.tally_rows], CATEGORIES)
+    assert merged == inventory_db.tally(reference, CATEGORIES)
+    expected = inventory_db.expiring_counts(reference, today=TODAY)
+    for bucket in inventory_db.EXPIRY_BUCKETS:
+        assert sum(p.expiring_total(bucket) for p in partials) == sum(count for _, count in expected[bucket])
+    # Nothing is written beside the inputs
+    assert not os.path.exists(tmp_path / "brs.rejected.csv")
+
+
+def test_main_reads_database_sites_in_worker_processes(tmp_path):
+    make_database(str(tmp_path / "eds.db"), records("EDS", 10))
+    make_csv(str(tmp_path / "brs.csv"), records("BRS", 5))
+    before = (tmp_path / "eds.db").read_bytes()
+    output = tmp_path / "out.txt"
+
+    inventory_sites.main([str(output), str(tmp_path / "eds.db"), str(tmp_path / "brs.csv"),
+                          "--workers", "2", "--no-forecast", "--rejected-dir", str(tmp_path / "rejected")])
+
+    assert "2 sites, 15 units (1 CSV rows rejected on import)" in output.read_text(encoding="utf-8")
+    assert (tmp_path / "eds.db").read_bytes() == before
+    assert os.path.exists(tmp_path / "rejected" / "brs.rejected.csv")
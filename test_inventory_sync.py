@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import inventory_db
+import inventory_sync
+
+
+def make_inventory(count=10):
+    conn = inventory_db.connect(inventory_db.MEMORY)
+    for n in range(count):
+        inventory_db.insert_extinguisher(conn, ("EDS", f"10{n}", "Red", 5, "2025-01-15", "2026-01-15", "Acme", ""))
+    return conn
+
+
+def contents(conn):
+    # Rows without their ids, which differ between source and replica
+    return sorted(row[1:] for row in conn.execute("SELECT * FROM extinguishers"))
+
+
+def test_delta_round_trip_and_reapply(tmp_path):
+    source, replica = make_inventory(), inventory_db.connect(inventory_db.MEMORY)
+    path = str(tmp_path / "full.jsonl.gz")
+    count, until = inventory_sync.export_delta(source, path)
+    assert count == 10 and until == inventory_sync.last_seq(source)
+
+    stats = inventory_sync.import_delta(replica, path)
+    assert (stats.inserted, stats.skipped) == (10, 0)
+    assert contents(replica) == contents(source)
+
+    stats = inventory_sync.import_delta(replica, path)
+    assert (stats.inserted, stats.updated, stats.skipped) == (0, 0, 10)
+    assert contents(replica) == contents(source)
+
+
+def test_delta_carries_updates_and_deletes(tmp_path):
+    source, replica = make_inventory(), inventory_db.connect(inventory_db.MEMORY)
+    _, watermark = inventory_sync.export_delta(source, str(tmp_path / "1.jsonl"))
+    inventory_sync.import_delta(replica, str(tmp_path / "1.jsonl"))
+
+    ids = [row[0] for row in source.execute("SELECT id FROM extinguishers ORDER BY id")]
+    inventory_db.update_extinguisher(source, ids[0], ("BRS", "200", "Gray", 10, "2025-02-01", "2026-02-01", "Brooks", "moved"))
+    inventory_db.delete_extinguisher(source, ids[1])
+    inventory_db.insert_extinguisher(source, ("MB", "300", "Green", 20, "", "", "", ""))
+    count, _ = inventory_sync.export_delta(source, str(tmp_path / "2.jsonl"), watermark)
+
+    stats = inventory_sync.import_delta(replica, str(tmp_path / "2.jsonl"))
+    assert count == 3
+    assert (stats.inserted, stats.updated, stats.deleted) == (1, 1, 1)
+    assert contents(replica) == contents(source)
+
+
+def test_delta_after_a_gap_is_refused(tmp_path):
+    source, replica = make_inventory(), inventory_db.connect(inventory_db.MEMORY)
+    _, watermark = inventory_sync.export_delta(source, str(tmp_path / "1.jsonl"))
+    inventory_db.delete_extinguisher(source, 1)
+    inventory_sync.export_delta(source, str(tmp_path / "2.jsonl"), watermark)
+
+    with pytest.raises(ValueError, match="Delta starts after change"):
+        inventory_sync.import_delta(replica, str(tmp_path / "2.jsonl"))
+    assert contents(replica) == []
+
+
+def test_delta_into_a_locked_database_reports_the_lock(tmp_path):
+    source = make_inventory()
+    inventory_sync.export_delta(source, str(tmp_path / "1.jsonl"))
+    path = str(tmp_path / "replica.db")
+    writer = inventory_db.connect(path)
+    replica = inventory_db.connect(path, pragmas={"busy_timeout": 0})
+    writer.execute("BEGIN IMMEDIATE")
+
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        inventory_sync.import_delta(replica, str(tmp_path / "1.jsonl"))
+    assert not replica.in_transaction
+    writer.rollback()
@@ -0,0 +1,80 @@
+import sqlite3
+import time
+
+import inventory_db
+import inventory_worker
+
+
+class FakeMaster:
+    # Enough of a Tk root for the worker: after() callbacks run on pump()
+    def __init__(self):
+        self.callbacks = []
+        self.errors = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+        return len(self.callbacks)
+
+    def after_cancel(self, callback_id):
+        pass
+
+    def report_callback_exception(self, kind, value, traceback):
+        self.errors.append(value)
+
+    def pump(self, until, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not until() and time.monotonic() < deadline:
+            callbacks, self.callbacks = self.callbacks, []
+            for callback in callbacks:
+                callback()
+            time.sleep(0.01)
+
+
+def count_rows(conn, job):
+    return conn.execute("SELECT COUNT(*) FROM extinguishers").fetchone()[0]
+
+
+def test_failed_connect_fails_every_job():
+    def connect(path):
+        raise OSError("no database here")
+
+    master = FakeMaster()
+    worker = inventory_worker.DatabaseWorker(master, "missing.db", connect=connect)
+    errors = []
+    for _ in range(2):
+        worker.submit(count_rows, on_done=errors.append, on_error=errors.append)
+    master.pump(lambda: not worker.busy)
+    worker.stop()
+    assert [str(error) for error in errors] == ["no database here"] * 2
+
+
+def test_raising_callback_does_not_stop_delivery():
+    master = FakeMaster()
+    path = inventory_db.shared_memory_path()
+    keep = inventory_db.connect(path)
+    worker = inventory_worker.DatabaseWorker(master, path)
+    results = []
+    worker.submit(count_rows, on_done=lambda result: 1 / 0)
+    worker.submit(count_rows, on_done=results.append)
+    master.pump(lambda: not worker.busy)
+    worker.stop()
+    keep.close()
+    assert results == [0]
+    assert [type(error) for error in master.errors] == [ZeroDivisionError]
+
+
+def test_operational_error_in_client_mode_keeps_the_worker_running():
+    class Client:
+        pass
+
+    def locked(client, job):
+        raise sqlite3.OperationalError("database is locked")
+
+    master = FakeMaster()
+    worker = inventory_worker.DatabaseWorker(master, None, connect=lambda path: Client())
+    outcomes = []
+    worker.submit(locked, on_done=outcomes.append, on_error=outcomes.append)
+    worker.submit(lambda client, job: "still running", on_done=outcomes.append)
+    master.pump(lambda: not worker.busy)
+    worker.stop()
+    assert [str(outcome) for outcome in outcomes] == ["database is locked", "still running"]